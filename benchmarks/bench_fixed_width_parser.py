@@ -0,0 +1,65 @@
+"""Throughput benchmark for fixed width parsing on a wide spec
+
+    $ python -m benchmarks.bench_fixed_width_parser --columns 60 --rows 200000
+    $ python -m benchmarks.bench_fixed_width_parser --engine numpy --numeric 0.9
+"""
+import argparse
+import io
+import os
+import tempfile
+import time
+
+from benchmarks.datagen import build_spec, build_lines
+from file_loader.parsers.fixed_width_parser import FixedWidthParser
+from file_loader.parsers.numpy_parser import NumpyFixedWidthParser
+
+ENGINES = {
+    'python': FixedWidthParser,
+    'numpy': NumpyFixedWidthParser
+}
+
+
+def time_python(parser, lines: list) -> float:
+    parse = parser.parse
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return time.perf_counter() - start
+
+
+def time_numpy(parser, lines: list) -> float:
+    data = io.BytesIO(''.join(lines).encode())
+    start = time.perf_counter()
+    for _ in parser.iter_column_batches(data, 100000):
+        pass
+    return time.perf_counter() - start
+
+
+def run(num_columns: int, num_rows: int, repeat: int, engine: str = 'python',
+        numeric: float = 2 / 3) -> float:
+    """time parsing num_rows lines and return the best lines/sec of `repeat` runs"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spec_path = os.path.join(tmp_dir, 'bench.csv')
+        columns = build_spec(spec_path, num_columns, numeric=numeric)
+        parser = ENGINES[engine](spec_path)
+
+    lines = build_lines(columns, num_rows)
+
+    timer = time_numpy if engine == 'numpy' else time_python
+    best = min(timer(parser, lines) for _ in range(repeat))
+    return num_rows / best
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--columns', type=int, default=60)
+    arg_parser.add_argument('--rows', type=int, default=200000)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--engine', choices=ENGINES.keys(), default='python')
+    arg_parser.add_argument('--numeric', type=float, default=2 / 3,
+                            help='share of INTEGER/BOOLEAN columns in the generated spec')
+    args = arg_parser.parse_args()
+
+    lines_per_sec = run(args.columns, args.rows, args.repeat, args.engine, args.numeric)
+    print('engine=%s columns=%s rows=%s lines/sec=%.0f' % (
+        args.engine, args.columns, args.rows, lines_per_sec))
@@ -0,0 +1,54 @@
+"""Rows/sec of the sqlite insert paths
+
+Compares the default insert_rows path (list of dicts through sqlalchemy's executemany)
+with the bulk insert_values path, with and without the load time pragmas
+
+    $ python -m benchmarks.bench_sqlite_insert --rows 200000 --batch-size 10000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.datagen import build_value_rows
+from config import SQLITE_LOAD_PRAGMAS
+from file_loader.backends.connections import registry
+from file_loader.backends.sqlite import SqlLiteBackend
+
+COLUMNS = [('col_%s' % ix, width, data_type)
+           for ix, (width, data_type) in enumerate([(8, 'TEXT'), (7, 'INTEGER'), (1, 'BOOLEAN')] * 4)]
+FIELDS = [(name, data_type) for name, _, data_type in COLUMNS]
+
+
+def run(mode: str, values: list, batch_size: int) -> float:
+    """load the values into a fresh database and return rows/sec"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        backend = SqlLiteBackend('sqlite:///%s' % os.path.join(tmp_dir, 'bench.db'))
+        backend.init_backend('bench', FIELDS)
+        names = [name for name, _ in FIELDS]
+
+        start = time.perf_counter()
+        if mode == 'pragmas':
+            backend.begin_load(SQLITE_LOAD_PRAGMAS)
+        for ix in range(0, len(values), batch_size):
+            batch = values[ix:ix + batch_size]
+            if mode == 'rows':
+                backend.insert_rows([dict(zip(names, row)) for row in batch], backend.table)
+            else:
+                backend.insert_values(batch, backend.table)
+        if mode == 'pragmas':
+            backend.end_load()
+        elapsed = time.perf_counter() - start
+        registry.dispose()
+    return len(values) / elapsed
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--rows', type=int, default=200000)
+    arg_parser.add_argument('--batch-size', type=int, default=10000)
+    args = arg_parser.parse_args()
+
+    values = build_value_rows(COLUMNS, args.rows)
+    for mode in ('rows', 'values', 'pragmas'):
+        print('mode=%s rows=%s rows/sec=%.0f' % (mode, args.rows, run(mode, values, args.batch_size)))
@@ -0,0 +1,195 @@
+"""Synthetic spec and fixed width data generator for the benchmarks
+
+    $ python -m benchmarks.datagen --out /tmp/bench --columns 30 --rows 100000 --malformed 0.001
+
+writes `<out>/specs/<name>.csv` and `<out>/data/<name>_2018-01-01.txt`, the same layout
+run.py expects, so the output can be loaded with the real CLI as well
+"""
+import argparse
+import bz2
+import csv
+import gzip
+import lzma
+import os
+import random
+import shutil
+
+# compression -> (module, file suffix)
+COMPRESSORS = {
+    'gzip': (gzip, '.gz'),
+    'bz2': (bz2, '.bz2'),
+    'xz': (lzma, '.xz'),
+}
+
+# alphabet for TEXT values; no spaces so a value never gets stripped down to the wrong width
+TEXT_CHARS = 'abcdefgh'
+
+
+def build_spec(path: str, num_columns: int, seed: int = 0, numeric: float = 2 / 3) -> list:
+    """write a spec csv with a random mix of column types
+
+    :param path: where to write the spec
+    :param num_columns: number of columns in the spec
+    :param seed: seed for the random type/width mix
+    :param numeric: share of INTEGER/BOOLEAN columns, the rest are TEXT
+    :return: list of (name, width, datatype) tuples
+    """
+    rand = random.Random(seed)
+    columns = []
+    for ix in range(num_columns):
+        if rand.random() < numeric:
+            data_type = rand.choice(['INTEGER', 'BOOLEAN'])
+        else:
+            data_type = 'TEXT'
+        width = 1 if data_type == 'BOOLEAN' else rand.randint(3, 12)
+        columns.append(('col_%s' % ix, width, data_type))
+
+    with open(path, 'w', newline='') as spec_file:
+        writer = csv.writer(spec_file)
+        writer.writerow(['column name', 'width', 'datatype'])
+        writer.writerows(columns)
+    return columns
+
+
+def build_values(columns: list, rand: random.Random) -> list:
+    """one row of python values that fit the spec widths
+
+    :param columns: list of (name, width, datatype) tuples
+    :param rand: random source
+    :return: list of values in spec order
+    """
+    values = []
+    for _, width, data_type in columns:
+        if data_type == 'TEXT':
+            values.append(''.join(rand.choice(TEXT_CHARS) for _ in range(width)))
+        elif data_type == 'INTEGER':
+            values.append(rand.randint(0, 10 ** (width - 1)))
+        else:
+            values.append(rand.random() < 0.5)
+    return values
+
+
+def build_line(columns: list, rand: random.Random) -> str:
+    """one fixed width line that satisfies the spec
+
+    values are padded so the line never starts or ends with whitespace,
+    which the parser would strip and then reject as the wrong width
+    """
+    fields = []
+    for (_, width, data_type), value in zip(columns, build_values(columns, rand)):
+        if data_type == 'INTEGER':
+            fields.append(str(value).zfill(width))
+        elif data_type == 'BOOLEAN':
+            fields.append('1' if value else '0')
+        else:
+            fields.append(value)
+    return ''.join(fields) + '\n'
+
+
+def build_malformed_line(columns: list, rand: random.Random) -> str:
+    """a line that is a few characters too short or too long for the spec"""
+    line = build_line(columns, rand)[:-1]
+    if rand.random() < 0.5:
+        return line[:-rand.randint(1, 3)] + '\n'
+    return line + TEXT_CHARS[:rand.randint(1, 3)] + '\n'
+
+
+def build_lines(columns: list, num_rows: int, malformed: float = 0.0, seed: int = 1) -> list:
+    """num_rows lines drawn from a pool of 1000 distinct lines
+
+    the pool keeps generation cheap while still giving the parser varied input
+
+    :param columns: list of (name, width, datatype) tuples
+    :param num_rows: number of lines
+    :param malformed: share of lines that have the wrong width
+    :param seed: seed for the values and for which lines are malformed
+    :return: list of lines, newline terminated
+    """
+    rand = random.Random(seed)
+    pool = [build_line(columns, rand) for _ in range(1000)]
+    bad_pool = [build_malformed_line(columns, rand) for _ in range(100)]
+    lines = []
+    for ix in range(num_rows):
+        if malformed and rand.random() < malformed:
+            lines.append(bad_pool[ix % len(bad_pool)])
+        else:
+            lines.append(pool[ix % len(pool)])
+    return lines
+
+
+def build_value_rows(columns: list, num_rows: int, seed: int = 1) -> list:
+    """num_rows rows of python values drawn from a pool of 1000 distinct rows"""
+    rand = random.Random(seed)
+    pool = [build_values(columns, rand) for _ in range(1000)]
+    return [pool[ix % len(pool)] for ix in range(num_rows)]
+
+
+def write_data(path: str, columns: list, num_rows: int, malformed: float = 0.0, seed: int = 1) -> int:
+    """write a data file for the spec
+
+    :param path: where to write the data file
+    :param columns: list of (name, width, datatype) tuples
+    :param num_rows: number of lines
+    :param malformed: share of lines that have the wrong width
+    :param seed: seed for the values and for which lines are malformed
+    :return: number of bytes written
+    """
+    with open(path, 'w') as data_file:
+        for line in build_lines(columns, num_rows, malformed, seed):
+            data_file.write(line)
+    return os.path.getsize(path)
+
+
+def compress_file(path: str, compression: str) -> str:
+    """write a compressed copy of a data file next to it
+
+    :param path: data file
+    :param compression: key of COMPRESSORS
+    :return: path of the compressed copy
+    """
+    module, suffix = COMPRESSORS[compression]
+    compressed_path = path + suffix
+    with open(path, 'rb') as data_file, module.open(compressed_path, 'wb') as compressed_file:
+        shutil.copyfileobj(data_file, compressed_file)
+    return compressed_path
+
+
+def generate(out_dir: str, name: str, num_columns: int, num_rows: int, numeric: float = 2 / 3,
+             malformed: float = 0.0, seed: int = 0, drop_date: str = '2018-01-01'):
+    """write a spec and a matching data file in the specs/ and data/ layout run.py uses
+
+    :return: tuple of the spec path, data path and spec columns
+    """
+    specs_dir = os.path.join(out_dir, 'specs')
+    data_dir = os.path.join(out_dir, 'data')
+    os.makedirs(specs_dir, exist_ok=True)
+    os.makedirs(data_dir, exist_ok=True)
+
+    spec_path = os.path.join(specs_dir, '%s.csv' % name)
+    data_path = os.path.join(data_dir, '%s_%s.txt' % (name, drop_date))
+    columns = build_spec(spec_path, num_columns, seed, numeric)
+    write_data(data_path, columns, num_rows, malformed, seed + 1)
+    return spec_path, data_path, columns
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--out', required=True, help='directory to write specs/ and data/ into')
+    arg_parser.add_argument('--name', default='bench', help='file type name of the spec and data file')
+    arg_parser.add_argument('--columns', type=int, default=30)
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--numeric', type=float, default=2 / 3,
+                            help='share of INTEGER/BOOLEAN columns in the generated spec')
+    arg_parser.add_argument('--malformed', type=float, default=0.0,
+                            help='share of lines with the wrong width')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--compress', choices=COMPRESSORS.keys(), default=None,
+                            help='replace the data file with a compressed one')
+    args = arg_parser.parse_args()
+
+    spec_path, data_path, _ = generate(args.out, args.name, args.columns, args.rows,
+                                       args.numeric, args.malformed, args.seed)
+    if args.compress:
+        raw_path, data_path = data_path, compress_file(data_path, args.compress)
+        os.unlink(raw_path)
+    print('spec=%s data=%s bytes=%s' % (spec_path, data_path, os.path.getsize(data_path)))
@@ -0,0 +1,255 @@
+"""Benchmark suite: lines/sec and peak RSS for each stage of a load
+
+    $ python -m benchmarks.suite --output results.json
+    $ python -m benchmarks.suite --save-baseline benchmarks/baseline.json
+    $ python -m benchmarks.suite --baseline benchmarks/baseline.json
+
+Stages:
+    parse         FixedWidthParser.parse over lines already in memory
+    parse_file    Parser.parse_file, reading and parsing the data file
+    parse_file_compressed
+                  Parser.parse_file of the data file compressed with --compression,
+                  decompressed on the fly in a background thread
+    insert_rows   SqlLiteBackend.insert_rows of already parsed rows
+    file_handler  FileHandler.run, the whole load including moving the files
+
+Every stage runs in a fresh interpreter so the peak RSS of one stage doesn't hide
+the next. With --baseline the run exits with status 1 when a stage is slower or
+uses more memory than the baseline by more than --threshold.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.datagen import COMPRESSORS, compress_file, generate
+
+STAGES = ('parse', 'parse_file', 'parse_file_compressed', 'insert_rows', 'file_handler')
+# name of the generated spec, and so of the table the loads go to
+FILE_TYPE = 'bench'
+
+
+def peak_rss_kb() -> int:
+    """peak resident set size of this process in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports KiB, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def stage_parse(work_dir: str, spec_path: str, data_path: str, options: dict):
+    from file_loader.exceptions import MalformedLineError
+    from file_loader.parsers.fixed_width_parser import FixedWidthParser
+
+    parser = FixedWidthParser(spec_path)
+    with open(data_path) as data_file:
+        lines = data_file.readlines()
+
+    parse = parser.parse
+    errors = 0
+    start = time.perf_counter()
+    for line in lines:
+        try:
+            parse(line)
+        except MalformedLineError:
+            errors += 1
+    return len(lines), time.perf_counter() - start, {'malformed': errors}
+
+
+def stage_parse_file(work_dir: str, spec_path: str, data_path: str, options: dict):
+    from file_loader.backends.sqlite import SqlLiteBackend
+    from file_loader.parser import Parser
+    from file_loader.parsers.fixed_width_parser import FixedWidthParser
+
+    parser = Parser(data_path, spec_path, FixedWidthParser, SqlLiteBackend,
+                    'sqlite:///%s' % os.path.join(work_dir, 'parse_file.db'))
+    start = time.perf_counter()
+    rows = parser.parse_file(data_path)
+    return len(rows), time.perf_counter() - start, {'file_bytes': os.path.getsize(data_path)}
+
+
+def stage_insert_rows(work_dir: str, spec_path: str, data_path: str, options: dict):
+    from file_loader.backends.sqlite import SqlLiteBackend
+    from file_loader.parser import Parser
+    from file_loader.parsers.fixed_width_parser import FixedWidthParser
+
+    parser = Parser(data_path, spec_path, FixedWidthParser, SqlLiteBackend,
+                    'sqlite:///%s' % os.path.join(work_dir, 'insert_rows.db'))
+    rows = parser.parse_file(data_path)
+    backend, batch_size = parser.backend, options['batch_size']
+
+    start = time.perf_counter()
+    inserted = 0
+    for ix in range(0, len(rows), batch_size):
+        inserted += backend.insert_rows(rows[ix:ix + batch_size], backend.table)
+    return inserted, time.perf_counter() - start, {}
+
+
+def stage_file_handler(work_dir: str, spec_path: str, data_path: str, options: dict):
+    from file_loader.file_handler import FileHandler
+
+    # copies of the data file under different drop dates, loaded like a real run
+    data_dir = os.path.join(work_dir, 'data')
+    for sub_dir in ('data', 'data/loaded', 'data/failed'):
+        os.makedirs(os.path.join(work_dir, sub_dir), exist_ok=True)
+    files = []
+    for ix in range(options['files']):
+        name = '%s_2018-02-%02d.txt' % (FILE_TYPE, ix + 1)
+        shutil.copyfile(data_path, os.path.join(data_dir, name))
+        files.append(name)
+
+    file_handler = FileHandler(
+        data_dir, os.path.dirname(spec_path), os.path.join(data_dir, 'failed'),
+        os.path.join(data_dir, 'loaded'), 'sqlite', 'fixed_width',
+        'sqlite:///%s' % os.path.join(work_dir, 'file_handler.db'), files,
+        parser_options={'batch_size': options['batch_size']})
+    start = time.perf_counter()
+    results = file_handler.run()
+    elapsed = time.perf_counter() - start
+    return sum(result.rows for result in results), elapsed, {
+        'failed_files': sum(1 for result in results if not result.success)}
+
+
+STAGE_FUNCTIONS = {
+    'parse': stage_parse,
+    'parse_file': stage_parse_file,
+    # same stage, run() hands it the compressed file
+    'parse_file_compressed': stage_parse_file,
+    'insert_rows': stage_insert_rows,
+    'file_handler': stage_file_handler,
+}
+
+
+def run_stage(stage: str, spec_path: str, data_path: str, options: dict) -> dict:
+    """runs inside a fresh worker process
+
+    :return: dict of the stage measurements
+    """
+    base_rss = peak_rss_kb()
+    with tempfile.TemporaryDirectory() as work_dir:
+        lines, seconds, extra = STAGE_FUNCTIONS[stage](work_dir, spec_path, data_path, options)
+    result = {
+        'lines': lines,
+        'seconds': seconds,
+        'lines_per_sec': lines / seconds if seconds else 0.0,
+        'peak_rss_kb': peak_rss_kb(),
+        # peak of the interpreter and imports before the stage ran
+        'base_rss_kb': base_rss,
+    }
+    result.update(extra)
+    return result
+
+
+def measure(stage: str, spec_path: str, data_path: str, options: dict, repeat: int) -> dict:
+    """best throughput and worst peak RSS over `repeat` runs, each in a new process"""
+    runs = []
+    context = multiprocessing.get_context('spawn')
+    for _ in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(run_stage, stage, spec_path, data_path, options).result())
+    best = max(runs, key=lambda result: result['lines_per_sec'])
+    return dict(best, peak_rss_kb=max(result['peak_rss_kb'] for result in runs), runs=repeat)
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """
+
+    :param results: stage -> measurements of this run
+    :param baseline: stage -> measurements of the baseline run
+    :param threshold: allowed relative change eg// 0.1 for 10%
+    :return: list of regression messages, empty when there are none
+    """
+    regressions = []
+    for stage, result in results.items():
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        if result['lines_per_sec'] < base['lines_per_sec'] * (1 - threshold):
+            regressions.append('%s: %.0f lines/sec vs %.0f in the baseline' % (
+                stage, result['lines_per_sec'], base['lines_per_sec']))
+        if result['peak_rss_kb'] > base['peak_rss_kb'] * (1 + threshold):
+            regressions.append('%s: peak RSS %s KiB vs %s KiB in the baseline' % (
+                stage, result['peak_rss_kb'], base['peak_rss_kb']))
+    return regressions
+
+
+def run(stages: list, columns: int, rows: int, numeric: float, malformed: float,
+        batch_size: int, files: int, repeat: int, compression: str = 'gzip') -> dict:
+    """generate the data once and measure every stage
+
+    :return: dict with the run settings under `meta` and stage measurements under `results`
+    """
+    options = {'batch_size': batch_size, 'files': files}
+    meta = {
+        'columns': columns, 'rows': rows, 'numeric': numeric, 'malformed': malformed,
+        'batch_size': batch_size, 'files': files, 'repeat': repeat, 'compression': compression,
+        'python': platform.python_version(), 'platform': platform.platform(),
+        'cpu_count': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        spec_path, data_path, _ = generate(tmp_dir, FILE_TYPE, columns, rows, numeric)
+        _, bad_data_path, _ = generate(tmp_dir, FILE_TYPE, columns, rows, numeric, malformed,
+                                       drop_date='malformed')
+        if 'parse_file_compressed' in stages:
+            compressed_path = compress_file(data_path, compression)
+        for stage in stages:
+            # only the line level stage can carry on past a malformed line
+            stage_data = bad_data_path if stage == 'parse' else data_path
+            if stage == 'parse_file_compressed':
+                stage_data = compressed_path
+            results[stage] = measure(stage, spec_path, stage_data, options, repeat)
+    return {'meta': meta, 'results': results}
+
+
+def print_results(results: dict):
+    print('%-22s %12s %10s %14s' % ('stage', 'lines/sec', 'seconds', 'peak RSS KiB'))
+    for stage, result in results.items():
+        print('%-22s %12.0f %10.3f %14s' % (stage, result['lines_per_sec'], result['seconds'], result['peak_rss_kb']))
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    arg_parser.add_argument('--columns', type=int, default=30)
+    arg_parser.add_argument('--rows', type=int, default=100000)
+    arg_parser.add_argument('--numeric', type=float, default=2 / 3,
+                            help='share of INTEGER/BOOLEAN columns in the generated spec')
+    arg_parser.add_argument('--malformed', type=float, default=0.001,
+                            help='share of malformed lines fed to the parse stage')
+    arg_parser.add_argument('--batch-size', type=int, default=10000)
+    arg_parser.add_argument('--files', type=int, default=2, help='data files loaded by the file_handler stage')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--compression', choices=COMPRESSORS.keys(), default='gzip',
+                            help='compression of the file read by the parse_file_compressed stage')
+    arg_parser.add_argument('--output', help='write the results as json to this file')
+    arg_parser.add_argument('--save-baseline', help='write the results as the new baseline to this file')
+    arg_parser.add_argument('--baseline', help='compare against the baseline in this file')
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help='relative slowdown or memory growth that counts as a regression')
+    args = arg_parser.parse_args()
+
+    report = run(args.stages, args.columns, args.rows, args.numeric, args.malformed,
+                 args.batch_size, args.files, args.repeat, args.compression)
+    print_results(report['results'])
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as output:
+                json.dump(report, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report['results'], baseline['results'], args.threshold)
+        for message in regressions:
+            print('REGRESSION %s' % message)
+        if regressions:
+            sys.exit(1)
+        print('no regressions against %s' % args.baseline)
@@ -6,14 +6,48 @@ DB_FILE = 'clover.db'
 SQLITE_URL = os.path.join(cwd,DB_FILE)
 
 DATABASE_CONFIG = {
-    'sqlite': 'sqlite:////%s' % SQLITE_URL
+    'sqlite': 'sqlite:////%s' % SQLITE_URL,
+    # one database file per file type and drop date so parallel loads (--workers) don't
+    # wait on each other's write lock; SQLITE_URL becomes the catalog that holds the
+    # manifest and the merged rows of `run.py compact`. see file_loader/shards.py
+    'sqlite_sharded': {
+        'backend': 'sqlite',
+        'catalog': 'sqlite:////%s' % SQLITE_URL,
+        'shard_dir': os.path.join(cwd, 'shards'),
+        'shard_by': ['file_type', 'drop_date'],
+        'lock_stripes': 8,
+    }
+}
+
+# applied to sqlite for the duration of a bulk load (run.py load --bulk) and then restored,
+# except journal_mode which belongs to the database file and stays WAL
+SQLITE_LOAD_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'OFF',
+    'cache_size': -262144
 }
 
 SPECS_DIR = './specs'
 DATA_DIR = './data'
 ARCHIVE_DIR = './data/loaded'
 FAILED_DIR = './data/failed'
+# bad records of tolerant loads (run.py load --max-errors/--max-error-rate)
+REJECT_DIR = './data/rejected'
+# what run.py load -a last found in DATA_DIR; kept outside DATA_DIR so writing it doesn't touch the dir's mtime
+SCAN_INDEX_FILE = './scan_index.json'
+# files are renamed in here by the worker that claims them (run.py load --celery)
+PROCESSING_DIR = './data/processing'
 
 FIXED_WIDTH = 'fixed_width'
 
+# watch mode: a file is loaded once its size/mtime are unchanged for this long
+# (files renamed into DATA_DIR are loaded right away); the poll interval only
+# applies when inotify is not available
+WATCH_SETTLE_SECONDS = 1.0
+WATCH_POLL_SECONDS = 1.0
+
+# distributed loading: `celery -A file_loader.tasks worker` on every box sharing the data dir
+CELERY_BROKER_URL = 'amqp://guest@localhost//'
+CELERY_RESULT_BACKEND = 'rpc://'
+
 LOG_FILENAME = 'logs/file_load.log'
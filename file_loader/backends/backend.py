@@ -11,11 +11,72 @@ class Backend(ABC):
         pass
 
     @abstractmethod
-    def insert_rows(self, rows: list, table: object) -> int:
-        """method for inserting rows"""
+    def insert_rows(self, rows: list, table: object, checkpoint: dict = None) -> int:
+        """method for inserting rows; a checkpoint is saved in the same transaction as the rows"""
         raise NotImplementedError
 
+    def insert_values(self, values: list, table: object, checkpoint: dict = None) -> int:
+        """method for inserting positional value lists, or a RowBatch, in table column order (without the `id`)
+
+        the Parser inserts every row through here; backends with a positional path
+        should override this rather than have every row turned into a dict
+        """
+        names = [column.name for column in table.columns if not column.primary_key]
+        rows = [dict(zip(names, row)) for row in values]
+        return self.insert_rows(rows, table, checkpoint=checkpoint)
+
+    def init_load_state(self):
+        """create the table holding load checkpoints if it doesn't exist yet"""
+        raise NotImplementedError
+
+    def get_checkpoint(self, file_name: str) -> dict:
+        """last checkpoint saved for a data file, None if there isn't one"""
+        raise NotImplementedError
+
+    def save_checkpoint(self, checkpoint: dict):
+        """save a checkpoint in its own transaction eg// to mark a load complete"""
+        raise NotImplementedError
+
+    def init_manifest(self):
+        """create the table recording the content hash of every loaded file if it doesn't exist yet"""
+        raise NotImplementedError
+
+    def find_manifest(self, file_type: str, file_size: int) -> list:
+        """manifest entries of loaded files with the same file type and size"""
+        raise NotImplementedError
+
+    def add_manifest(self, entry: dict):
+        """record a loaded file in the manifest"""
+        raise NotImplementedError
+
+    def track_inserts(self):
+        """start recording the rows inserted so delete_inserted can take them back"""
+        raise NotImplementedError
+
+    def delete_inserted(self, checkpoint: dict = None) -> int:
+        """delete the rows inserted since track_inserts, saving checkpoint in the same transaction"""
+        raise NotImplementedError
+
+    def begin_load(self, pragmas: dict, expected_rows: int = None):
+        """hook called before a bulk load starts, eg// to apply load time settings or
+        drop indexes that are cheaper to rebuild than to maintain row by row"""
+        pass
+
+    def end_load(self):
+        """hook called once a bulk load is finished, undoes begin_load"""
+        pass
+
+    def insert_columns(self, columns: dict, table: object) -> int:
+        """method for inserting a column oriented batch (column name -> list of values)
+
+        backends that can bind columns directly should override this
+        """
+        names = list(columns)
+        rows = [dict(zip(names, values)) for values in zip(*columns.values())]
+        return self.insert_rows(rows, table)
+
     @abstractmethod
-    def init_backend(self, table_name: str, fields: list):
-        """method for initializing the backend"""
+    def init_backend(self, table_name: str, fields: list, table: object = None, indexes: list = None):
+        """method for initializing the backend, `table` is a previously built table object to reuse
+        and `indexes` the columns the spec wants indexed"""
         raise NotImplementedError
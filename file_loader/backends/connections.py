@@ -0,0 +1,112 @@
+"""Process wide registry of engines, connections and known tables
+
+Creating an engine, opening a connection and reflecting whether a table exists
+are all repeated for every file otherwise. The registry keeps them around for the
+life of the process, keyed by connection string.
+"""
+import os
+import threading
+
+from sqlalchemy import create_engine
+
+from file_loader.logger import logger
+
+
+class ConnectionRegistry:
+    """Cache of sqlalchemy engines, open connections and tables known to exist"""
+
+    def __init__(self):
+        self.engines = {}
+        # connections can't be shared across threads so they are keyed by thread as well
+        self.connections = {}
+        self.known_tables = set()
+        self.hits = {'engine': 0, 'connection': 0, 'table': 0}
+        self.misses = {'engine': 0, 'connection': 0, 'table': 0}
+        self.pid = os.getpid()
+
+    def check_process(self):
+        """a forked child must not reuse the parent's connections; start from scratch"""
+        if self.pid != os.getpid():
+            self.engines = {}
+            self.connections = {}
+            self.known_tables = set()
+            self.pid = os.getpid()
+
+    def get_engine(self, connection_string: str):
+        """
+
+        :param connection_string: target data store
+        :return: a shared engine for the connection string
+        """
+        self.check_process()
+        engine = self.engines.get(connection_string)
+        if engine is None:
+            self.misses['engine'] += 1
+            engine = create_engine(connection_string)
+            self.engines[connection_string] = engine
+        else:
+            self.hits['engine'] += 1
+        return engine
+
+    def get_connection(self, connection_string: str):
+        """
+
+        :param connection_string: target data store
+        :return: a connection that stays open for the rest of the process/thread
+        """
+        self.check_process()
+        key = (connection_string, threading.get_ident())
+        connection = self.connections.get(key)
+        if connection is None or connection.closed:
+            self.misses['connection'] += 1
+            connection = self.get_engine(connection_string).connect()
+            self.connections[key] = connection
+        else:
+            self.hits['connection'] += 1
+        return connection
+
+    def table_exists(self, connection_string: str, table_name: str) -> bool:
+        """only positive answers are cached; a missing table is checked every time
+
+        :param connection_string: target data store
+        :param table_name: table to look for
+        :return: True if the table exists
+        """
+        self.check_process()
+        key = (connection_string, table_name)
+        if key in self.known_tables:
+            self.hits['table'] += 1
+            return True
+
+        self.misses['table'] += 1
+        engine = self.get_engine(connection_string)
+        exists = engine.dialect.has_table(engine, table_name)
+        if exists:
+            self.known_tables.add(key)
+        return exists
+
+    def add_table(self, connection_string: str, table_name: str):
+        """record a table that was just created"""
+        self.known_tables.add((connection_string, table_name))
+
+    def stats(self) -> dict:
+        """hit/miss counts per kind of cached object"""
+        return {kind: {'hits': self.hits[kind], 'misses': self.misses[kind]} for kind in self.hits}
+
+    def log_stats(self):
+        for kind, counts in self.stats().items():
+            logger.info('connection registry %s cache: %s hits, %s misses', kind, counts['hits'], counts['misses'])
+
+    def dispose(self):
+        """close every connection and engine and forget every known table"""
+        for connection in self.connections.values():
+            connection.close()
+        for engine in self.engines.values():
+            engine.dispose()
+        self.engines = {}
+        self.connections = {}
+        self.known_tables = set()
+
+
+# shared by every backend in the process
+registry = ConnectionRegistry()
@@ -1,11 +1,14 @@
 """Backend class for sqlite adapter
 """
 
-from sqlalchemy import create_engine, MetaData, Table, \
+from sqlalchemy import MetaData, Table, \
     Column, INTEGER, TEXT, BOOLEAN
+from sqlalchemy.exc import OperationalError
 
 from file_loader.backends.backend import Backend
+from file_loader.backends.connections import registry
 from file_loader.logger import logger
+from file_loader.metrics import metrics
 
 
 class SqlLiteBackend(Backend):
@@ -16,6 +19,26 @@ class SqlLiteBackend(Backend):
         'BOOLEAN': BOOLEAN
     }
 
+    # one row per data file: how far into the file the committed rows go
+    LOAD_STATE_TABLE = '_load_state'
+    # signature is the file's size and mtime when the load started, so a different file
+    # sent under the same name isn't mistaken for the one the state belongs to
+    LOAD_STATE_COLUMNS = ('file_name', 'file_size', 'byte_offset', 'rows', 'status', 'signature')
+    # one row per distinct file content loaded
+    MANIFEST_TABLE = '_load_manifest'
+    MANIFEST_COLUMNS = ('content_hash', 'file_type', 'file_size', 'rows', 'file_name')
+    # a bulk load drops the spec's indexes and rebuilds them afterwards when it brings in
+    # at least this many rows per row already in the table; below that, keeping them
+    # up to date row by row is cheaper than rebuilding them over the whole table
+    REBUILD_INDEXES_RATIO = 0.2
+    # the planner statistics of a table whose indexes were kept are refreshed only once a
+    # load grew it by this share; smaller loads don't change them enough to pay for an ANALYZE
+    REANALYZE_RATIO = 0.1
+    # pragmas stored in the database file rather than set per connection; they are left
+    # in place after a bulk load since switching back (eg// out of WAL) needs every other
+    # connection closed, which parallel workers loading the same database never allow
+    PERSISTENT_PRAGMAS = ('journal_mode',)
+
     def __init__(self, connection_string: str):
         """
 
@@ -27,28 +50,48 @@ class SqlLiteBackend(Backend):
         self.engine = None
         self.metadata = None
         self.table = None
+        # pragma values from before begin_load so end_load can put them back
+        self.saved_pragmas = {}
+        # columns the spec wants indexed, and the ones begin_load dropped
+        self.indexes = []
+        self.dropped_indexes = []
+        # rows in the table when begin_load ran, None if it wasn't looked up
+        self.rows_before_load = None
+        # (first id, last id) of every insert since track_inserts, None when not tracking
+        self.inserted_ids = None
         super().__init__()
 
-    def init_backend(self, table_name: str, fields: list):
+    def init_backend(self, table_name: str, fields: list, table: object = None, indexes: list = None):
         """Initializes the backend by creating a table object and creating
         that table if it doesn't yet exist
 
         :param table_name: target table for parsed data
         :param fields: list of columns and their data types for the table
+        :param table: table object built by an earlier backend for the same spec;
+        skips rebuilding the columns and metadata
+        :param indexes: columns to keep an index on; missing indexes are created,
+        eg// after a bulk load died before rebuilding them
         :return:
         """
         logger.info('Initializing backend for table: %s', table_name)
-        self.engine = create_engine(self.connection_string)
-        self.metadata = MetaData(bind=self.engine)
+        self.engine = registry.get_engine(self.connection_string)
 
-        columns = self.define_columns(fields)
-        self.table = self.get_table(table_name, columns)
+        if table is not None:
+            self.metadata = table.metadata
+            self.table = table
+        else:
+            self.metadata = MetaData(bind=self.engine)
+            columns = self.define_columns(fields)
+            self.table = self.get_table(table_name, columns)
 
         if not self.table_exists(table_name):
             logger.info('Table `%s` does not exist yet; creating now', table_name)
             self.create_table(self.table)
+            registry.add_table(self.connection_string, table_name)
             logger.info('Table `%s` created', table_name)
 
+        self.indexes = list(indexes or ())
+        self.create_indexes(self.indexes)
         return True
 
     def define_columns(self, fields: list) -> list:
@@ -79,7 +122,7 @@ class SqlLiteBackend(Backend):
         :param table_name:
         :return:
         """
-        return self.engine.dialect.has_table(self.engine, table_name)
+        return registry.table_exists(self.connection_string, table_name)
 
     @staticmethod
     def create_table(table: object):
@@ -104,26 +147,286 @@ class SqlLiteBackend(Backend):
             *(c for c in columns)
         )
 
-    def insert_rows(self, rows: list, table: object) -> int:
+    def insert_rows(self, rows: list, table: object, checkpoint: dict = None) -> int:
         """Given a list of rows insert it into the database
 
+        the loader sends RowBatches through insert_values; this is the entry point for
+        callers that have their rows as dicts
+
         :param rows: list of parsed data rows to be inserted
         :param table: table object
+        :param checkpoint: load state saved in the same transaction as the rows
         :return: number of rows inserted in the db
         """
-        engine = create_engine(self.connection_string)
-        conn = engine.connect()
-        row_count = 0
+        # the connection is shared for the life of the process, it is not closed here
+        conn = registry.get_connection(self.connection_string)
 
-        # TODO figure out how to insert rows as a list instead of a dictionary
-        # TODO as the number of rows grows it would be nice to have a smaller obj
-        try:
-            # uses the execute many functionality
+        # uses the execute many functionality; insert_values takes positional rows,
+        # eg// a RowBatch, instead of a dict per row
+        if checkpoint is None and self.inserted_ids is None:
+            result = conn.execute(table.insert(), rows)
+            return result.rowcount
+
+        with conn.begin():
             result = conn.execute(table.insert(), rows)
-            row_count = result.rowcount
+            if checkpoint is not None:
+                conn.execute(self.checkpoint_statement(), self.checkpoint_params(checkpoint))
+            if self.inserted_ids is not None:
+                self.record_inserted(conn.execute(self.last_id_statement(table)).scalar(), result.rowcount)
+        return result.rowcount
+
+    def insert_statement(self, table: object) -> str:
+        """positional INSERT for every column except the `id` primary key
+
+        :param table: table object
+        :return: sql with one `?` placeholder per column
+        """
+        quote = self.engine.dialect.identifier_preparer.quote
+        names = [column.name for column in table.columns if not column.primary_key]
+        return 'INSERT INTO %s (%s) VALUES (%s)' % (
+            quote(table.name),
+            ', '.join(quote(name) for name in names),
+            ', '.join('?' for _ in names))
+
+    def insert_values(self, values: list, table: object, checkpoint: dict = None) -> int:
+        """Insert positional value lists, eg// a RowBatch, through the raw DB-API cursor
+        inside one explicit transaction, skipping sqlalchemy's per row processing;
+        every load strategy of the Parser inserts through here
+
+        :param values: list of value lists or a RowBatch, in table column order (without the `id`)
+        :param table: table object
+        :param checkpoint: load state saved in the same transaction as the rows
+        :return: number of rows inserted in the db
+        """
+        conn = registry.get_connection(self.connection_string)
+        # the DB-API connection; pysqlite caches the prepared statement between batches
+        raw = conn.connection
+        cursor = raw.cursor()
+        try:
+            cursor.execute('BEGIN')
+            cursor.executemany(self.insert_statement(table), values)
+            row_count = cursor.rowcount
+            if checkpoint is not None:
+                cursor.execute(self.checkpoint_statement(), self.checkpoint_params(checkpoint))
+            if self.inserted_ids is not None:
+                self.record_inserted(cursor.execute(self.last_id_statement(table)).fetchone()[0], row_count)
+            raw.commit()
         except Exception as exc:
+            raw.rollback()
             raise exc
         finally:
-            conn.close()
-
+            cursor.close()
         return row_count
+
+    def last_id_statement(self, table: object) -> str:
+        return 'SELECT max(id) FROM %s' % self.engine.dialect.identifier_preparer.quote(table.name)
+
+    def record_inserted(self, last_id: int, row_count: int):
+        """remember the ids of an insert; read inside its transaction, where no other
+        writer can get in between, so they are the last row_count ids of the table"""
+        if row_count > 0:
+            self.inserted_ids.append((last_id - row_count + 1, last_id))
+
+    def track_inserts(self):
+        """record the ids of every row inserted from now on"""
+        self.inserted_ids = []
+
+    def delete_inserted(self, checkpoint: dict = None) -> int:
+        """delete the rows inserted since track_inserts
+
+        :param checkpoint: load state saved in the same transaction as the delete
+        :return: number of rows deleted
+        """
+        if not self.inserted_ids and checkpoint is None:
+            self.inserted_ids = None
+            return 0
+        conn = registry.get_connection(self.connection_string)
+        deleted = 0
+        with conn.begin():
+            for first_id, last_id in self.inserted_ids or ():
+                deleted += conn.execute('DELETE FROM %s WHERE id BETWEEN ? AND ?' % (
+                    self.engine.dialect.identifier_preparer.quote(self.table.name)), first_id, last_id).rowcount
+            if checkpoint is not None:
+                conn.execute(self.checkpoint_statement(), self.checkpoint_params(checkpoint))
+        self.inserted_ids = None
+        return deleted
+
+    def insert_columns(self, columns: dict, table: object) -> int:
+        """column batches are zipped straight into positional rows for insert_values"""
+        return self.insert_values(list(zip(*columns.values())), table)
+
+    def init_load_state(self):
+        """create the load state table if it doesn't exist yet"""
+        # only the registry's cache is consulted; a table found in the database may still
+        # need the columns added below
+        if (self.connection_string, self.LOAD_STATE_TABLE) in registry.known_tables:
+            return
+        conn = registry.get_connection(self.connection_string)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS %s (file_name TEXT PRIMARY KEY, file_size INTEGER, '
+            'byte_offset INTEGER, rows INTEGER, status TEXT, signature TEXT)' % self.LOAD_STATE_TABLE)
+        # tables created before the signature column get it added, their rows keep a NULL one
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(%s)' % self.LOAD_STATE_TABLE)}
+        if 'signature' not in columns:
+            conn.execute('ALTER TABLE %s ADD COLUMN signature TEXT' % self.LOAD_STATE_TABLE)
+        registry.add_table(self.connection_string, self.LOAD_STATE_TABLE)
+
+    def get_checkpoint(self, file_name: str) -> dict:
+        """
+
+        :param file_name: name of the data file
+        :return: dict of the saved load state, None if the file has no checkpoint
+        """
+        conn = registry.get_connection(self.connection_string)
+        row = conn.execute(
+            'SELECT %s FROM %s WHERE file_name = ?' % (', '.join(self.LOAD_STATE_COLUMNS), self.LOAD_STATE_TABLE),
+            (file_name,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(self.LOAD_STATE_COLUMNS, row))
+
+    def save_checkpoint(self, checkpoint: dict):
+        """save load state outside of an insert
+
+        :param checkpoint: dict with a value for every LOAD_STATE_COLUMNS
+        """
+        conn = registry.get_connection(self.connection_string)
+        conn.execute(self.checkpoint_statement(), self.checkpoint_params(checkpoint))
+
+    def checkpoint_statement(self) -> str:
+        return 'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+            self.LOAD_STATE_TABLE,
+            ', '.join(self.LOAD_STATE_COLUMNS),
+            ', '.join('?' for _ in self.LOAD_STATE_COLUMNS))
+
+    def checkpoint_params(self, checkpoint: dict) -> tuple:
+        return tuple(checkpoint[name] for name in self.LOAD_STATE_COLUMNS)
+
+    def init_manifest(self):
+        """create the manifest table if it doesn't exist yet; lookups go by file type and size"""
+        if registry.table_exists(self.connection_string, self.MANIFEST_TABLE):
+            return
+        conn = registry.get_connection(self.connection_string)
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS %s (content_hash TEXT, file_type TEXT, file_size INTEGER, '
+            'rows INTEGER, file_name TEXT, PRIMARY KEY (content_hash, file_type))' % self.MANIFEST_TABLE)
+        conn.execute('CREATE INDEX IF NOT EXISTS %s_size ON %s (file_type, file_size)' % (
+            self.MANIFEST_TABLE, self.MANIFEST_TABLE))
+        registry.add_table(self.connection_string, self.MANIFEST_TABLE)
+
+    def find_manifest(self, file_type: str, file_size: int) -> list:
+        """
+
+        :param file_type: file type from the data file name
+        :param file_size: size of the data file in bytes
+        :return: list of dicts, one per loaded file of the same type and size
+        """
+        conn = registry.get_connection(self.connection_string)
+        rows = conn.execute(
+            'SELECT %s FROM %s WHERE file_type = ? AND file_size = ?' % (
+                ', '.join(self.MANIFEST_COLUMNS), self.MANIFEST_TABLE),
+            (file_type, file_size)).fetchall()
+        return [dict(zip(self.MANIFEST_COLUMNS, row)) for row in rows]
+
+    def add_manifest(self, entry: dict):
+        """
+
+        :param entry: dict with a value for every MANIFEST_COLUMNS
+        """
+        conn = registry.get_connection(self.connection_string)
+        conn.execute(
+            'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+                self.MANIFEST_TABLE,
+                ', '.join(self.MANIFEST_COLUMNS),
+                ', '.join('?' for _ in self.MANIFEST_COLUMNS)),
+            tuple(entry[name] for name in self.MANIFEST_COLUMNS))
+
+    def index_name(self, column: str) -> str:
+        return 'ix_%s_%s' % (self.table.name, column)
+
+    def create_indexes(self, columns: list):
+        """create the indexes that don't exist yet on the columns
+
+        :param columns: column names
+        """
+        conn = registry.get_connection(self.connection_string)
+        quote = self.engine.dialect.identifier_preparer.quote
+        for column in columns:
+            conn.execute('CREATE INDEX IF NOT EXISTS %s ON %s (%s)' % (
+                quote(self.index_name(column)), quote(self.table.name), quote(column)))
+
+    def drop_indexes(self, expected_rows: int = None) -> list:
+        """drop the spec's indexes ahead of a load big enough to be worth rebuilding them for
+
+        :param expected_rows: rows the load is expected to bring in, None if unknown
+        :return: columns whose index was dropped
+        """
+        if not self.indexes:
+            return []
+        conn = registry.get_connection(self.connection_string)
+        quote = self.engine.dialect.identifier_preparer.quote
+        if expected_rows is not None:
+            existing_rows = self.table_rows()
+            if expected_rows < existing_rows * self.REBUILD_INDEXES_RATIO:
+                logger.info('keeping the indexes on `%s`: ~%s new rows for %s existing',
+                            self.table.name, expected_rows, existing_rows)
+                return []
+
+        for column in self.indexes:
+            conn.execute('DROP INDEX IF EXISTS %s' % quote(self.index_name(column)))
+        logger.info('dropped indexes on %s of `%s` for the load', self.indexes, self.table.name)
+        return list(self.indexes)
+
+    def table_rows(self) -> int:
+        """rows in the table, near enough; max(id) is an index lookup where count(*) would scan it"""
+        conn = registry.get_connection(self.connection_string)
+        quote = self.engine.dialect.identifier_preparer.quote
+        return conn.execute('SELECT max(id) FROM %s' % quote(self.table.name)).scalar() or 0
+
+    def begin_load(self, pragmas: dict, expected_rows: int = None):
+        """apply load time pragmas (eg// journal_mode, synchronous, cache_size)
+        remembering the current values so end_load can restore them, and drop the
+        spec's indexes so the load doesn't maintain them row by row
+
+        :param pragmas: pragma name -> value
+        :param expected_rows: rows the load is expected to bring in, None if unknown
+        :return:
+        """
+        conn = registry.get_connection(self.connection_string)
+        for name, value in pragmas.items():
+            current = conn.execute('PRAGMA %s' % name).scalar()
+            if name in self.PERSISTENT_PRAGMAS:
+                if str(current).lower() == str(value).lower():
+                    continue
+            else:
+                self.saved_pragmas[name] = current
+            conn.execute('PRAGMA %s = %s' % (name, value))
+            logger.info('Set PRAGMA %s = %s for the load', name, value)
+        if self.indexes:
+            self.rows_before_load = self.table_rows()
+        self.dropped_indexes = self.drop_indexes(expected_rows)
+
+    def end_load(self):
+        """rebuild the indexes begin_load dropped, refresh the planner statistics when
+        the load rebuilt them or grew the table noticeably, and restore the pragmas
+        changed by begin_load"""
+        conn = registry.get_connection(self.connection_string)
+        analyze = bool(self.dropped_indexes)
+        if self.dropped_indexes:
+            with metrics.timer('index'):
+                # one sorted build per index instead of a b-tree insert per row
+                self.create_indexes(self.dropped_indexes)
+            self.dropped_indexes = []
+        elif self.rows_before_load is not None:
+            analyze = self.table_rows() - self.rows_before_load >= self.rows_before_load * self.REANALYZE_RATIO
+        self.rows_before_load = None
+        if analyze:
+            with metrics.timer('analyze'):
+                conn.execute('ANALYZE %s' % self.engine.dialect.identifier_preparer.quote(self.table.name))
+        for name, value in self.saved_pragmas.items():
+            try:
+                conn.execute('PRAGMA %s = %s' % (name, value))
+            except OperationalError as exc:
+                # the rows are committed by now, a setting left behind mustn't fail the file
+                logger.warning('Could not restore PRAGMA %s = %s: %s', name, value, exc)
+        self.saved_pragmas = {}
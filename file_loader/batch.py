@@ -0,0 +1,92 @@
+"""Column oriented batches of parsed rows
+"""
+from array import array
+from itertools import islice
+
+# spec types stored as machine integers; everything else is kept in a list
+TYPECODES = {
+    'INTEGER': 'q',
+    'BOOLEAN': 'b',
+}
+
+
+class RowBatch:
+    """Parsed rows stored column by column under one shared schema
+
+    A list of dicts repeats every key and boxes every value in every row. Here each
+    INTEGER and BOOLEAN column is an array.array of machine integers and each TEXT
+    column a list. An INTEGER column holding a value that doesn't fit in 64 bits
+    falls back to a list.
+
+    Iterating gives one positional tuple per row in spec order, so a batch goes
+    anywhere a list of value lists does, eg// straight into cursor.executemany
+    """
+    # rows transposed into columns at a time by extend
+    CHUNK_ROWS = 1024
+
+    def __init__(self, field_names: list, data_types: list, columns: list = None):
+        """
+
+        :param field_names: column names in spec order
+        :param data_types: spec data type of each column
+        :param columns: existing column storage to wrap, empty columns by default
+        """
+        self.field_names = tuple(field_names)
+        self.data_types = tuple(data_types)
+        if columns is None:
+            columns = [array(TYPECODES[data_type]) if data_type in TYPECODES else []
+                       for data_type in self.data_types]
+        self.columns = columns
+        self.length = len(columns[0]) if columns else 0
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        columns = [map(bool, column) if data_type == 'BOOLEAN' else column
+                   for column, data_type in zip(self.columns, self.data_types)]
+        return zip(*columns)
+
+    def __getitem__(self, index):
+        """a slice gives a new batch, an int the row as a tuple"""
+        if isinstance(index, slice):
+            return RowBatch(self.field_names, self.data_types, [column[index] for column in self.columns])
+        return tuple(bool(column[index]) if data_type == 'BOOLEAN' else column[index]
+                     for column, data_type in zip(self.columns, self.data_types))
+
+    def append(self, values: list):
+        """add one row of values in spec order"""
+        self.extend((values,))
+
+    def extend(self, rows):
+        """add rows of values in spec order
+
+        :param rows: iterable of value lists
+        """
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.CHUNK_ROWS))
+            if not chunk:
+                return
+            for ix, values in enumerate(zip(*chunk)):
+                self.extend_column(ix, values)
+            self.length += len(chunk)
+
+    def extend_column(self, ix: int, values: tuple):
+        column = self.columns[ix]
+        try:
+            column.extend(values)
+        except OverflowError:
+            # drop whatever made it in before the value that didn't fit
+            del column[self.length:]
+            column = self.columns[ix] = list(column)
+            column.extend(values)
+
+    def column(self, name: str):
+        """values of one column, an array or a list"""
+        return self.columns[self.field_names.index(name)]
+
+    def dicts(self):
+        """rows as dicts of column name -> value, for backends that need named values"""
+        field_names = self.field_names
+        return (dict(zip(field_names, row)) for row in self)
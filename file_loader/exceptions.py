@@ -23,3 +23,13 @@ class MissingSpecificationFile(Exception):
 class InvalidFileNameFormat(Exception):
     """File formats must follow a convention"""
     pass
+
+
+class ErrorThresholdExceeded(Exception):
+    """Raise when a tolerant load rejects more records than it is allowed to"""
+    pass
+
+
+class TooManyShards(Exception):
+    """Raise when there are more shards than sqlite can attach to the catalog at once"""
+    pass
@@ -1,13 +1,102 @@
 """Handler for routing files to parsers and moving them in the file system
 """
+import multiprocessing
 import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 
 from file_loader.exceptions import UnsupportedBackend, UnsupportedFileType,\
-    MissingSpecificationFile, InvalidFileNameFormat
-from file_loader.logger import logger
+    MissingSpecificationFile, InvalidFileNameFormat, ErrorThresholdExceeded
+from file_loader.logger import logger, get_log_file, setup_logging
+from file_loader.metrics import metrics
 from file_loader.parser import Parser
-from file_loader.parsers.fixed_width_parser import FixedWidthParser
-from file_loader.backends.sqlite import SqlLiteBackend
+from file_loader.plugins import backends, file_types
+from file_loader.readers import hash_file, strip_compression_suffix
+from file_loader.scheduler import Job, LoadScheduler, SequentialExecutor
+from file_loader.shards import lock_stripe
+from file_loader.spec_registry import SpecRegistry
+from file_loader.watcher import DirectoryWatcher
+
+# outcome of loading a single data file
+# `metrics` is the snapshot of a load that ran in another process
+LoadResult = namedtuple('LoadResult', ['data_file_path', 'success', 'rows', 'seconds', 'content_hash', 'metrics'],
+                        defaults=(None, None))
+
+# drop dates in file names, the first is the convention; older drops used the second
+DROP_DATE_FORMATS = ('%Y-%m-%d', '%m-%d-%Y')
+
+# set in each pool worker by init_worker; serialize writes to the shared databases,
+# a database is guarded by the lock its connection string hashes to
+_write_locks = None
+# each pool worker keeps its own compiled specs between the files it loads
+_spec_registry = SpecRegistry()
+
+
+def init_worker(write_locks: list, log_file: str = None):
+    """process pool initializer, every worker shares the parent's write locks
+
+    :param write_locks: locks around writes to the shared databases, see lock_stripe
+    :param log_file: the parent's log file; spawned workers don't inherit its handler
+    """
+    global _write_locks
+    _write_locks = write_locks
+    if log_file is not None:
+        setup_logging(log_file)
+
+
+def load_file(data_file_path: str, spec_file: str, parser_cls: object, backend_cls: object,
+              connection_string: str, parser_options: dict) -> LoadResult:
+    """parse and insert a single file inside a pool worker
+
+    Any exception is logged and reported as a failed load so the parent can still
+    move the file to the failed dir
+
+    :return: LoadResult for the file
+    """
+    start = time.perf_counter()
+    # the snapshot sent back should only cover this file
+    before = metrics.snapshot()
+    write_lock = None
+    if _write_locks:
+        write_lock = _write_locks[lock_stripe(connection_string, len(_write_locks))]
+    try:
+        parser = Parser(
+            data_file_path,
+            spec_file,
+            parser_cls,
+            backend_cls,
+            connection_string,
+            write_lock=write_lock,
+            spec_registry=_spec_registry,
+            **parser_options)
+        success = parser.run()
+        rows, content_hash = parser.rows_inserted, parser.content_hash
+    except Exception:
+        logger.exception('Failed to load `%s`', data_file_path)
+        success, rows, content_hash = False, 0, None
+    return LoadResult(data_file_path, success, rows, time.perf_counter() - start, content_hash,
+                      metrics.since(before))
+
+
+def claim_file(data_file_path: str, processing_dir: str):
+    """take ownership of a data file by renaming it into the processing dir
+
+    rename is atomic within a file system so exactly one of several workers
+    racing for the same file wins
+
+    :param data_file_path: path of the file in the data dir
+    :param processing_dir: dir holding the files currently being loaded
+    :return: the new path of the file, or None if another worker claimed it first
+    """
+    claimed_path = os.path.join(processing_dir, os.path.basename(data_file_path))
+    try:
+        os.rename(data_file_path, claimed_path)
+    except FileNotFoundError:
+        logger.info('`%s` was already claimed by another worker', data_file_path)
+        return None
+    return claimed_path
 
 
 class FileHandler:
@@ -18,16 +107,19 @@ class FileHandler:
     Moves the file out of the initial data directory and sends it to the archive or failed dir
     """
 
-    FILE_TYPES = {
-        'fixed_width': FixedWidthParser
-    }
+    # name -> class, imported on first use; see file_loader.plugins to add more
+    FILE_TYPES = file_types
+
+    BACKENDS = backends
 
-    BACKENDS = {
-        'sqlite': SqlLiteBackend
-    }
+    # content hash recorded in the load manifest
+    HASH_ALGORITHM = 'sha256'
 
     def __init__(self, data_dir: str, specs_dir: str, failed_dir: str, archive_dir: str,
-                 backend: str, file_type: str, connection_string: str, files: str):
+                 backend: str, file_type: str, connection_string: str, files: str,
+                 parser_options: dict = None, workers: int = 1, processing_dir: str = None,
+                 distributed: bool = False, manifest: bool = False, shards: object = None,
+                 max_per_table: int = None, drop_date_first: bool = False, scan_index: object = None):
         """
         :param data_dir: location of target files
         :param specs_dir: directory containing specification files
@@ -37,6 +129,19 @@ class FileHandler:
         :param file_type: key that maps to a file type parser class eg// `fixed_width`
         :param connection_string: target data store
         :param files: list of files to be loaded into the database
+        :param parser_options: extra keyword arguments passed to every Parser eg// `batch_size`
+        :param workers: number of processes to spread the files over
+        :param processing_dir: claimed files wait here while a celery worker loads them,
+        defaults to `processing` inside the data dir
+        :param distributed: send the files to celery workers instead of loading them here
+        :param manifest: record the content hash of every loaded file and archive
+        files whose content was loaded before without parsing them
+        :param shards: ShardLayout to load every file into the shard of its file type/drop date
+        instead of `connection_string`, which then only holds the manifest (the catalog)
+        :param max_per_table: max files loading into the same table at once
+        :param drop_date_first: load older drop dates first instead of strictly biggest file first
+        :param scan_index: ScanIndex the files were listed from; its sizes and file groups are
+        used to schedule them instead of stat'ing and parsing every name again
         """
         self.data_dir = data_dir
         self.specs_dir = specs_dir
@@ -45,6 +150,24 @@ class FileHandler:
         self.files = files
         self.connection_string = connection_string
         self.files = files
+        self.parser_options = parser_options or {}
+        self.workers = workers
+        self.processing_dir = processing_dir or os.path.join(data_dir, 'processing')
+        self.distributed = distributed
+        self.spec_registry = SpecRegistry()
+        self.backend = backend
+        self.file_type = file_type
+        self.manifest = manifest
+        self.shards = shards
+        self.max_per_table = max_per_table
+        self.drop_date_first = drop_date_first
+        self.scan_index = scan_index
+        if shards is not None:
+            os.makedirs(shards.shard_dir, exist_ok=True)
+        # hashes computed while checking for duplicates, reused when recording the load
+        self.file_hashes = {}
+        # name -> name of the file with the same content loading in the same run, see hold_back_copies
+        self.held_copies = {}
 
         self.backend_cls = self.BACKENDS.get(backend)
         if self.backend_cls is None:
@@ -55,25 +178,359 @@ class FileHandler:
         self.parser_type_cls = self.FILE_TYPES.get(file_type)
         if self.parser_type_cls is None:
             logger.error('File type `%s` is not supported. Choose from supported file types %s',
-                         backend, self.FILE_TYPES.keys())
+                         file_type, self.FILE_TYPES.keys())
             raise UnsupportedFileType
 
+        if self.manifest:
+            # files are hashed as they are read so recording them costs no extra I/O
+            self.parser_options = dict(self.parser_options, hash_algorithm=self.HASH_ALGORITHM)
+            self.manifest_backend = self.backend_cls(connection_string)
+            self.manifest_backend.init_manifest()
+
     def run(self):
         """
         Iterate over the list of files and attempt to parse them
-        :return:
+        :return: list of LoadResult, one per file
         """
-        for data_file_name in self.files:
-            spec_file = self.get_spec_file(data_file_name)
-            data_file_path = os.path.join(self.data_dir, data_file_name)
+        start = time.perf_counter()
+        with metrics.timer('run'):
+            if self.distributed:
+                results = self.run_distributed()
+            elif self.workers > 1:
+                results = self.run_parallel()
+            else:
+                jobs = [self.make_job(data_file_name, data_file_name) for data_file_name in self.files]
+                results = self.scheduler().run(SequentialExecutor(), self.load_file, jobs)
+        for result in results:
+            metrics.add_file(result.data_file_path, result.success, result.rows, result.seconds)
+        self.log_summary(results, time.perf_counter() - start)
+        metrics.flush()
+        return results
+
+    def load_file(self, data_file_name: str) -> LoadResult:
+        """parse, insert and move a single file in this process
+
+        Like the pool workers' load_file, a load that raises is logged and the file goes
+        to the failed dir; the run carries on with the next file
+
+        :param data_file_name: name of the file inside the data dir
+        :return: LoadResult for the file
+        """
+        start = time.perf_counter()
+        spec_file = self.get_spec_file(data_file_name)
+        data_file_path = os.path.join(self.data_dir, data_file_name)
+        if self.manifest:
+            entry = self.find_duplicate(data_file_name)
+            if entry is not None:
+                return self.skip_duplicate(data_file_name, entry)
+        try:
             parser = Parser(
                 data_file_path,
                 spec_file,
                 self.parser_type_cls,
                 self.backend_cls,
-                self.connection_string)
+                self.connection_for(data_file_name),
+                spec_registry=self.spec_registry,
+                **self.parser_options)
             load_success = parser.run()
-            self.move_file(data_file_path, load_success)
+            rows, content_hash = parser.rows_inserted, parser.content_hash
+        except ErrorThresholdExceeded:
+            # too many rejects; the reject file and the failed dir have what went wrong
+            load_success, rows, content_hash = False, 0, None
+        except Exception:
+            logger.exception('Failed to load `%s`', data_file_path)
+            load_success, rows, content_hash = False, 0, None
+        result = LoadResult(data_file_path, load_success, rows, time.perf_counter() - start, content_hash)
+        self.record_load(result)
+        self.move_file(data_file_path, load_success)
+        return result
+
+    def watch(self, settle_seconds: float = 1.0, poll_seconds: float = 1.0):
+        """keep loading files as they land in the data dir until interrupted
+
+        The same FileHandler (and with it the spec and connection registries)
+        is reused for every file so nothing is set up twice
+
+        :param settle_seconds: how long a file's size/mtime must be stable before loading
+        :param poll_seconds: scan interval when inotify is not available
+        """
+        watcher = DirectoryWatcher(self.data_dir, self.load_watched_file, settle_seconds, poll_seconds)
+        try:
+            watcher.run()
+        except KeyboardInterrupt:
+            logger.info('stopped watching `%s`', self.data_dir)
+
+    def load_watched_file(self, data_file_name: str):
+        """load a file picked up by the watcher; one bad file must not stop the watcher
+
+        :param data_file_name: name of the file inside the data dir
+        """
+        try:
+            result = self.load_file(data_file_name)
+            metrics.add_file(result.data_file_path, result.success, result.rows, result.seconds)
+            metrics.flush()
+        except (InvalidFileNameFormat, MissingSpecificationFile):
+            # leave it in place, it is picked up again if it gets rewritten
+            logger.error('Skipping `%s`', data_file_name)
+        except Exception:
+            logger.exception('Failed to load `%s`', data_file_name)
+            data_file_path = os.path.join(self.data_dir, data_file_name)
+            if os.path.exists(data_file_path):
+                self.move_file(data_file_path, False)
+
+    def run_parallel(self) -> list:
+        """spread the files over a process pool
+
+        Parsing runs in parallel but sqlite only allows a single writer per database
+        so every worker holds a shared lock while it writes. Each database maps to one
+        of a few striped locks so loads into different shards write at the same time.
+        Files are moved by this process as soon as each result comes back.
+        The scheduler decides which file goes next, biggest first.
+
+        :return: list of LoadResult, in completion order
+        """
+        # resolve every spec up front so a missing spec fails before any work starts
+        files, results = self.filter_duplicates(self.files)
+        jobs = [
+            self.make_job(data_file_name, os.path.join(self.data_dir, data_file_name),
+                          self.get_spec_file(data_file_name), self.parser_type_cls, self.backend_cls,
+                          self.connection_for(data_file_name), self.parser_options)
+            for data_file_name in files
+        ]
+        stripes = self.shards.lock_stripes if self.shards is not None else 1
+        write_locks = [multiprocessing.Lock() for _ in range(stripes)]
+        # the manifest lives in the main database
+        manifest_lock = write_locks[lock_stripe(self.connection_string, stripes)]
+
+        def finish(job: Job, result: LoadResult):
+            if result.metrics is not None:
+                metrics.merge(result.metrics)
+            with manifest_lock:
+                self.record_load(result)
+            self.move_file(result.data_file_path, result.success)
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker,
+                                 initargs=(write_locks, get_log_file())) as executor:
+            results.extend(self.scheduler(self.workers).run(executor, load_file, jobs, finish))
+        results.extend(self.settle_held_copies())
+        return results
+
+    def scheduler(self, workers: int = 1) -> LoadScheduler:
+        return LoadScheduler(workers, self.max_per_table, self.drop_date_first)
+
+    def make_job(self, data_file_name: str, *args) -> Job:
+        """describe a data file for the scheduler; a missing file counts as empty
+
+        :param data_file_name: name of the file inside the data dir
+        :param args: arguments the scheduler passes to the load function
+        """
+        entry = self.scan_index.entries.get(data_file_name) if self.scan_index is not None else None
+        if entry is not None:
+            size, _, _, file_type, drop_date = entry
+            return Job(data_file_name, size, file_type, drop_date, args)
+        try:
+            file_type, drop_date = self.parse_file_name(data_file_name)
+        except InvalidFileNameFormat:
+            # loading it reports the bad name
+            file_type, drop_date = None, None
+        try:
+            size = os.path.getsize(os.path.join(self.data_dir, data_file_name))
+        except OSError:
+            size = 0
+        return Job(data_file_name, size, file_type, drop_date, args)
+
+    def run_distributed(self) -> list:
+        """send every file to the celery workers and move each one when its result comes back
+
+        Files claimed by a worker of another dispatch are skipped; that dispatch moves them
+
+        :return: list of LoadResult, in dispatch order
+        """
+        # celery is only needed for distributed loads
+        from file_loader.tasks import load_file_task
+
+        files, results = self.filter_duplicates(self.files)
+        jobs = [
+            (os.path.join(self.data_dir, data_file_name), self.get_spec_file(data_file_name))
+            for data_file_name in files
+        ]
+        os.makedirs(self.processing_dir, exist_ok=True)
+        async_results = [
+            load_file_task.delay(data_file_path, self.processing_dir, spec_file, self.file_type,
+                                 self.backend, self.connection_for(os.path.basename(data_file_path)),
+                                 self.parser_options)
+            for data_file_path, spec_file in jobs
+        ]
+        logger.info('dispatched %s files to celery workers', len(async_results))
+
+        for (data_file_path, _), async_result in zip(jobs, async_results):
+            try:
+                result = async_result.get()
+            except Exception:
+                # the worker died or the task raised outside of the load itself
+                logger.exception('Task for `%s` failed', data_file_path)
+                claimed_path = os.path.join(self.processing_dir, os.path.basename(data_file_path))
+                if os.path.exists(claimed_path):
+                    self.move_file(claimed_path, False)
+                results.append(LoadResult(data_file_path, False, 0, 0.0))
+                continue
+            if result is None:
+                continue
+            result = LoadResult(**result)
+            if result.metrics is not None:
+                metrics.merge(result.metrics)
+            self.record_load(result)
+            self.move_file(result.data_file_path, result.success)
+            results.append(result)
+        results.extend(self.settle_held_copies())
+        return results
+
+    def connection_for(self, data_file_name: str) -> str:
+        """connection string of the database a data file is loaded into
+
+        :param data_file_name: name of the file inside the data dir
+        """
+        if self.shards is None:
+            return self.connection_string
+        file_type, drop_date = self.parse_file_name(data_file_name)
+        return self.shards.connection_string(file_type, drop_date)
+
+    def find_duplicate(self, data_file_name: str):
+        """look for an earlier load of the same content
+
+        Only files with a manifest entry of the same type and size are hashed here;
+        everything else is hashed while it loads
+
+        :param data_file_name: name of the file inside the data dir
+        :return: the manifest entry of the earlier load, None if the content is new
+        """
+        data_file_path = os.path.join(self.data_dir, data_file_name)
+        file_type, _ = self.parse_file_name(data_file_name)
+        candidates = self.manifest_backend.find_manifest(file_type, os.path.getsize(data_file_path))
+        if not candidates:
+            return None
+
+        content_hash = self.file_hashes.get(data_file_path) or hash_file(data_file_path, self.HASH_ALGORITHM)
+        self.file_hashes[data_file_path] = content_hash
+        for entry in candidates:
+            if entry['content_hash'] == content_hash:
+                return entry
+        return None
+
+    def skip_duplicate(self, data_file_name: str, entry: dict) -> LoadResult:
+        """archive a file whose content was already loaded
+
+        :param data_file_name: name of the file inside the data dir
+        :param entry: manifest entry of the earlier load
+        :return: successful LoadResult with no rows
+        """
+        data_file_path = os.path.join(self.data_dir, data_file_name)
+        logger.info('`%s` has the same content as `%s` (%s rows); archiving without loading',
+                    data_file_name, entry['file_name'], entry['rows'])
+        self.move_file(data_file_path, True)
+        return LoadResult(data_file_path, True, 0, 0.0, entry['content_hash'])
+
+    def filter_duplicates(self, files: list):
+        """split off the files whose content was already loaded
+
+        :param files: names of files inside the data dir
+        :return: tuple of the names still to load and the LoadResults of the duplicates
+        """
+        if not self.manifest:
+            return files, []
+        remaining, results = [], []
+        for data_file_name in files:
+            entry = self.find_duplicate(data_file_name)
+            if entry is None:
+                remaining.append(data_file_name)
+            else:
+                results.append(self.skip_duplicate(data_file_name, entry))
+        return self.hold_back_copies(remaining), results
+
+    def hold_back_copies(self, files: list) -> list:
+        """keep only the first of the files with the same content
+
+        Files loaded side by side never see each other in the manifest, so copies within
+        one run are grouped here by type, size and hash before anything is dispatched.
+        Only files that share a type and size get hashed.
+
+        :param files: names of files inside the data dir, none of them in the manifest
+        :return: the names to load; the rest wait in held_copies for settle_held_copies
+        """
+        by_size = {}
+        for data_file_name in files:
+            file_type, _ = self.parse_file_name(data_file_name)
+            size = os.path.getsize(os.path.join(self.data_dir, data_file_name))
+            by_size.setdefault((file_type, size), []).append(data_file_name)
+
+        loading = {}
+        for (file_type, _), names in by_size.items():
+            if len(names) == 1:
+                continue
+            for data_file_name in names:
+                data_file_path = os.path.join(self.data_dir, data_file_name)
+                content_hash = hash_file(data_file_path, self.HASH_ALGORITHM)
+                self.file_hashes[data_file_path] = content_hash
+                original = loading.setdefault((file_type, content_hash), data_file_name)
+                if original != data_file_name:
+                    logger.info('`%s` has the same content as `%s`; holding it back until that one is loaded',
+                                data_file_name, original)
+                    self.held_copies[data_file_name] = original
+        return [data_file_name for data_file_name in files if data_file_name not in self.held_copies]
+
+    def settle_held_copies(self) -> list:
+        """archive the held back copies whose original made it into the manifest; the
+        copies of a file that failed are left in the data dir for the next run
+
+        :return: LoadResults of the archived copies
+        """
+        results = []
+        for data_file_name, original in self.held_copies.items():
+            entry = self.find_duplicate(data_file_name)
+            self.file_hashes.pop(os.path.join(self.data_dir, data_file_name), None)
+            if entry is None:
+                logger.warning('`%s` was not loaded; leaving its copy `%s` for the next run', original, data_file_name)
+            else:
+                results.append(self.skip_duplicate(data_file_name, entry))
+        self.held_copies = {}
+        return results
+
+    def record_load(self, result: LoadResult):
+        """add a successfully loaded file to the manifest
+
+        :param result: LoadResult of the file, before the file is moved
+        """
+        if not self.manifest or not result.success:
+            return
+        content_hash = result.content_hash or self.file_hashes.pop(result.data_file_path, None)
+        if content_hash is None:
+            # some load paths (parse workers, resumed loads) can't hash while reading
+            content_hash = hash_file(result.data_file_path, self.HASH_ALGORITHM)
+        file_name = os.path.basename(result.data_file_path)
+        file_type, _ = self.parse_file_name(file_name)
+        self.manifest_backend.add_manifest({
+            'content_hash': content_hash,
+            'file_type': file_type,
+            'file_size': os.path.getsize(result.data_file_path),
+            'rows': result.rows,
+            'file_name': file_name
+        })
+
+    def log_summary(self, results: list, seconds: float):
+        """log aggregate throughput for a run
+
+        :param results: list of LoadResult
+        :param seconds: wall time of the whole run
+        """
+        rows = sum(result.rows for result in results)
+        failed = sum(1 for result in results if not result.success)
+        logger.info('loaded %s files (%s failed), %s rows in %.2fs: %.0f rows/sec',
+                    len(results), failed, rows, seconds, rows / seconds if seconds else 0)
+        # imported here rather than at the top so startup doesn't pay for sqlalchemy
+        from file_loader.backends.connections import registry
+        registry.log_stats()
+        self.spec_registry.log_stats()
+        metrics.log_stats()
 
     def move_file(self, file_path: str, success: bool):
         """
@@ -88,18 +545,24 @@ class FileHandler:
             target_dir = self.failed_dir
         file_name = os.path.split(file_path)[-1]
         logger.info('moving file `%s` to `%s`', file_path, os.path.join(target_dir, file_name))
-        os.rename(file_path, os.path.join(target_dir, file_name))
+        with metrics.timer('move'):
+            os.rename(file_path, os.path.join(target_dir, file_name))
+        metrics.increment('files_archived' if success else 'files_failed')
 
     @staticmethod
     def parse_file_name(path: str):
         """
         Parsing the file based on the conventions laid out in the assignment
-        filename_YYYY-MM-dd
+        filename_YYYY-MM-dd, optionally compressed eg// filename_YYYY-MM-dd.txt.gz
+
+        The drop date places the file in its shard and orders --drop-date-first loads, both
+        by comparing it as a string, so it always comes back as YYYY-MM-dd; MM-dd-YYYY
+        names are accepted and turned around
 
         :param path:
-        :return:
+        :return: (file type, drop date as YYYY-MM-dd)
         """
-        file_name = os.path.splitext(path)[0]
+        file_name = os.path.splitext(strip_compression_suffix(path))[0]
         file_name_parts = file_name.split('_')
 
         if len(file_name_parts) < 2:
@@ -108,8 +571,15 @@ class FileHandler:
                 file_name)
             raise InvalidFileNameFormat
 
-        # TODO raise if the date format is incorrect? Not doing anything with this date yet
-        drop_date = file_name_parts[-1]
+        for date_format in DROP_DATE_FORMATS:
+            try:
+                drop_date = datetime.strptime(file_name_parts[-1], date_format).strftime('%Y-%m-%d')
+                break
+            except ValueError:
+                continue
+        else:
+            logger.error('File name `%s` does not end in a YYYY-MM-dd drop date', file_name)
+            raise InvalidFileNameFormat
 
         file_type = '_'.join(file_name_parts[0:-1])
         return file_type, drop_date
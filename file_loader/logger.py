@@ -1,29 +1,49 @@
 """
 Basic logging module
+
+Importing it has no side effects; entry points (run.py, celery workers) call
+setup_logging to send the log to the rotating file. Until then records go nowhere.
 """
 import logging
-from logging.handlers import RotatingFileHandler
-from config import LOG_FILENAME
+import os
 
 # create logger
 logger = logging.getLogger('Parser App')
 logger.setLevel(logging.DEBUG)
-
-# create console handler and set level to debug
-#handler = logging.StreamHandler()
-
-handler = RotatingFileHandler(LOG_FILENAME, maxBytes=200000, backupCount=5)
-
-handler.setLevel(logging.DEBUG)
-
-# create formatter
-formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-
-# add formatter to ch
-handler.setFormatter(formatter)
-
-# add ch to logger
-logger.addHandler(handler)
-
-# 'application' code
-logger.info('log initialized %s', __name__)
+logger.addHandler(logging.NullHandler())
+
+# file the log is going to, None until setup_logging is called
+log_file = None
+
+
+def get_log_file() -> str:
+    """file setup_logging sent the log to, None when logging isn't set up"""
+    return log_file
+
+
+def setup_logging(filename: str = None, level: int = logging.DEBUG) -> logging.Handler:
+    """send the log to a rotating file; calling it again for the same file is a no-op
+
+    :param filename: log file, LOG_FILENAME from the config by default
+    :param level: lowest level written to the file
+    :return: the handler added, None when the file was already set up
+    """
+    global log_file
+    if filename is None:
+        from config import LOG_FILENAME
+        filename = LOG_FILENAME
+    if log_file == filename:
+        return None
+
+    from logging.handlers import RotatingFileHandler
+    directory = os.path.dirname(filename)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(filename, maxBytes=200000, backupCount=5)
+    handler.setLevel(level)
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logger.addHandler(handler)
+    log_file = filename
+
+    logger.info('log initialized %s', __name__)
+    return handler
@@ -0,0 +1,253 @@
+"""Counters and per-stage timings for loads, with pluggable sinks
+
+Code being measured calls `metrics.increment(...)` or wraps a stage in
+`with metrics.timer(...)`. Sinks subscribe to the shared `metrics` object; every
+update is passed to their `emit` and the totals to their `flush` at the end of a run.
+Counters and stage timings add up for the life of the process; the per file results
+only cover the files since the last flush, so a long running watch doesn't keep (and
+rewrite) every file it ever loaded.
+Two sinks ship with the loader: a JSON summary and a Prometheus textfile for
+node_exporter's textfile collector.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from file_loader.logger import logger
+
+
+class MetricsSink:
+    """Base class for metrics sinks; override either method"""
+
+    def emit(self, kind: str, name: str, value: float):
+        """called on every update
+
+        :param kind: `counter`, `stage` (value is the wall seconds) or `file` (value is a dict)
+        :param name: counter or stage name, the file path for `file`
+        :param value: amount added
+        """
+        pass
+
+    def flush(self, snapshot: dict):
+        """called with the totals when a run is over
+
+        :param snapshot: Metrics.snapshot()
+        """
+        pass
+
+
+def write_atomic(path: str, text: str):
+    """write through a temp file in the same dir so readers never see a partial file"""
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(path))
+    try:
+        with os.fdopen(handle, 'w') as output:
+            output.write(text)
+        os.replace(temp_path, path)
+    except Exception as exc:
+        os.unlink(temp_path)
+        raise exc
+
+
+class JsonSummarySink(MetricsSink):
+    """Writes the run totals, stage timings and the per-file results since the last flush as json"""
+
+    def __init__(self, path: str):
+        """
+
+        :param path: file to write the summary to
+        """
+        self.path = path
+
+    def flush(self, snapshot: dict):
+        write_atomic(self.path, json.dumps(snapshot, indent=2, sort_keys=True))
+        logger.info('wrote metrics summary to `%s`', self.path)
+
+
+class PrometheusTextfileSink(MetricsSink):
+    """Writes counters and stage timings in the Prometheus text exposition format
+
+    Point node_exporter's --collector.textfile.directory at the file's directory;
+    the file name has to end in `.prom`
+    """
+    PREFIX = 'file_loader'
+
+    def __init__(self, path: str):
+        """
+
+        :param path: .prom file to write
+        """
+        self.path = path
+
+    def format(self, snapshot: dict) -> str:
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = '%s_%s_total' % (self.PREFIX, name)
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s %s' % (metric, value))
+
+        for field in ('calls', 'wall_seconds', 'cpu_seconds'):
+            metric = '%s_stage_%s_total' % (self.PREFIX, field)
+            lines.append('# TYPE %s counter' % metric)
+            for stage, timings in sorted(snapshot['stages'].items()):
+                lines.append('%s{stage="%s"} %s' % (metric, stage, timings[field]))
+
+        metric = '%s_last_flush_timestamp_seconds' % self.PREFIX
+        lines.append('# TYPE %s gauge' % metric)
+        lines.append('%s %s' % (metric, snapshot['timestamp']))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self, snapshot: dict):
+        write_atomic(self.path, self.format(snapshot))
+
+
+class Metrics:
+    """Process wide counters, stage timings and per file results"""
+
+    def __init__(self):
+        # stages of a pipelined load report from several threads
+        self.lock = threading.Lock()
+        self.sinks = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            # stage -> [calls, wall seconds, cpu seconds]
+            self.stages = {}
+            self.files = []
+            # files already flushed out of self.files
+            self.files_flushed = 0
+
+    def subscribe(self, sink: MetricsSink):
+        """have a sink receive every update and the totals at the end of each run"""
+        self.sinks.append(sink)
+
+    def unsubscribe(self, sink: MetricsSink):
+        self.sinks.remove(sink)
+
+    def increment(self, name: str, value: float = 1):
+        """add to a counter eg// `rows_inserted`"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for sink in self.sinks:
+            sink.emit('counter', name, value)
+
+    def observe(self, stage: str, wall_seconds: float, cpu_seconds: float, calls: int = 1):
+        """add time spent in a stage"""
+        with self.lock:
+            timings = self.stages.setdefault(stage, [0, 0.0, 0.0])
+            timings[0] += calls
+            timings[1] += wall_seconds
+            timings[2] += cpu_seconds
+        for sink in self.sinks:
+            sink.emit('stage', stage, wall_seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        """time the body of the with block as one call of a stage
+
+        cpu time is for the whole process, so stages running at the same
+        time in different threads each see the other's cpu time as well
+        """
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_file(self, data_file_path: str, success: bool, rows: int, seconds: float):
+        """record the outcome of loading one file"""
+        result = {
+            'file': data_file_path,
+            'success': success,
+            'rows': rows,
+            'seconds': seconds,
+            'rows_per_sec': rows / seconds if seconds else 0.0,
+        }
+        with self.lock:
+            self.files.append(result)
+        for sink in self.sinks:
+            sink.emit('file', data_file_path, result)
+
+    def snapshot(self) -> dict:
+        """all totals as plain data, suitable for json and for sending between processes"""
+        with self.lock:
+            stages = {
+                stage: {'calls': calls, 'wall_seconds': wall, 'cpu_seconds': cpu}
+                for stage, (calls, wall, cpu) in self.stages.items()
+            }
+            return {
+                'counters': dict(self.counters),
+                'stages': stages,
+                'files': list(self.files),
+                'files_flushed': self.files_flushed,
+                'timestamp': time.time(),
+            }
+
+    def since(self, earlier: dict) -> dict:
+        """what was recorded after an earlier snapshot was taken
+
+        :param earlier: a snapshot of this object
+        :return: snapshot of only the changes
+        """
+        current = self.snapshot()
+        counters = {
+            name: value - earlier['counters'].get(name, 0)
+            for name, value in current['counters'].items()
+            if value != earlier['counters'].get(name, 0)
+        }
+        stages = {}
+        for stage, timings in current['stages'].items():
+            before = earlier['stages'].get(stage, {'calls': 0, 'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            if timings['calls'] != before['calls']:
+                stages[stage] = {field: timings[field] - before[field] for field in timings}
+        # files recorded before the earlier snapshot that haven't been flushed since
+        files_seen = earlier['files_flushed'] + len(earlier['files']) - current['files_flushed']
+        return {
+            'counters': counters,
+            'stages': stages,
+            'files': current['files'][max(0, files_seen):],
+            'files_flushed': 0,
+            'timestamp': current['timestamp'],
+        }
+
+    def merge(self, snapshot: dict):
+        """fold in the snapshot of another process eg// a pool worker"""
+        for name, value in snapshot['counters'].items():
+            self.increment(name, value)
+        for stage, timings in snapshot['stages'].items():
+            self.observe(stage, timings['wall_seconds'], timings['cpu_seconds'], timings['calls'])
+        for result in snapshot['files']:
+            self.add_file(result['file'], result['success'], result['rows'], result['seconds'])
+
+    def flush(self):
+        """hand the totals to every sink and start a new list of per file results"""
+        snapshot = self.snapshot()
+        with self.lock:
+            # files added since the snapshot was taken wait for the next flush
+            flushed = len(snapshot['files'])
+            del self.files[:flushed]
+            self.files_flushed += flushed
+        for sink in self.sinks:
+            sink.flush(snapshot)
+
+    def log_stats(self):
+        snapshot = self.snapshot()
+        for stage, timings in sorted(snapshot['stages'].items()):
+            logger.info('stage %s: %s calls, %.3fs wall, %.3fs cpu',
+                        stage, timings['calls'], timings['wall_seconds'], timings['cpu_seconds'])
+        stages = snapshot['stages']
+        if 'load' in stages and 'insert' in stages:
+            # streamed loads parse and insert in turns, so parsing isn't timed on its own
+            logger.info('reading and parsing (load minus insert): %.3fs wall',
+                        stages['load']['wall_seconds'] - stages['insert']['wall_seconds'])
+        for name, value in sorted(snapshot['counters'].items()):
+            logger.info('%s: %s', name, value)
+
+
+# shared by the parser, backends and file handler in the process
+metrics = Metrics()
@@ -1,14 +1,98 @@
 """Parser class for dumping data from files to a database
 """
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
+
+from file_loader.batch import RowBatch
+from file_loader.exceptions import MalformedLineError, ErrorThresholdExceeded
 from file_loader.logger import logger
+from file_loader.metrics import metrics
+from file_loader.readers import MmapRecordReader, StreamRecordReader, detect_compression, open_compressed, \
+    open_hashed, split_ranges
+from file_loader.rejects import RejectHandler, reject_reason
+
+# load state status values saved with checkpoints
+LOAD_IN_PROGRESS = 'in_progress'
+LOAD_COMPLETE = 'complete'
+
+# line parsers built inside range workers, keyed by (schema file, parser class)
+_range_parsers = {}
+
+
+def batched(iterable, batch_size: int):
+    """group an iterable into lists of at most batch_size items"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def log_malformed_line(line_number: int, data_file_path: str, reason: str, record: bytes):
+    """the error a strict load logs for the record that stopped it"""
+    logger.error('Malformed Line %s of `%s`: %s <%s>', line_number, data_file_path, reason,
+                 record.decode('utf-8', errors='replace').rstrip('\r\n'))
+
+
+def parse_range(data_file_path: str, schema_file: str, parser_cls: object, start: int, end: int,
+                tolerant: bool = False):
+    """parse the records of one byte range of a data file inside a pool worker
+
+    :param data_file_path: data file being split up
+    :param schema_file: spec for the data file
+    :param parser_cls: line parser class
+    :param start: byte offset of the first record in the range
+    :param end: byte offset just past the last record in the range
+    :param tolerant: carry on past bad records instead of stopping at the first one
+    :return: (RowBatch of the parsed rows, number of lines read, rejects) where rejects is
+    a list of (line number within the range, reason, record) tuples
+    """
+    key = (schema_file, parser_cls)
+    if key not in _range_parsers:
+        _range_parsers[key] = parser_cls(schema_file)
+    line_parser = _range_parsers[key]
+    parse = line_parser.parse_bytes
+
+    values, rejects = [], []
+    line_number = 0
+    for line_number, record in enumerate(MmapRecordReader(data_file_path, start, end), 1):
+        try:
+            values.append(parse(record))
+        except (MalformedLineError, ValueError) as exc:
+            rejects.append((line_number, reject_reason(exc, record, line_parser.find_bad_field), record))
+            if not tolerant:
+                break
+    # columns of machine integers pickle far smaller than lists of lists on the way back
+    batch = RowBatch(line_parser.field_names, line_parser.data_types)
+    batch.extend(values)
+    return batch, line_number, rejects
 
 
 class Parser:
     """Running a parser class parses data according to the given parser class
     and inserts data into the given backend class
     """
+    # rows per chunk for chunked parsers when no batch size is given
+    DEFAULT_CHUNK_ROWS = 100000
+    # target size of the byte ranges handed to parse workers
+    RANGE_BYTES = 16 * 1024 * 1024
+    # rows per batch moving through the pipeline when no batch size is given
+    PIPELINE_BATCH_ROWS = 10000
+
     def __init__(self, data_file, schema_file, parser_cls: object,
-                 backend_cls: object, connection_string: str):
+                 backend_cls: object, connection_string: str, batch_size: int = None,
+                 use_mmap: bool = False, write_lock: object = None, parse_workers: int = 1,
+                 spec_registry: object = None, bulk_load: bool = False, load_pragmas: dict = None,
+                 pipeline: bool = False, queue_size: int = 4, checkpoint: bool = False,
+                 hash_algorithm: str = None, max_errors: int = None, max_error_rate: float = None,
+                 reject_dir: str = None):
         """
         the parser_cls and bridge_cls are implemented in the init of the this Parser class
         the parser should feasibly be agnostic as to how it's parsing and where it's sending the data
@@ -16,18 +100,75 @@ class Parser:
         :param data_file: single data file path to be parsed/dumped
         :param schema_file: schema file path instructs the parser on how to parse the data file
         :param parser_cls: class informs how the lines are parsed according to the schema file
-        :param backend_cls: class implements the insert_rows method to dump data
+        :param backend_cls: class implements the insert_values method to dump data
         :param connection_string: needed to initialize the db for the backend cls
+        :param batch_size: when set the file is streamed to the backend in batches of this
+        many rows instead of being parsed into memory all at once
+        :param use_mmap: read the data file as memory mapped bytes instead of text
+        :param write_lock: lock held around every write to the backend when several
+        processes share one target database
+        :param parse_workers: split the file into byte ranges and parse them across
+        this many processes
+        :param spec_registry: SpecRegistry to reuse compiled specs and table objects from
+        :param bulk_load: apply the backend's load time settings (load_pragmas, dropping and
+        rebuilding indexes) for the duration of the load
+        :param load_pragmas: backend settings applied for the duration of a bulk load
+        :param pipeline: overlap reading, parsing and inserting with an asyncio pipeline
+        :param queue_size: max batches waiting between two pipeline stages
+        :param checkpoint: record the byte offset of every committed batch in the backend
+        and resume from the last one when the same file is loaded again
+        :param hash_algorithm: hashlib algorithm used to hash the file while it is read,
+        the digest ends up in content_hash
+        :param max_errors: load tolerantly, writing bad records to a reject file and
+        failing the load only once more than this many were rejected
+        :param max_error_rate: load tolerantly, failing the load only once more than
+        this share of the records were rejected eg// 0.01
+        :param reject_dir: where the reject file goes, next to the data file by default
         """
         self.data_file = data_file
+        self.batch_size = batch_size
+        self.use_mmap = use_mmap
+        self.write_lock = write_lock if write_lock is not None else nullcontext()
+        self.parse_workers = parse_workers
+        self.schema_file = schema_file
+        self.bulk_load = bulk_load
+        self.load_pragmas = load_pragmas or {}
+        self.pipeline = pipeline
+        self.queue_size = queue_size
+        self.checkpoint = checkpoint
+        self.hash_algorithm = hash_algorithm
+        # digest of the whole file, only set when the load read the file from start to end
+        self.content_hash = None
+        # queue and stage metrics of the last pipelined load
+        self.pipeline_metrics = None
+        # running total of rows the backend reported as inserted
+        self.rows_inserted = 0
+        # load state a checkpointed load started from, restored if the load is discarded
+        self.resume_checkpoint = None
+        # bad records only end up in a reject file when a threshold is given
+        self.rejects = None
+        if max_errors is not None or max_error_rate is not None:
+            reject_file = os.path.join(reject_dir or os.path.dirname(data_file),
+                                       os.path.basename(data_file) + '.rejects.csv')
+            self.rejects = RejectHandler(reject_file, max_errors, max_error_rate)
         # Initialize parser and backend classes
-        self.parser = parser_cls(schema_file)
+        if spec_registry is not None:
+            self.parser = spec_registry.get_parser(schema_file, parser_cls)
+            table = spec_registry.get_table(schema_file, connection_string)
+        else:
+            self.parser = parser_cls(schema_file)
+            table = None
         self.backend = backend_cls(connection_string)
         # list of rows eventually is sent to the backend
         self.rows = []
 
         # connect to the database and create a new data store if needed
-        self.backend.init_backend(self.parser.table_name, self.parser.columns)
+        with self.write_lock:
+            self.backend.init_backend(self.parser.table_name, self.parser.columns, table=table,
+                                      indexes=self.parser.indexed_columns)
+
+        if spec_registry is not None:
+            spec_registry.set_table(schema_file, connection_string, self.backend.table)
 
     def run(self) -> bool:
         """
@@ -37,24 +178,505 @@ class Parser:
         :return: returns True if the number of records inserted is equal to the number
         of records supplied from the parser
         """
-        rows = self.parse_file(self.data_file)
-        num_rows_insert = self.backend.insert_rows(rows, self.backend.table)
+        # a load that fails takes back the batches it already committed so the file can be
+        # fixed and re-sent; a checkpointed one keeps them to resume from instead, unless
+        # the reject thresholds stopped it
+        discard_on_failure = not self.checkpoint
+        with metrics.timer('load'):
+            try:
+                if self.rejects is not None or discard_on_failure:
+                    self.backend.track_inserts()
+                success = self.load_with_settings()
+                if self.rejects is not None:
+                    self.rejects.check(final=True)
+                if not success and discard_on_failure:
+                    self.discard_rows()
+            except ErrorThresholdExceeded as exc:
+                metrics.increment('load_errors')
+                logger.error('Loading `%s` stopped: %s', self.data_file, exc)
+                self.discard_rows()
+                raise exc
+            except Exception as exc:
+                metrics.increment('load_errors')
+                logger.error('Loading `%s` stopped: %s', self.data_file, exc)
+                if self.rejects is None and isinstance(exc, (MalformedLineError, ValueError)):
+                    self.log_bad_record()
+                if discard_on_failure:
+                    self.discard_rows()
+                raise exc
+            finally:
+                metrics.increment('rows_inserted', self.rows_inserted)
+                if self.rejects is not None:
+                    self.rejects.close()
+                    metrics.increment('lines_rejected', self.rejects.errors)
+        metrics.increment('bytes_read', self.file_size())
+        if not success:
+            metrics.increment('load_failures')
+        return success
+
+    def log_bad_record(self):
+        """log the line number and content of the record a strict load stopped at
+
+        Lines aren't numbered while loading so the hot path stays as it is; the file is
+        read again up to the first record that doesn't parse, which is the one that
+        stopped the load
+        """
+        parse = self.parser.parse_bytes
+        with self.open_data(self.data_file, binary=True) as data:
+            for line_number, record in enumerate(data, 1):
+                try:
+                    parse(record)
+                except (MalformedLineError, ValueError) as exc:
+                    reason = reject_reason(exc, record, self.parser.find_bad_field)
+                    log_malformed_line(line_number, self.data_file, reason, record)
+                    return
+
+    def discard_rows(self):
+        """take back the rows of a failed load so fixing and re-sending the file doesn't
+        duplicate them; a checkpointed load goes back to where this attempt started"""
+        with self.write_lock:
+            deleted = self.backend.delete_inserted(self.resume_checkpoint)
+        if deleted:
+            logger.warning('deleted the %s rows already inserted from `%s`', deleted, self.data_file)
+        metrics.increment('rows_discarded', deleted)
+        self.rows_inserted = 0
+
+    def file_size(self) -> int:
+        """size of the data file, 0 when it isn't a file on disk"""
+        try:
+            return os.path.getsize(self.data_file)
+        except OSError:
+            return 0
+
+    def estimate_rows(self) -> int:
+        """rough number of records in the data file from its size, None when unknown"""
+        line_width = getattr(self.parser, 'line_width', 0)
+        if not line_width:
+            return None
+        # compressed files come out low, which only makes the backend more cautious
+        return self.file_size() // (line_width + 1)
+
+    def load_with_settings(self) -> bool:
+        """load with the backend's load time settings applied for bulk loads"""
+        if not self.bulk_load:
+            return self.load()
+
+        load = self.load_strategy()
+        with self.write_lock:
+            self.on_insert_thread(load, self.backend.begin_load, self.load_pragmas, self.estimate_rows())
+        try:
+            return load()
+        finally:
+            with self.write_lock:
+                self.on_insert_thread(load, self.backend.end_load)
+
+    def on_insert_thread(self, load, func, *args):
+        """run func on the thread the load's inserts are made from; load time settings
+        belong to the connection, which the backend keeps per thread
+
+        :param load: the run_* method the file is loaded with
+        """
+        if load != self.run_pipeline:
+            return func(*args)
+        from file_loader.pipeline import insert_executor
+        return insert_executor().submit(func, *args).result()
+
+    def load(self) -> bool:
+        """load the file with the strategy for the parser and options in use
+
+        :return: True if every parsed record was inserted
+        """
+        return self.load_strategy()()
+
+    def load_strategy(self):
+        """pick the load strategy for the parser and options in use
+
+        :return: the run_* method that loads the file
+        """
+        # chunked parsers can't skip single records or tell where a record ends, tolerant
+        # and checkpointed loads take the line by line path
+        if self.parser.CHUNKED and self.rejects is None and not self.checkpoint:
+            return self.run_columns
+
+        if self.checkpoint:
+            return self.run_checkpointed
+
+        # compressed files can't be split into byte ranges
+        if self.parse_workers > 1 and detect_compression(self.data_file) is None:
+            return self.run_ranges
+
+        if self.pipeline:
+            return self.run_pipeline
+
+        if self.batch_size:
+            return self.run_batches
+
+        return self.run_whole_file
+
+    def run_whole_file(self) -> bool:
+        """parse the whole file into memory and insert it in one go
+
+        :return: True if every parsed record was inserted
+        """
+        # column storage rather than a dict per row, the whole file is in memory at once
+        with metrics.timer('parse'):
+            rows = self.new_batch()
+            rows.extend(self.iter_values(self.data_file))
+        metrics.increment('lines_parsed', len(rows))
+        self.check_rejects()
+        num_rows_insert = self.insert_values(rows)
+        self.rows_inserted = num_rows_insert
         return num_rows_insert == len(rows)
 
+    def check_rejects(self):
+        """the whole file is parsed; enforce the reject thresholds before inserting anything"""
+        if self.rejects is not None:
+            self.rejects.check(final=True)
+
+    def run_batches(self) -> bool:
+        """streaming version of run; memory is bounded by the batch size rather than
+        the size of the file
+
+        every batch is checked on its own so a short insert is caught as soon as it happens
+
+        :return: True if every batch inserted all of its rows
+        """
+        for batch_number, batch in enumerate(self.iter_value_batches(self.data_file, self.batch_size), 1):
+            metrics.increment('lines_parsed', len(batch))
+            num_rows_insert = self.insert_values(batch)
+            self.rows_inserted += num_rows_insert
+            if num_rows_insert != len(batch):
+                logger.error('Batch %s of `%s` inserted %s of %s rows',
+                             batch_number, self.data_file, num_rows_insert, len(batch))
+                return False
+
+        logger.info('inserted %s rows from `%s`', self.rows_inserted, self.data_file)
+        return True
+
+    @staticmethod
+    def same_file(state: dict, signature: str) -> bool:
+        """whether a saved load state belongs to the file with this signature
+
+        :param state: load state from backend.get_checkpoint
+        :param signature: `size:mtime_ns` of the file about to be loaded
+        """
+        if state['signature'] is None:
+            # saved before signatures were kept, only the size is there to go by
+            return str(state['file_size']) == signature.split(':')[0]
+        return state['signature'] == signature
+
+    def run_checkpointed(self) -> bool:
+        """version of run_batches that saves how far into the file it got with every batch
+
+        The file is always read as bytes so each checkpoint is an exact byte offset to
+        seek back to. A checkpoint is committed in the same transaction as its rows, so
+        after a crash a rerun picks up right after the last committed batch with no
+        rows lost or duplicated.
+
+        :return: True if every batch inserted all of its rows
+        """
+        batch_size = self.batch_size or self.DEFAULT_CHUNK_ROWS
+        file_name = os.path.basename(self.data_file)
+        stat = os.stat(self.data_file)
+        file_size = stat.st_size
+        # a rename (eg// the claim into the processing dir) keeps the mtime, a re-sent file doesn't
+        signature = '%s:%s' % (stat.st_size, stat.st_mtime_ns)
+        with self.write_lock:
+            self.backend.init_load_state()
+            state = self.backend.get_checkpoint(file_name)
+
+        start, rows_done = 0, 0
+        if state is not None and not self.same_file(state, signature):
+            if state['rows']:
+                # the rows already in the table came from a different file; resuming would load
+                # this one from some random offset and starting over would duplicate them
+                logger.error('`%s` is not the file its load state was saved for (%s rows loaded, status %s); '
+                             'delete those rows and its load state to load it', self.data_file, state['rows'],
+                             state['status'])
+                return False
+            logger.warning('`%s` changed since its checkpoint, no rows were loaded from it; loading from the start',
+                           self.data_file)
+        elif state is not None and state['status'] == LOAD_COMPLETE:
+            logger.info('`%s` was already loaded (%s rows); skipping', self.data_file, state['rows'])
+            return True
+        elif state is not None:
+            start, rows_done = state['byte_offset'], state['rows']
+            logger.info('resuming `%s` at byte %s after %s rows', self.data_file, start, rows_done)
+
+        checkpoint = {'file_name': file_name, 'file_size': file_size, 'byte_offset': start,
+                      'rows': rows_done, 'status': LOAD_IN_PROGRESS, 'signature': signature}
+        self.resume_checkpoint = checkpoint
+        parse = self.record_parser(binary=True)
+        # a resumed load doesn't see the start of the file so it can't hash it
+        hasher = self.new_hasher() if start == 0 else None
+        if detect_compression(self.data_file) is None:
+            reader = MmapRecordReader(self.data_file, start, hasher=hasher)
+        else:
+            # offsets are into the decompressed content, a resume decompresses up to it again
+            reader = StreamRecordReader(self.open_data(self.data_file, hasher, binary=True), start)
+        logger.info('opening file `%s`', self.data_file)
+        for batch_number, records in enumerate(batched(reader, batch_size), 1):
+            values = self.parse_records(records, parse)
+            metrics.increment('lines_parsed', len(values))
+            # the reader's offset is the end of the last record in the batch
+            checkpoint = dict(checkpoint, byte_offset=reader.offset, rows=checkpoint['rows'] + len(values))
+            num_rows_insert = self.insert_checkpointed(values, checkpoint)
+            self.rows_inserted += num_rows_insert
+            if num_rows_insert != len(values):
+                logger.error('Batch %s of `%s` inserted %s of %s rows',
+                             batch_number, self.data_file, num_rows_insert, len(values))
+                return False
+
+        if hasher is not None:
+            self.content_hash = hasher.hexdigest()
+        with self.write_lock:
+            self.backend.save_checkpoint(dict(checkpoint, status=LOAD_COMPLETE))
+        logger.info('inserted %s rows from `%s` (%s in total)', self.rows_inserted, self.data_file, checkpoint['rows'])
+        return True
+
+    def run_ranges(self) -> bool:
+        """version of run that parses newline aligned byte ranges of the file in a
+        process pool and merges the results, in file order, into a single load
+
+        Only a few ranges are in flight at once so memory stays bounded by
+        the range size rather than the file size
+
+        :return: True if every line parsed and every batch inserted all of its rows
+        """
+        size = os.path.getsize(self.data_file)
+        parts = max(self.parse_workers, -(-size // self.RANGE_BYTES))
+        ranges = deque(split_ranges(self.data_file, parts))
+        batch_size = self.batch_size or self.DEFAULT_CHUNK_ROWS
+        logger.info('parsing `%s` as %s ranges across %s processes',
+                    self.data_file, len(ranges), self.parse_workers)
+
+        # number of lines in the ranges already merged, turns range line numbers into file line numbers
+        lines_done = 0
+        with ProcessPoolExecutor(max_workers=self.parse_workers) as executor:
+            pending = deque()
+            while ranges or pending:
+                while ranges and len(pending) < self.parse_workers * 2:
+                    start, end = ranges.popleft()
+                    pending.append(executor.submit(
+                        parse_range, self.data_file, self.schema_file, type(self.parser), start, end,
+                        self.rejects is not None))
+
+                values, line_count, rejects = pending.popleft().result()
+                if rejects and self.rejects is None:
+                    line_number, reason, record = rejects[0]
+                    log_malformed_line(lines_done + line_number, self.data_file, reason, record)
+                    for future in pending:
+                        future.cancel()
+                    return False
+                if self.rejects is not None:
+                    self.rejects.lines += line_count
+                    for line_number, reason, record in rejects:
+                        self.rejects.reject(lines_done + line_number, reason, record)
+
+                for ix in range(0, len(values), batch_size):
+                    batch = values[ix:ix + batch_size]
+                    num_rows_insert = self.insert_values(batch)
+                    self.rows_inserted += num_rows_insert
+                    if num_rows_insert != len(batch):
+                        logger.error('Inserted %s of %s rows from `%s`',
+                                     num_rows_insert, len(batch), self.data_file)
+                        return False
+                lines_done += line_count
+                metrics.increment('lines_parsed', line_count)
+
+        logger.info('inserted %s rows from `%s`', self.rows_inserted, self.data_file)
+        return True
+
+    def run_pipeline(self) -> bool:
+        """version of run that reads, parses and inserts batches concurrently
+        with bounded queues between the stages
+
+        :return: True if every batch inserted all of its rows
+        """
+        # asyncio is slow to import and only needed here
+        import asyncio
+        from file_loader.pipeline import AsyncPipeline
+
+        pipeline = AsyncPipeline(self, self.batch_size or self.PIPELINE_BATCH_ROWS, self.queue_size)
+        try:
+            success = asyncio.run(pipeline.run())
+        finally:
+            self.rows_inserted += pipeline.rows_inserted
+            metrics.increment('lines_parsed', pipeline.rows_parsed)
+            self.pipeline_metrics = pipeline.metrics()
+        if success:
+            logger.info('inserted %s rows from `%s`', self.rows_inserted, self.data_file)
+        return success
+
+    def run_columns(self) -> bool:
+        """version of run for chunked parsers which hand back column batches
+        that go straight to the backend
+
+        :return: True if every batch inserted all of its rows
+        """
+        batch_size = self.batch_size or self.DEFAULT_CHUNK_ROWS
+        logger.info('opening file `%s`', self.data_file)
+
+        hasher = self.new_hasher()
+        with self.open_data(self.data_file, hasher, binary=True) as data:
+            for batch_number, columns in enumerate(self.parser.iter_column_batches(data, batch_size), 1):
+                num_rows = len(columns[self.parser.field_names[0]])
+                metrics.increment('lines_parsed', num_rows)
+                with self.write_lock, metrics.timer('insert'):
+                    num_rows_insert = self.backend.insert_columns(columns, self.backend.table)
+                self.rows_inserted += num_rows_insert
+                if num_rows_insert != num_rows:
+                    logger.error('Batch %s of `%s` inserted %s of %s rows',
+                                 batch_number, self.data_file, num_rows_insert, num_rows)
+                    return False
+
+        if hasher is not None:
+            self.content_hash = hasher.hexdigest()
+        logger.info('inserted %s rows from `%s`', self.rows_inserted, self.data_file)
+        return True
+
+    def insert_values(self, values: list) -> int:
+        """send positional value lists, usually a RowBatch, to the backend while holding
+        the write lock; only backends without a positional path turn them into dicts
+
+        :param values: parsed value lists in spec order
+        :return: number of rows the backend inserted
+        """
+        with self.write_lock, metrics.timer('insert'):
+            return self.backend.insert_values(values, self.backend.table)
+
+    def insert_checkpointed(self, values: list, checkpoint: dict) -> int:
+        """insert_values that has the backend commit the checkpoint together with the rows
+
+        :param values: parsed value lists in spec order
+        :param checkpoint: load state after this batch
+        :return: number of rows the backend inserted
+        """
+        with self.write_lock, metrics.timer('insert'):
+            return self.backend.insert_values(values, self.backend.table, checkpoint=checkpoint)
+
     def parse_file(self, data_file_path) -> list:
         """iterate over the file and parse each row
 
         :param data_file: str path denotes the location of the data file
         :return: list of rows parsed according to the schema
         """
-        rows = []
-        logger.info('opening file `%s`', self.data_file)
+        with metrics.timer('parse'):
+            rows = list(self.iter_rows(data_file_path))
+        metrics.increment('lines_parsed', len(rows))
+        return rows
 
-        with open(data_file_path) as data:
-            for line in data:
-                values = self.parser.parse(line)
-                # each row must have NAMED values so a dict is required instead
-                # of a list of values
-                rows.append(dict(zip(self.parser.field_names, values)))
+    def iter_value_batches(self, data_file_path, batch_size: int):
+        """group the parsed values of a file into RowBatches of at most batch_size rows
 
-        return rows
+        :param data_file_path: str path denotes the location of the data file
+        :param batch_size: max number of rows per batch
+        :return: generator of RowBatch
+        """
+        values = self.iter_values(data_file_path)
+        while True:
+            batch = self.new_batch()
+            batch.extend(islice(values, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def new_batch(self) -> RowBatch:
+        """empty RowBatch for the spec being loaded"""
+        return RowBatch(self.parser.field_names, self.parser.data_types)
+
+    def parse_records(self, records: list, parse) -> RowBatch:
+        """parse raw records into a RowBatch, leaving out the ones rejected in tolerant mode
+
+        :param records: raw records from iter_records or a record reader
+        :param parse: line parser from record_parser
+        :return: RowBatch of the parsed rows
+        """
+        batch = self.new_batch()
+        parsed = map(parse, records)
+        batch.extend(parsed if self.rejects is None else filter(None, parsed))
+        return batch
+
+    def iter_rows(self, data_file_path):
+        """lazily parse the file one line at a time
+
+        :param data_file_path: str path denotes the location of the data file
+        :return: generator of rows parsed according to the schema
+        """
+        field_names = self.parser.field_names
+        for values in self.iter_values(data_file_path):
+            # each row must have NAMED values so a dict is required instead
+            # of a list of values
+            yield dict(zip(field_names, values))
+
+    def iter_values(self, data_file_path):
+        """lazily parse the file into lists of values in spec order
+
+        :param data_file_path: str path denotes the location of the data file
+        :return: generator of parsed value lists
+        """
+        logger.info('opening file `%s`', data_file_path)
+
+        if self.parser.CHUNKED and self.rejects is None:
+            with open(data_file_path, 'rb') as data:
+                for columns in self.parser.iter_column_batches(data, self.batch_size or self.DEFAULT_CHUNK_ROWS):
+                    yield from zip(*columns.values())
+            return
+
+        parsed = map(self.record_parser(), self.iter_records(data_file_path))
+        if self.rejects is not None:
+            # rejected records come back as None
+            parsed = filter(None, parsed)
+        yield from parsed
+
+    def record_parser(self, binary: bool = None):
+        """the parser method matching the records produced by iter_records; in tolerant
+        mode bad records are written to the reject file and parse to None
+
+        :param binary: records are bytes, defaults to use_mmap
+        """
+        binary = self.use_mmap if binary is None else binary
+        parse = self.parser.parse_bytes if binary else self.parser.parse
+        if self.rejects is None:
+            return parse
+        return self.rejects.wrap(parse, self.parser.find_bad_field)
+
+    def iter_records(self, data_file_path):
+        """raw, unparsed records of the file: bytes when memory mapped, otherwise text lines
+
+        :param data_file_path: str path denotes the location of the data file
+        :return: generator of records
+        """
+        hasher = self.new_hasher()
+        if self.use_mmap and detect_compression(data_file_path) is None:
+            yield from MmapRecordReader(data_file_path, hasher=hasher)
+        else:
+            # compressed files are streamed, as bytes when memory mapping was asked for
+            with self.open_data(data_file_path, hasher, binary=self.use_mmap) as data:
+                yield from data
+
+        if hasher is not None:
+            self.content_hash = hasher.hexdigest()
+
+    def new_hasher(self):
+        """hashlib object for hash_algorithm, None when the file isn't being hashed"""
+        if self.hash_algorithm is None:
+            return None
+        return hashlib.new(self.hash_algorithm)
+
+    @staticmethod
+    def open_data(data_file_path, hasher: object = None, binary: bool = False):
+        """open the data file, hashing it as it is read when a hasher is given;
+        gzip, bz2 and xz files are decompressed on the fly in a background thread
+
+        :param data_file_path: str path denotes the location of the data file
+        :param hasher: hashlib object or None
+        :param binary: open for bytes instead of text
+        :return: file object
+        """
+        compression = detect_compression(data_file_path)
+        if compression is not None:
+            return open_compressed(data_file_path, compression, hasher, binary=binary)
+        if hasher is None:
+            return open(data_file_path, 'rb' if binary else 'r')
+        return open_hashed(data_file_path, hasher, binary=binary)
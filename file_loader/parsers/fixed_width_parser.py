@@ -1,16 +1,84 @@
 """Fixed Width Parsing"""
 import csv
 import os
+from functools import partial
 
 from file_loader.exceptions import MalformedLineError
 from file_loader.logger import logger
 
 
+def to_boolean(value: str) -> bool:
+    """booleans are stored as 0/1 in the data files"""
+    return bool(int(value))
+
+
+class BooleanLookup(dict):
+    """Maps the common 0/1 values straight to a bool so the hot path is a C level
+    dict lookup; anything else falls back to to_boolean which keeps its semantics
+    (eg// ` 1` -> True, `a` -> ValueError)
+    """
+    def __missing__(self, key):
+        return to_boolean(key)
+
+
+to_boolean_fast = BooleanLookup({'0': False, '1': True}).__getitem__
+
+# distinct raw values a TEXT column may show before the parser stops interning it
+MAX_INTERNED_VALUES = 1024
+
+
+class InternedText(dict):
+    """Maps a raw TEXT field to its stripped value, handing back the same str object
+    every time the value repeats
+
+    Low cardinality columns (status codes, region names, flags) hold a handful of
+    values, so this keeps one str per distinct value instead of a new one per row and
+    the hot path is a C level dict lookup. The first rows of a column are the sample:
+    once it has shown more than `max_values` distinct raw values on_overflow is called
+    so the parser can go back to plain str.strip
+    """
+    def __init__(self, max_values: int = MAX_INTERNED_VALUES, on_overflow=None):
+        """
+
+        :param max_values: distinct raw values kept before giving up
+        :param on_overflow: called once when the column has too many distinct values
+        """
+        super().__init__()
+        self.max_values = max_values
+        self.on_overflow = on_overflow
+        # stripped value -> its shared str, so differently padded raw values share it too
+        self.values = {}
+
+    def __missing__(self, key):
+        value = key.strip()
+        if len(self) >= self.max_values:
+            if self.on_overflow is not None:
+                self.on_overflow()
+                self.on_overflow = None
+            return value
+        value = self[key] = self.values.setdefault(value, value)
+        return value
+
+
+# only supporting these 3 types
+# int() ignores surrounding whitespace on its own so only TEXT needs an explicit strip
+CONVERTERS = {
+    'TEXT': str.strip,
+    'INTEGER': int,
+    'BOOLEAN': to_boolean_fast
+}
+
+
 class FixedWidthParser:
     """Parser class defines how to parse a fixed width file"""
     COLUMN_NAME = 'column name'
     WIDTH = 'width'
     DATA_TYPE = 'datatype'
+    # optional spec column; a true value asks the backend for an index on the column
+    INDEX = 'index'
+    TRUE_VALUES = ('1', 'true', 'yes', 'y')
+    # chunked parsers decode whole blocks of the file instead of single lines
+    CHUNKED = False
 
     def __init__(self, schema_file_path):
         """
@@ -20,6 +88,12 @@ class FixedWidthParser:
         self.field_names = []
         self.widths = []
         self.data_types = []
+        # columns the spec marks as indexed
+        self.indexed_columns = []
+        # filled in by compile_schema once the spec has been read
+        self.line_width = 0
+        self.converters = []
+        self.fields = ()
         self.file_name = schema_file_path
         self.define_schema(schema_file_path)
 
@@ -46,6 +120,50 @@ class FixedWidthParser:
                 self.field_names.append(line.get(self.COLUMN_NAME))
                 self.widths.append(int(line.get(self.WIDTH)))
                 self.data_types.append(line.get(self.DATA_TYPE))
+                if (line.get(self.INDEX) or '').strip().lower() in self.TRUE_VALUES:
+                    self.indexed_columns.append(line.get(self.COLUMN_NAME))
+
+        self.compile_schema()
+
+    def compile_schema(self):
+        """precompute everything parse needs so the per line work is just slicing
+        and calling each column's converter
+
+        self.fields is a tuple of (start, end, converter) for every column
+
+        :return:
+        """
+        self.line_width = sum(self.widths)
+        self.converters = []
+        for ix, data_type in enumerate(self.data_types):
+            try:
+                converter = CONVERTERS[data_type]
+            except KeyError as exc:
+                logger.error('Key Error: no associated converter for `%s`', data_type)
+                raise exc
+            if data_type == 'TEXT':
+                converter = InternedText(MAX_INTERNED_VALUES, partial(self.stop_interning, ix)).__getitem__
+            self.converters.append(converter)
+
+        fields = []
+        position = 0
+        for width, converter in zip(self.widths, self.converters):
+            fields.append((position, position + width, converter))
+            position += width
+        self.fields = tuple(fields)
+
+    def stop_interning(self, field_position: int):
+        """swap a high cardinality TEXT column back to plain str.strip
+
+        :param field_position: position of the column within the data line
+        """
+        logger.info('column `%s` has more than %s distinct values, no longer interning it',
+                    self.field_names[field_position], MAX_INTERNED_VALUES)
+        self.converters[field_position] = str.strip
+        start, end, _ = self.fields[field_position]
+        fields = list(self.fields)
+        fields[field_position] = (start, end, str.strip)
+        self.fields = tuple(fields)
 
     def parse(self, line: str) -> list:
         """
@@ -54,19 +172,39 @@ class FixedWidthParser:
         :return: parsed_values is a parsed list of values to be inserted into the db
         """
         line = line.strip()
-        if len(line) != sum(self.widths):
-            logger.error('Malformed Line <%s> does not match widths %s', line, self.widths)
-            raise MalformedLineError
+        if len(line) != self.line_width:
+            # logging is left to the caller; a tolerant load may see many of these
+            raise MalformedLineError('line is %s characters, the spec is %s' % (len(line), self.line_width))
 
-        parsed_values = []
-        position = 0
         # parse AND validating so as to only iterate over the values once
-        for index in range(len(self.widths)):
-            value = self.convert_type(index, line[position:position + self.widths[index]])
-            parsed_values.append(value)
-            position += self.widths[index]
+        return [converter(line[start:end]) for start, end, converter in self.fields]
+
+    def parse_bytes(self, record: bytes) -> list:
+        """parse a raw record read from a memory mapped file
+
+        The record is decoded once as a whole; one C level decode per record is
+        cheaper than decoding TEXT fields and converting numbers from bytes one at a time
+
+        :param record: a single raw record from the data file
+        :return: parsed_values is a parsed list of values to be inserted into the db
+        """
+        return self.parse(record.decode('utf-8'))
 
-        return parsed_values
+    def find_bad_field(self, record) -> str:
+        """name of the first column whose value can't be converted, for error messages
+
+        :param record: a line (str) or raw record (bytes) that failed to parse
+        :return: column name, None if every column converts
+        """
+        if isinstance(record, bytes):
+            record = record.decode('utf-8', errors='replace')
+        line = record.strip()
+        for name, (start, end, converter) in zip(self.field_names, self.fields):
+            try:
+                converter(line[start:end])
+            except ValueError:
+                return name
+        return None
 
     def convert_type(self, field_position: int, value: str):
         """Covert the value in the row according to the schema file
@@ -75,15 +213,4 @@ class FixedWidthParser:
         :param value: the str from the file that needs to be converted
         :return: type depends on the type converson
         """
-        data_type = self.data_types[field_position]
-        # only supporting these 3 types
-        types = {
-            'TEXT': str,
-            'INTEGER': int,
-            'BOOLEAN': lambda x: bool(int(x))
-        }
-        try:
-            converted_value = types[data_type](value.strip())
-        except ValueError as exc:
-            raise exc
-        return converted_value
+        return self.converters[field_position](value)
@@ -0,0 +1,162 @@
+"""Vectorized fixed width parsing with NumPy
+
+Only usable when every record in a file has the same length. A chunk of records is
+viewed as a NumPy structured array with one fixed size bytes field per spec column
+so type conversion and width validation happen once per chunk instead of once per line.
+"""
+import io
+
+from file_loader.exceptions import MalformedLineError, UnsupportedFileType
+from file_loader.logger import logger
+from file_loader.parsers.fixed_width_parser import FixedWidthParser
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover - numpy is an optional dependency
+    numpy = None
+
+
+class NumpyFixedWidthParser(FixedWidthParser):
+    """Parser class that decodes whole chunks of a fixed width file into columns"""
+    # tells the Parser to hand over the open file instead of individual lines
+    CHUNKED = True
+    TERMINATOR_FIELD = '__terminator__'
+
+    def __init__(self, schema_file_path):
+        """
+
+        :param schema_file_path: path to schema file
+        """
+        if numpy is None:
+            logger.error('The numpy engine requires numpy to be installed')
+            raise UnsupportedFileType
+        super().__init__(schema_file_path)
+
+    def record_dtype(self, terminator: bytes):
+        """structured dtype for one record: a bytes field per column plus the line terminator
+
+        :param terminator: the line ending used by the file eg// b'\\n'
+        :return: numpy dtype
+        """
+        fields = [('f%s' % ix, 'S%s' % width) for ix, width in enumerate(self.widths)]
+        fields.append((self.TERMINATOR_FIELD, 'S%s' % len(terminator)))
+        return numpy.dtype(fields)
+
+    @staticmethod
+    def detect_terminator(data) -> bytes:
+        """look at the first line of the file to see if it uses \\n or \\r\\n
+
+        :param data: binary file object, its position is restored afterwards
+        :return: the terminator bytes
+        """
+        if not data.seekable():
+            # eg// a decompressed stream; look at the buffered bytes without consuming them
+            first_line = data.peek(io.DEFAULT_BUFFER_SIZE).split(b'\n', 1)[0] + b'\n'
+            return b'\r\n' if first_line.endswith(b'\r\n') else b'\n'
+
+        position = data.tell()
+        first_line = data.readline()
+        data.seek(position)
+        if first_line.endswith(b'\r\n'):
+            return b'\r\n'
+        return b'\n'
+
+    def iter_column_batches(self, data, batch_size: int):
+        """read the file batch_size records at a time and decode each chunk into columns
+
+        :param data: binary file object positioned at the first record
+        :param batch_size: number of records per chunk
+        :return: generator of dicts of column name -> list of values
+        """
+        terminator = self.detect_terminator(data)
+        dtype = self.record_dtype(terminator)
+        chunk_size = dtype.itemsize * batch_size
+        first_line_number = 1
+
+        while True:
+            chunk = data.read(chunk_size)
+            if not chunk:
+                break
+            # the final record may be missing its line terminator
+            if len(chunk) % dtype.itemsize and chunk[-len(terminator):] != terminator:
+                chunk += terminator
+            yield self.parse_chunk(chunk, dtype, terminator, first_line_number)
+            first_line_number += len(chunk) // dtype.itemsize
+
+    def parse_chunk(self, chunk: bytes, dtype, terminator: bytes, first_line_number: int = 1) -> dict:
+        """decode a chunk of whole records
+
+        :param chunk: raw bytes holding a whole number of records
+        :param dtype: structured dtype from record_dtype
+        :param terminator: the line ending used by the file
+        :param first_line_number: line number of the first record, used for error messages
+        :return: dict of column name -> list of values
+        """
+        if len(chunk) % dtype.itemsize:
+            logger.error('Malformed chunk starting at line %s: %s bytes is not a multiple of '
+                         'the record length %s', first_line_number, len(chunk), dtype.itemsize)
+            raise MalformedLineError
+
+        records = numpy.frombuffer(chunk, dtype=dtype)
+        # the same memory as a 2d array of bytes, one row per record
+        raw = numpy.frombuffer(chunk, dtype=numpy.uint8).reshape(-1, dtype.itemsize)
+
+        # every record must end exactly where the spec says it should
+        bad_records = numpy.flatnonzero(records[self.TERMINATOR_FIELD] != terminator)
+        if len(bad_records):
+            logger.error('Malformed Line %s does not match widths %s',
+                         first_line_number + int(bad_records[0]), self.widths)
+            raise MalformedLineError
+
+        columns = {}
+        for ix, (name, data_type) in enumerate(zip(self.field_names, self.data_types)):
+            start, end, _ = self.fields[ix]
+            try:
+                columns[name] = self.convert_column(records['f%s' % ix], raw[:, start:end], data_type)
+            except ValueError as exc:
+                logger.error('Column `%s` has values that cannot be converted to %s '
+                             '(chunk starting at line %s)', name, data_type, first_line_number)
+                raise exc
+        return columns
+
+    @staticmethod
+    def convert_column(column, column_bytes, data_type: str) -> list:
+        """vectorized version of convert_type for a whole column
+
+        :param column: numpy array of fixed size bytes
+        :param column_bytes: the same column as a 2d uint8 array, one row per record
+        :param data_type: one of the supported spec data types
+        :return: list of python values
+        """
+        if data_type == 'INTEGER':
+            return NumpyFixedWidthParser.to_integers(column, column_bytes).tolist()
+        if data_type == 'BOOLEAN':
+            return (NumpyFixedWidthParser.to_integers(column, column_bytes) != 0).tolist()
+        if data_type == 'TEXT':
+            try:
+                # ascii only columns can skip the much slower codec based decode
+                text = column.astype('U%s' % column.dtype.itemsize)
+            except UnicodeDecodeError:
+                text = numpy.char.decode(column, 'utf-8')
+            return numpy.char.strip(text).tolist()
+        logger.error('Key Error: no associated converter for `%s`', data_type)
+        raise KeyError(data_type)
+
+    @staticmethod
+    def to_integers(column, column_bytes):
+        """convert a column of fixed size bytes to int64
+
+        Columns made up entirely of digits (zero padded values) are converted with
+        plain arithmetic on the raw bytes; anything else (spaces, signs, bad values)
+        goes through numpy's string cast which also raises the ValueError for bad data
+
+        :param column: numpy array of fixed size bytes
+        :param column_bytes: the same column as a 2d uint8 array, one row per record
+        :return: numpy int64 array
+        """
+        width = column.dtype.itemsize
+        # 18 digits always fits in an int64
+        if width <= 18 and ((column_bytes >= 48) & (column_bytes <= 57)).all():
+            powers = 10 ** numpy.arange(width - 1, -1, -1, dtype=numpy.int64)
+            return (column_bytes - 48).astype(numpy.int64) @ powers
+        return column.astype(numpy.int64)
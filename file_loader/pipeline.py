@@ -0,0 +1,212 @@
+"""asyncio pipeline that overlaps reading, parsing and inserting a file
+
+    read --(raw queue)--> parse --(parsed queue)--> insert
+
+Each stage runs its blocking work in its own thread so disk reads and database
+writes (both release the GIL) overlap with parsing. The insert thread outlives the
+pipeline: every pipelined load in the process inserts from the same thread, so they all
+reuse its one registry connection and the bulk load settings applied to it. The queues are bounded so a slow
+stage makes the stages in front of it wait instead of letting memory grow.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from file_loader.logger import logger
+
+# set by insert_executor, for the process that started it
+_insert_executor = None
+_insert_pid = None
+
+
+def insert_executor() -> ThreadPoolExecutor:
+    """the process' insert thread, started on first use; a forked child starts its own"""
+    global _insert_executor, _insert_pid
+    if _insert_executor is None or _insert_pid != os.getpid():
+        _insert_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='pipeline-insert')
+        _insert_pid = os.getpid()
+    return _insert_executor
+
+
+class QueueMetrics:
+    """Depth samples for one queue, taken every time an item is put on it"""
+
+    def __init__(self, name: str, maxsize: int):
+        self.name = name
+        self.maxsize = maxsize
+        self.samples = 0
+        self.total_depth = 0
+        self.max_depth = 0
+        # number of puts that found the queue full, ie// the consumer is the bottleneck
+        self.full = 0
+
+    def sample(self, depth: int):
+        self.samples += 1
+        self.total_depth += depth
+        self.max_depth = max(self.max_depth, depth)
+
+    @property
+    def average_depth(self) -> float:
+        return self.total_depth / self.samples if self.samples else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'maxsize': self.maxsize,
+            'average_depth': self.average_depth,
+            'max_depth': self.max_depth,
+            'full': self.full,
+        }
+
+
+class StageMetrics:
+    """Time a stage spends working versus waiting on its neighbours"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'batches': self.batches,
+            'busy_seconds': self.busy_seconds,
+            'wait_seconds': self.wait_seconds,
+        }
+
+
+class AsyncPipeline:
+    """Loads one file through a Parser with reading, parsing and inserting overlapped"""
+    DONE = None
+
+    def __init__(self, parser: object, batch_size: int, queue_size: int = 4):
+        """
+
+        :param parser: Parser instance; supplies the records, the line parser and the insert
+        :param batch_size: number of records that move through the pipeline together
+        :param queue_size: max batches waiting between two stages
+        """
+        self.parser = parser
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.queues = {
+            'raw': QueueMetrics('raw', queue_size),
+            'parsed': QueueMetrics('parsed', queue_size),
+        }
+        self.stages = {name: StageMetrics(name) for name in ('read', 'parse', 'insert')}
+        self.rows_parsed = 0
+        self.rows_inserted = 0
+        # one thread per stage so a stage never waits behind another stage's work
+        self.executors = {name: ThreadPoolExecutor(max_workers=1) for name in ('read', 'parse')}
+        self.executors['insert'] = insert_executor()
+
+    async def put(self, queue: asyncio.Queue, name: str, item):
+        """put with backpressure, recording the queue depth"""
+        if queue.full():
+            self.queues[name].full += 1
+        await queue.put(item)
+        self.queues[name].sample(queue.qsize())
+
+    async def get(self, queue: asyncio.Queue, stage: str):
+        """get, recording how long the stage sat waiting for work"""
+        start = time.perf_counter()
+        item = await queue.get()
+        self.stages[stage].wait_seconds += time.perf_counter() - start
+        return item
+
+    async def work(self, stage: str, func, *args):
+        """run blocking work on the stage's thread"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        result = await loop.run_in_executor(self.executors[stage], func, *args)
+        self.stages[stage].busy_seconds += time.perf_counter() - start
+        self.stages[stage].batches += 1
+        return result
+
+    async def read_stage(self, raw: asyncio.Queue, records):
+        while True:
+            chunk = await self.work('read', lambda: list(islice(records, self.batch_size)))
+            if not chunk:
+                break
+            start = time.perf_counter()
+            await self.put(raw, 'raw', chunk)
+            self.stages['read'].wait_seconds += time.perf_counter() - start
+        await raw.put(self.DONE)
+
+    async def parse_stage(self, raw: asyncio.Queue, parsed: asyncio.Queue):
+        parse = self.parser.record_parser()
+        while True:
+            chunk = await self.get(raw, 'parse')
+            if chunk is self.DONE:
+                break
+            values = await self.work('parse', self.parser.parse_records, chunk, parse)
+            self.rows_parsed += len(values)
+            start = time.perf_counter()
+            await self.put(parsed, 'parsed', values)
+            self.stages['parse'].wait_seconds += time.perf_counter() - start
+        await parsed.put(self.DONE)
+
+    async def insert_stage(self, parsed: asyncio.Queue) -> bool:
+        while True:
+            values = await self.get(parsed, 'insert')
+            if values is self.DONE:
+                return True
+            num_rows_insert = await self.work('insert', self.parser.insert_values, values)
+            self.rows_inserted += num_rows_insert
+            if num_rows_insert != len(values):
+                logger.error('Inserted %s of %s rows from `%s`',
+                             num_rows_insert, len(values), self.parser.data_file)
+                return False
+
+    async def run(self) -> bool:
+        """run all three stages to completion
+
+        :return: True if every batch inserted all of its rows
+        """
+        raw = asyncio.Queue(self.queue_size)
+        parsed = asyncio.Queue(self.queue_size)
+        records = self.parser.iter_records(self.parser.data_file)
+        insert = asyncio.ensure_future(self.insert_stage(parsed))
+        pending = {
+            asyncio.ensure_future(self.read_stage(raw, records)),
+            asyncio.ensure_future(self.parse_stage(raw, parsed)),
+            insert,
+        }
+        tasks = set(pending)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # a failed stage would leave its neighbours blocked on a queue forever
+                    if task.exception() is not None:
+                        raise task.exception()
+                if insert in done and not insert.result():
+                    return False
+            return True
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # threads may still be finishing a batch; wait for them before closing the file
+            for name in ('read', 'parse'):
+                self.executors[name].shutdown(wait=True)
+            # the insert thread is shared, anything queued on it runs after the batch in flight
+            self.executors['insert'].submit(lambda: None).result()
+            records.close()
+            self.log_metrics()
+
+    def metrics(self) -> dict:
+        return {
+            'queues': {name: queue.as_dict() for name, queue in self.queues.items()},
+            'stages': {name: stage.as_dict() for name, stage in self.stages.items()},
+        }
+
+    def log_metrics(self):
+        for name, stage in self.stages.items():
+            logger.info('pipeline stage %s: %s batches, busy %.3fs, waiting %.3fs',
+                        name, stage.batches, stage.busy_seconds, stage.wait_seconds)
+        for name, queue in self.queues.items():
+            logger.info('pipeline queue %s: average depth %.2f/%s, max %s, full %s times',
+                        name, queue.average_depth, queue.maxsize, queue.max_depth, queue.full)
@@ -0,0 +1,101 @@
+"""Registries of the file type parsers and backends the loader can use
+
+Plugins are referenced by `module:attribute` paths and only imported when one is
+asked for, so a run only pays for the parser and backend it actually uses (sqlalchemy
+and numpy are slow to import). New ones can be added without touching this package,
+either from code:
+
+    file_types.register('csv', 'my_package.parsers:CsvParser')
+
+or by an installed package declaring an entry point in one of the groups below:
+
+    entry_points={'file_loader.file_types': ['csv = my_package.parsers:CsvParser']}
+"""
+from importlib import import_module
+from importlib.metadata import entry_points
+
+from file_loader.logger import logger
+
+
+class PluginRegistry:
+    """Maps plugin names to lazily imported classes; reads like a dict"""
+
+    def __init__(self, group: str, builtins: dict):
+        """
+
+        :param group: entry point group other packages register plugins under
+        :param builtins: name -> `module:attribute` path of the plugins shipped with the loader
+        """
+        self.group = group
+        self.paths = dict(builtins)
+        self.loaded = {}
+        self.entry_points_loaded = False
+
+    def register(self, name: str, plugin):
+        """add or replace a plugin
+
+        :param name: key used on the command line eg// `fixed_width`
+        :param plugin: the class itself or its `module:attribute` path
+        """
+        self.load_entry_points()
+        self.loaded.pop(name, None)
+        if isinstance(plugin, str):
+            self.paths[name] = plugin
+        else:
+            self.paths[name] = '%s:%s' % (plugin.__module__, plugin.__qualname__)
+            self.loaded[name] = plugin
+
+    def load_entry_points(self):
+        """pick up the plugins installed packages declare, once; built in names win"""
+        if self.entry_points_loaded:
+            return
+        self.entry_points_loaded = True
+        for entry_point in entry_points(group=self.group):
+            self.paths.setdefault(entry_point.name, entry_point.value)
+
+    def keys(self) -> list:
+        self.load_entry_points()
+        return list(self.paths)
+
+    def get(self, name: str, default=None):
+        """import the plugin on first use
+
+        :return: the plugin class, default when no plugin has the name
+        """
+        if name in self.loaded:
+            return self.loaded[name]
+        if name not in self.paths:
+            self.load_entry_points()
+        path = self.paths.get(name)
+        if path is None:
+            return default
+
+        module_name, _, attribute = path.partition(':')
+        plugin = import_module(module_name)
+        for part in attribute.split('.') if attribute else ():
+            plugin = getattr(plugin, part)
+        logger.debug('loaded %s plugin `%s` from `%s`', self.group, name, path)
+        self.loaded[name] = plugin
+        return plugin
+
+    def __getitem__(self, name: str):
+        plugin = self.get(name)
+        if plugin is None:
+            raise KeyError(name)
+        return plugin
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+file_types = PluginRegistry('file_loader.file_types', {
+    'fixed_width': 'file_loader.parsers.fixed_width_parser:FixedWidthParser',
+    'fixed_width_numpy': 'file_loader.parsers.numpy_parser:NumpyFixedWidthParser',
+})
+
+backends = PluginRegistry('file_loader.backends', {
+    'sqlite': 'file_loader.backends.sqlite:SqlLiteBackend',
+})
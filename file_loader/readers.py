@@ -0,0 +1,348 @@
+"""Readers that walk a data file one record at a time
+"""
+import hashlib
+import io
+import mmap
+import os
+import queue
+import re
+import threading
+from importlib import import_module
+
+# bytes read at a time when a file is hashed on its own
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# compression -> (module with an `open` for file objects, file name suffixes, pattern of the first bytes)
+COMPRESSIONS = {
+    'gzip': ('gzip', ('.gz', '.gzip'), re.compile(b'\x1f\x8b')),
+    # `BZh` alone starts plenty of text records: block size digit, then the magic of the
+    # first block (or of the end of stream for empty input)
+    'bz2': ('bz2', ('.bz2',), re.compile(b'BZh[1-9](1AY&SY|\x17rE8P\x90)')),
+    'xz': ('lzma', ('.xz',), re.compile(b'\xfd7zXZ\x00')),
+}
+# decompressed bytes per chunk handed from the decompression thread to the reader
+DECOMPRESS_CHUNK_BYTES = 1024 * 1024
+# chunks the decompression thread may get ahead of the reader by
+DECOMPRESS_QUEUE_CHUNKS = 4
+
+
+class MmapRecordReader:
+    """Iterate over the newline terminated records of a file as bytes
+
+    The file is memory mapped so records are sliced straight out of the page cache
+    instead of going through a buffered text reader that decodes every line.
+    `offset` always points at the first byte after the last record handed out.
+    A record belongs to the reader if it starts before `end`.
+    """
+    def __init__(self, path: str, start: int = 0, end: int = None, hasher: object = None):
+        """
+
+        :param path: data file to read
+        :param start: byte offset of the first record to read
+        :param end: stop before this byte offset, defaults to the end of the file
+        :param hasher: hashlib object updated with every record handed out
+        """
+        self.path = path
+        self.start = start
+        self.end = end
+        self.offset = start
+        self.hasher = hasher
+
+    def __iter__(self):
+        with open(self.path, 'rb') as data:
+            size = os.fstat(data.fileno()).st_size
+            end = size if self.end is None else min(self.end, size)
+            # mmap refuses to map an empty file
+            if end <= self.start:
+                return
+
+            with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, 'madvise'):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+
+                # mmap.readline does the newline search and slice in C which is
+                # several times faster than find() + slicing in python
+                mapped.seek(self.start)
+                readline = mapped.readline
+                position = self.start
+                if self.hasher is not None:
+                    update = self.hasher.update
+                    while position < end:
+                        record = readline()
+                        update(record)
+                        position += len(record)
+                        self.offset = position
+                        yield record
+                    return
+
+                while position < end:
+                    record = readline()
+                    position += len(record)
+                    self.offset = position
+                    yield record
+
+
+class HashingReader(io.RawIOBase):
+    """Raw binary stream that hashes everything read through it
+
+    Wrap it in io.BufferedReader (and io.TextIOWrapper for text) so a file is hashed
+    in the same pass that reads it instead of being read a second time. Seeking back
+    and reading the same bytes again doesn't hash them twice; the stream is expected
+    to be read through to the end without seeking forward.
+    """
+    def __init__(self, raw, hasher):
+        """
+
+        :param raw: binary file object to read from
+        :param hasher: hashlib object to update
+        """
+        super().__init__()
+        self.raw = raw
+        self.hasher = hasher
+        self.position = 0
+        # everything before this offset has been hashed
+        self.hashed_to = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return self.raw.seekable()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.position = self.raw.seek(offset, whence)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        start = self.position
+        count = self.raw.readinto(buffer)
+        if count:
+            self.position += count
+            if self.position > self.hashed_to:
+                self.hasher.update(memoryview(buffer)[max(0, self.hashed_to - start):count])
+                self.hashed_to = self.position
+        return count
+
+    def close(self):
+        self.raw.close()
+        super().close()
+
+
+def open_hashed(path: str, hasher, binary: bool = False):
+    """open a file for reading with every byte read going through hasher
+
+    :param path: file to open
+    :param hasher: hashlib object to update
+    :param binary: return a buffered binary reader instead of a text reader
+    :return: file object
+    """
+    data = io.BufferedReader(HashingReader(open(path, 'rb', buffering=0), hasher))
+    if binary:
+        return data
+    return io.TextIOWrapper(data)
+
+
+def detect_compression(path: str) -> str:
+    """compression of a data file, from its suffix or else its first bytes
+
+    :param path: data file
+    :return: key of COMPRESSIONS, None for an uncompressed (or missing) file
+    """
+    lower_path = path.lower()
+    for compression, (_, suffixes, _) in COMPRESSIONS.items():
+        if lower_path.endswith(suffixes):
+            return compression
+
+    try:
+        with open(path, 'rb') as data:
+            head = data.read(10)
+    except OSError:
+        return None
+    for compression, (_, _, magic) in COMPRESSIONS.items():
+        if magic.match(head):
+            return compression
+    return None
+
+
+def strip_compression_suffix(file_name: str) -> str:
+    """`vendor_2018-01-01.txt.gz` -> `vendor_2018-01-01.txt`"""
+    lower_name = file_name.lower()
+    for _, suffixes, _ in COMPRESSIONS.values():
+        for suffix in suffixes:
+            if lower_name.endswith(suffix):
+                return file_name[:-len(suffix)]
+    return file_name
+
+
+class DecompressingReader(io.RawIOBase):
+    """Raw binary stream of the decompressed content of a file
+
+    A background thread decompresses the file into a bounded queue of chunks so the
+    decompression overlaps with whatever is parsing the stream (zlib, bz2 and lzma
+    release the GIL while they work). The compressed bytes can be hashed on the way
+    in, which gives the same digest as hash_file of the file on disk.
+    """
+    def __init__(self, path: str, compression: str, hasher: object = None,
+                 chunk_bytes: int = DECOMPRESS_CHUNK_BYTES, queue_chunks: int = DECOMPRESS_QUEUE_CHUNKS):
+        """
+
+        :param path: compressed data file
+        :param compression: key of COMPRESSIONS
+        :param hasher: hashlib object updated with the compressed bytes
+        :param chunk_bytes: decompressed bytes per chunk
+        :param queue_chunks: max chunks waiting to be read
+        """
+        super().__init__()
+        module_name = COMPRESSIONS[compression][0]
+        if hasher is None:
+            self.compressed = open(path, 'rb')
+        else:
+            self.compressed = io.BufferedReader(HashingReader(open(path, 'rb', buffering=0), hasher))
+        self.source = import_module(module_name).open(self.compressed, 'rb')
+        self.chunk_bytes = chunk_bytes
+        self.chunks = queue.Queue(queue_chunks)
+        self.stopped = threading.Event()
+        # part of the last chunk not read yet
+        self.pending = memoryview(b'')
+        self.finished = False
+        self.thread = threading.Thread(target=self.decompress, name='decompress %s' % os.path.basename(path),
+                                       daemon=True)
+        self.thread.start()
+
+    def decompress(self):
+        """thread body: push decompressed chunks, then b'' at the end or the exception raised"""
+        try:
+            while not self.stopped.is_set():
+                chunk = self.source.read(self.chunk_bytes)
+                self.put(chunk)
+                if not chunk:
+                    return
+        except Exception as exc:
+            self.put(exc)
+
+    def put(self, item):
+        # wait for room in the queue, but give up once the reader has been closed
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self.pending:
+            if self.finished:
+                return 0
+            item = self.chunks.get()
+            if isinstance(item, Exception):
+                self.finished = True
+                raise item
+            if not item:
+                self.finished = True
+                return 0
+            self.pending = memoryview(item)
+
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+    def close(self):
+        if not self.closed:
+            self.stopped.set()
+            self.thread.join()
+            self.source.close()
+            self.compressed.close()
+        super().close()
+
+
+def open_compressed(path: str, compression: str, hasher: object = None, binary: bool = False):
+    """open a compressed file for reading its decompressed content
+
+    :param path: compressed data file
+    :param compression: key of COMPRESSIONS
+    :param hasher: hashlib object updated with the compressed bytes, or None
+    :param binary: return a buffered binary reader instead of a text reader
+    :return: file object, not seekable
+    """
+    data = io.BufferedReader(DecompressingReader(path, compression, hasher), DECOMPRESS_CHUNK_BYTES)
+    if binary:
+        return data
+    return io.TextIOWrapper(data)
+
+
+class StreamRecordReader:
+    """Iterate over the records of a binary stream with the same `offset` tracking as
+    MmapRecordReader, for files that can't be memory mapped eg// compressed ones
+
+    Records before `start` are read and dropped since the stream can't seek
+    """
+    def __init__(self, data, start: int = 0):
+        """
+
+        :param data: binary file object positioned at the start of the content
+        :param start: offset into the content of the first record to hand out
+        """
+        self.data = data
+        self.start = start
+        self.offset = start
+
+    def __iter__(self):
+        position = 0
+        with self.data:
+            for record in self.data:
+                position += len(record)
+                if position <= self.start:
+                    continue
+                self.offset = position
+                yield record
+
+
+def hash_file(path: str, algorithm: str) -> str:
+    """hash a whole file on its own, for when it can't be hashed while loading
+
+    :param path: file to hash
+    :param algorithm: hashlib algorithm name eg// `sha256`
+    :return: hex digest
+    """
+    hasher = hashlib.new(algorithm)
+    with open(path, 'rb') as data:
+        for chunk in iter(lambda: data.read(HASH_CHUNK_BYTES), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def split_ranges(path: str, parts: int) -> list:
+    """split a file into roughly equal byte ranges that start and end on record boundaries
+
+    :param path: data file to split
+    :param parts: number of ranges wanted; small files may produce fewer
+    :return: list of (start, end) byte offsets covering the whole file
+    """
+    size = os.path.getsize(path)
+    if size == 0:
+        return []
+
+    boundaries = [0]
+    with open(path, 'rb') as data:
+        for part in range(1, parts):
+            target = size * part // parts
+            if target <= boundaries[-1]:
+                continue
+            # move forward to the start of the next record
+            data.seek(target - 1)
+            data.readline()
+            boundary = data.tell()
+            if boundary >= size:
+                break
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    boundaries.append(size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
@@ -0,0 +1,118 @@
+"""Tolerant loading: bad records go to a reject file instead of failing the load
+
+The reject file is a csv of `line, reason, record` rows. It is only created once the
+first record is rejected and is written through a large buffer so a file full of bad
+lines doesn't turn into a write per line.
+"""
+import csv
+import os
+
+from file_loader.exceptions import ErrorThresholdExceeded, MalformedLineError
+from file_loader.logger import logger
+
+
+def reject_reason(exc: Exception, record, find_bad_field=None) -> str:
+    """readable reason a record was rejected
+
+    :param exc: MalformedLineError or ValueError raised while parsing the record
+    :param record: the raw record as str or bytes
+    :param find_bad_field: function of a record -> name of the column that failed to convert
+    :return: reason string for the reject file
+    """
+    reason = str(exc) or type(exc).__name__
+    if isinstance(exc, ValueError) and find_bad_field is not None:
+        field = find_bad_field(record)
+        if field is not None:
+            return 'column `%s`: %s' % (field, reason)
+    return reason
+
+
+class RejectHandler:
+    """Counts parsed and rejected records and writes the rejected ones out
+
+    The load is stopped with ErrorThresholdExceeded once more than `max_errors`
+    records were rejected, or more than `max_error_rate` of the records seen so far
+    (only checked after `min_lines` records so one early bad line doesn't stop a load)
+    """
+    HEADER = ('line', 'reason', 'record')
+    BUFFER_BYTES = 1024 * 1024
+
+    def __init__(self, reject_file: str, max_errors: int = None, max_error_rate: float = None,
+                 min_lines: int = 1000):
+        """
+
+        :param reject_file: csv file the rejected records are written to
+        :param max_errors: most rejected records allowed, None for no limit
+        :param max_error_rate: largest share of rejected records allowed eg// 0.01, None for no limit
+        :param min_lines: records to see before the rate is enforced
+        """
+        self.reject_file = reject_file
+        self.max_errors = max_errors
+        self.max_error_rate = max_error_rate
+        self.min_lines = min_lines
+        self.lines = 0
+        self.errors = 0
+        self.output = None
+        self.writer = None
+
+    def wrap(self, parse, find_bad_field=None):
+        """line parser that hands back None for records it rejects instead of raising
+
+        records must be passed in file order; the count of calls is the line number
+
+        :param parse: parse or parse_bytes of a line parser
+        :param find_bad_field: function of a record -> name of the column that failed to convert
+        :return: function of a record -> parsed values or None
+        """
+        def parse_tolerant(record):
+            self.lines += 1
+            try:
+                return parse(record)
+            except (MalformedLineError, ValueError) as exc:
+                self.reject(self.lines, reject_reason(exc, record, find_bad_field), record)
+                return None
+        return parse_tolerant
+
+    def reject(self, line_number: int, reason, record):
+        """write a rejected record out and stop the load if there are too many
+
+        :param line_number: line of the record in the data file
+        :param reason: why the record was rejected
+        :param record: the raw record as str or bytes
+        """
+        if self.writer is None:
+            directory = os.path.dirname(self.reject_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.output = open(self.reject_file, 'w', newline='', buffering=self.BUFFER_BYTES)
+            self.writer = csv.writer(self.output)
+            self.writer.writerow(self.HEADER)
+
+        if isinstance(record, bytes):
+            record = record.decode('utf-8', errors='replace')
+        self.writer.writerow((line_number, reason, record.rstrip('\r\n')))
+        self.errors += 1
+        self.check()
+
+    def check(self, final: bool = False):
+        """raise ErrorThresholdExceeded when a threshold is crossed
+
+        :param final: the whole file has been seen, enforce the rate regardless of min_lines
+        """
+        if self.max_errors is not None and self.errors > self.max_errors:
+            raise ErrorThresholdExceeded('%s rejected records, more than the %s allowed' % (
+                self.errors, self.max_errors))
+        if self.max_error_rate is not None and self.lines and (final or self.lines >= self.min_lines):
+            rate = self.errors / self.lines
+            if rate > self.max_error_rate:
+                raise ErrorThresholdExceeded('%s of %s records rejected (%.2f%%), more than the %.2f%% allowed' % (
+                    self.errors, self.lines, rate * 100, self.max_error_rate * 100))
+
+    def close(self):
+        """flush the reject file and log how many records ended up in it"""
+        if self.output is not None:
+            self.output.close()
+            self.output = None
+            self.writer = None
+        if self.errors:
+            logger.warning('rejected %s of %s records, see `%s`', self.errors, self.lines, self.reject_file)
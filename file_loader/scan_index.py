@@ -0,0 +1,126 @@
+"""Persistent index of the files waiting in the data dir
+
+Listing the data dir, stat'ing every entry and parsing every file name again on each
+run adds up with tens of thousands of pending files. The index keeps what the last scan
+found in a json file:
+
+- when the data dir's mtime hasn't changed since the last scan no file was added,
+  removed or renamed, so the indexed names are returned without reading the dir at all
+- otherwise the dir is read once with os.scandir and only entries that are new or whose
+  size/mtime/inode changed have their name parsed again
+
+Pending files are also grouped by (file type, drop date) for whatever schedules them.
+"""
+import json
+import os
+import time
+
+from file_loader.exceptions import InvalidFileNameFormat
+from file_loader.file_handler import FileHandler
+from file_loader.logger import logger
+from file_loader.metrics import metrics, write_atomic
+
+# a dir modified this close to the last scan may have changed within the same mtime
+# tick as the scan, so the mtime shortcut isn't trusted for it
+MTIME_SLACK_NS = 2 * 10 ** 9
+
+
+class ScanIndex:
+    """Files in the data dir with their size, mtime, inode, file type and drop date"""
+    # bumped whenever what file_group returns changes, eg// drop dates normalised to YYYY-MM-dd
+    VERSION = 2
+
+    def __init__(self, data_dir: str, index_file: str, parse_file_name: object = None):
+        """
+
+        :param data_dir: directory to scan
+        :param index_file: json file the index is kept in, outside the data dir since
+        writing it would change the dir's mtime
+        :param parse_file_name: function mapping a file name to (file type, drop date),
+        FileHandler.parse_file_name by default
+        """
+        self.data_dir = os.path.abspath(data_dir)
+        self.index_file = index_file
+        self.parse_file_name = parse_file_name or FileHandler.parse_file_name
+        # name -> [size, mtime_ns, inode, file_type, drop_date]
+        self.entries = {}
+        self.dir_mtime_ns = None
+        self.scanned_at_ns = 0
+        self.load()
+
+    def load(self):
+        """read the index file; a missing, unreadable or foreign one just means a full scan"""
+        try:
+            with open(self.index_file) as index:
+                state = json.load(index)
+        except (OSError, ValueError):
+            return
+        if state.get('version') != self.VERSION or state.get('data_dir') != self.data_dir:
+            logger.info('scan index `%s` is for another data dir or version, rebuilding it', self.index_file)
+            return
+        self.entries = state['entries']
+        self.dir_mtime_ns = state['dir_mtime_ns']
+        self.scanned_at_ns = state['scanned_at_ns']
+
+    def save(self):
+        write_atomic(self.index_file, json.dumps({
+            'version': self.VERSION,
+            'data_dir': self.data_dir,
+            'dir_mtime_ns': self.dir_mtime_ns,
+            'scanned_at_ns': self.scanned_at_ns,
+            'entries': self.entries,
+        }))
+
+    def scan(self) -> list:
+        """bring the index up to date with the data dir
+
+        :return: sorted names of the files in the data dir
+        """
+        with metrics.timer('scan'):
+            dir_mtime_ns = os.stat(self.data_dir).st_mtime_ns
+            if dir_mtime_ns == self.dir_mtime_ns and dir_mtime_ns < self.scanned_at_ns - MTIME_SLACK_NS:
+                metrics.increment('scan_index_unchanged')
+                return sorted(self.entries)
+
+            scanned_at_ns = time.time_ns()
+            entries, parsed = {}, 0
+            with os.scandir(self.data_dir) as dir_entries:
+                for dir_entry in dir_entries:
+                    # d_type from the listing, no stat for subdirs such as loaded/ and failed/
+                    if not dir_entry.is_file():
+                        continue
+                    stat = dir_entry.stat()
+                    known = self.entries.get(dir_entry.name)
+                    key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+                    if known is not None and known[:3] == key:
+                        entries[dir_entry.name] = known
+                        continue
+                    entries[dir_entry.name] = key + list(self.file_group(dir_entry.name))
+                    parsed += 1
+
+            logger.info('scanned `%s`: %s files, %s new or changed, %s gone', self.data_dir, len(entries),
+                        parsed, len(set(self.entries) - set(entries)))
+            metrics.increment('scan_files_parsed', parsed)
+            self.entries = entries
+            self.dir_mtime_ns = dir_mtime_ns
+            self.scanned_at_ns = scanned_at_ns
+            self.save()
+        return sorted(self.entries)
+
+    def file_group(self, file_name: str) -> tuple:
+        """(file type, drop date), or (None, None) for a name that breaks the convention"""
+        try:
+            return self.parse_file_name(file_name)
+        except InvalidFileNameFormat:
+            return None, None
+
+    def groups(self) -> dict:
+        """pending files by (file type, drop date), names that break the convention are left out
+
+        :return: dict of (file type, drop date) -> sorted list of file names
+        """
+        groups = {}
+        for name, (_, _, _, file_type, drop_date) in sorted(self.entries.items()):
+            if file_type is not None:
+                groups.setdefault((file_type, drop_date), []).append(name)
+        return groups
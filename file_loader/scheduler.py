@@ -0,0 +1,131 @@
+"""Order data files over a fixed number of workers
+
+With files handed out in whatever order they were listed, a run lasts until the worker
+that picked up the biggest file last is done with it. LoadScheduler hands out the
+biggest files first (longest processing time first), which keeps that straggler short,
+and only keeps as many files in flight as there are workers so the order holds. A file
+is held back while its table already has `max_per_table` files loading, and with
+`drop_date_first` older drops go before newer ones whatever their size. A single worker
+has no straggler to avoid, so it takes the files in the order they were listed.
+
+Any concurrent.futures.Executor works: a process or thread pool, or SequentialExecutor
+to run everything in the calling thread.
+"""
+import os
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+
+from file_loader.logger import logger
+
+# one file to load; `table` and `drop_date` may be None for a file whose name breaks the convention
+# `args` are passed to the function the scheduler runs
+Job = namedtuple('Job', ['name', 'size', 'table', 'drop_date', 'args'])
+
+
+class SequentialExecutor(Executor):
+    """Executor that runs every call in the calling thread as it is submitted"""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+
+def timed_call(fn, args: tuple) -> tuple:
+    """run a job where the executor puts it, noting which worker ran it and when
+
+    module level so process pools can pickle it
+
+    :return: (worker id, start time, end time, result)
+    """
+    worker = '%s/%s' % (os.getpid(), threading.current_thread().name)
+    start = time.time()
+    result = fn(*args)
+    return worker, start, time.time(), result
+
+
+class LoadScheduler:
+    """Hands jobs to an executor biggest first, within the per table cap"""
+
+    def __init__(self, workers: int = 1, max_per_table: int = None, drop_date_first: bool = False):
+        """
+
+        :param workers: jobs kept in flight at once, the executor's worker count
+        :param max_per_table: max jobs loading into the same table at once, unlimited by default
+        :param drop_date_first: run older drop dates first, then biggest first within a date
+        (listing order with a single worker); drop dates compare as strings so they need to be YYYY-MM-dd
+        """
+        if max_per_table is not None and max_per_table < 1:
+            raise ValueError('max_per_table must be at least 1')
+        self.workers = max(1, workers)
+        self.max_per_table = max_per_table
+        self.drop_date_first = drop_date_first
+        # worker id -> [files, busy seconds] of the last run
+        self.utilization = {}
+        self.seconds = 0.0
+
+    def order(self, jobs: list) -> list:
+        """jobs in the order they are handed out when no table is at its cap"""
+        if self.workers == 1:
+            # sorts are stable, files of the same drop date keep their listing order
+            if self.drop_date_first:
+                return sorted(jobs, key=lambda job: job.drop_date or '')
+            return list(jobs)
+        if self.drop_date_first:
+            return sorted(jobs, key=lambda job: (job.drop_date or '', -job.size))
+        return sorted(jobs, key=lambda job: -job.size)
+
+    def run(self, executor: Executor, fn, jobs: list, on_result=None) -> list:
+        """run every job through the executor
+
+        :param executor: where the jobs run
+        :param fn: called as fn(*job.args); must be picklable for a process pool
+        :param jobs: list of Job
+        :param on_result: called as on_result(job, result) in this thread as each job finishes
+        :return: list of the results, in completion order
+        """
+        pending = self.order(jobs)
+        running = {}
+        loading = Counter()
+        results = []
+        self.utilization = {}
+        start = time.time()
+
+        while pending or running:
+            ix = 0
+            while len(running) < self.workers and ix < len(pending):
+                job = pending[ix]
+                if self.max_per_table is not None and job.table is not None \
+                        and loading[job.table] >= self.max_per_table:
+                    ix += 1
+                    continue
+                del pending[ix]
+                loading[job.table] += 1
+                running[executor.submit(timed_call, fn, job.args)] = job
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = running.pop(future)
+                loading[job.table] -= 1
+                worker, job_start, job_end, result = future.result()
+                usage = self.utilization.setdefault(worker, [0, 0.0])
+                usage[0] += 1
+                usage[1] += job_end - job_start
+                if on_result is not None:
+                    on_result(job, result)
+                results.append(result)
+
+        self.seconds = time.time() - start
+        self.log_utilization()
+        return results
+
+    def log_utilization(self):
+        """busy time of every worker over the run; low numbers mean workers sat waiting"""
+        for worker, (files, busy) in sorted(self.utilization.items()):
+            logger.info('worker %s: %s files, busy %.2fs of %.2fs (%.0f%%)', worker, files, busy, self.seconds,
+                        100 * busy / self.seconds if self.seconds else 100)
@@ -0,0 +1,225 @@
+"""Sharded sqlite output
+
+SQLite takes one writer at a time per database file, so parallel loads into a single
+file queue up on its lock. With a shard layout every data file is routed by its file
+type and/or drop date to a database file of its own, and loads into different shards
+write at the same time.
+
+The catalog is the database named in the config. `open_catalog` ATTACHes the shards to
+it and creates TEMP views under the original table names that UNION ALL the catalog's
+own table with the shards' tables, so queries don't need to know about the shards.
+`compact` (`python run.py compact`) moves the shards' rows into the catalog's tables and
+deletes the shards; run it while nothing is loading.
+"""
+import os
+import sqlite3
+import uuid
+import zlib
+
+from file_loader.exceptions import TooManyShards
+from file_loader.logger import logger
+
+# tables the loader keeps for itself; merged on compaction but not exposed as views
+LOAD_TABLES = ('_load_state', '_load_manifest')
+# catalog table recording the shards already merged so a rerun after a crash doesn't merge one twice
+COMPACTED_TABLE = '_compacted_shards'
+# shard table holding an id unique to that shard file; a shard recreated under the same
+# name by a later load gets a new one, so it isn't mistaken for the one already merged
+SHARD_ID_TABLE = '_shard_id'
+
+
+def sqlite_path(connection_string: str) -> str:
+    """`sqlite:////abs/path.db` -> `/abs/path.db`"""
+    return connection_string.split(':///', 1)[1]
+
+
+class ShardLayout:
+    """Where each data file's rows go"""
+    KEYS = ('file_type', 'drop_date')
+
+    def __init__(self, catalog: str, shard_dir: str, shard_by: list = ('file_type',), lock_stripes: int = 8):
+        """
+
+        :param catalog: connection string of the catalog database
+        :param shard_dir: directory holding the shard database files
+        :param shard_by: parts of the data file name that pick the shard, any of KEYS
+        :param lock_stripes: number of write locks shared by parallel workers; shards
+        that hash to different stripes are written at the same time
+        """
+        unknown = set(shard_by) - set(self.KEYS)
+        if unknown:
+            raise ValueError('cannot shard by %s, choose from %s' % (sorted(unknown), self.KEYS))
+        self.catalog = catalog
+        self.shard_dir = shard_dir
+        self.shard_by = tuple(shard_by)
+        self.lock_stripes = lock_stripes
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """
+
+        :param config: a DATABASE_CONFIG entry with `catalog`, `shard_dir` and optionally
+        `shard_by` and `lock_stripes`
+        """
+        return cls(config['catalog'], config['shard_dir'], config.get('shard_by', ('file_type',)),
+                   config.get('lock_stripes', 8))
+
+    def shard_name(self, file_type: str, drop_date: str) -> str:
+        parts = {'file_type': file_type, 'drop_date': drop_date}
+        name = '__'.join(parts[key] for key in self.shard_by)
+        return ''.join(char if char.isalnum() or char in '-_' else '_' for char in name)
+
+    def connection_string(self, file_type: str, drop_date: str) -> str:
+        """connection string of the shard a data file is loaded into"""
+        path = os.path.abspath(os.path.join(self.shard_dir, self.shard_name(file_type, drop_date) + '.db'))
+        return 'sqlite:///%s' % path
+
+    def shard_paths(self) -> list:
+        """database files currently in the shard dir"""
+        if not os.path.isdir(self.shard_dir):
+            return []
+        return sorted(os.path.join(self.shard_dir, name) for name in os.listdir(self.shard_dir)
+                      if name.endswith('.db'))
+
+
+def lock_stripe(connection_string: str, stripes: int) -> int:
+    """index of the write lock guarding a database; stable across processes unlike hash()"""
+    return zlib.crc32(connection_string.encode('utf-8')) % stripes
+
+
+def list_tables(connection: object, schema: str = 'main') -> dict:
+    """
+
+    :return: dict of table name -> CREATE statement for every table in the schema
+    """
+    rows = connection.execute(
+        "SELECT name, sql FROM %s.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%%'" % schema)
+    return dict(rows.fetchall())
+
+
+def quote(name: str) -> str:
+    return '"%s"' % name.replace('"', '""')
+
+
+def open_catalog(layout: ShardLayout) -> sqlite3.Connection:
+    """connect to the catalog with every shard attached and a TEMP view per table
+
+    Each view is named after the table and is the UNION ALL of the catalog's own
+    table (if it has one) and every shard's; TEMP names are looked up first so a
+    view hides the catalog table of the same name. Row ids are only unique per shard.
+
+    :param layout: the shard layout
+    :return: sqlite3 connection; the views go away when it is closed
+    """
+    connection = sqlite3.connect(sqlite_path(layout.catalog))
+    shard_paths = layout.shard_paths()
+    limit = connection.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(shard_paths) > limit:
+        connection.close()
+        raise TooManyShards('%s shards but sqlite can only attach %s at a time; run `python run.py compact`' % (
+            len(shard_paths), limit))
+
+    sources = {}
+    for table in list_tables(connection):
+        if table not in LOAD_TABLES and table != COMPACTED_TABLE:
+            sources.setdefault(table, []).append('main.%s' % quote(table))
+    for ix, shard_path in enumerate(shard_paths):
+        schema = 'shard_%s' % ix
+        connection.execute('ATTACH DATABASE ? AS %s' % schema, (shard_path,))
+        for table in list_tables(connection, schema):
+            if table not in LOAD_TABLES and table != SHARD_ID_TABLE:
+                sources.setdefault(table, []).append('%s.%s' % (schema, quote(table)))
+
+    for table, tables in sources.items():
+        connection.execute('CREATE TEMP VIEW %s AS %s' % (
+            quote(table), ' UNION ALL '.join('SELECT * FROM %s' % source for source in tables)))
+    logger.info('catalog: %s shards attached, %s views', len(shard_paths), len(sources))
+    return connection
+
+
+def compact(layout: ShardLayout) -> int:
+    """merge every shard into the catalog and delete it
+
+    A shard is merged in a single transaction that also records its id as merged, so a
+    crash leaves it either untouched or recorded (and then it is only deleted).
+    Data rows get new ids in the catalog. Indexes the shards have are created in the
+    catalog too.
+
+    :param layout: the shard layout
+    :return: number of rows merged
+    """
+    connection = sqlite3.connect(sqlite_path(layout.catalog), isolation_level=None)
+    connection.execute('CREATE TABLE IF NOT EXISTS %s (shard TEXT PRIMARY KEY, rows INTEGER)' % COMPACTED_TABLE)
+    total_rows = 0
+    try:
+        for shard_path in layout.shard_paths():
+            shard = os.path.basename(shard_path)
+            connection.execute('ATTACH DATABASE ? AS shard', (shard_path,))
+            try:
+                shard_id = '%s/%s' % (shard, get_shard_id(connection))
+                merged = connection.execute('SELECT 1 FROM %s WHERE shard = ?' % COMPACTED_TABLE,
+                                            (shard_id,)).fetchone() is not None
+                if not merged:
+                    connection.execute('BEGIN IMMEDIATE')
+                    rows = merge_shard(connection)
+                    connection.execute('INSERT INTO %s (shard, rows) VALUES (?, ?)' % COMPACTED_TABLE,
+                                       (shard_id, rows))
+                    connection.execute('COMMIT')
+            except Exception as exc:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+                raise exc
+            finally:
+                connection.execute('DETACH DATABASE shard')
+            os.unlink(shard_path)
+            if merged:
+                logger.info('shard `%s` was already merged; removed it', shard)
+                continue
+            total_rows += rows
+            logger.info('merged %s rows from shard `%s`', rows, shard)
+    finally:
+        connection.close()
+    return total_rows
+
+
+def get_shard_id(connection: sqlite3.Connection) -> str:
+    """id of the shard attached as `shard`, given one in its own transaction the first time"""
+    connection.execute('CREATE TABLE IF NOT EXISTS shard.%s (id TEXT)' % SHARD_ID_TABLE)
+    row = connection.execute('SELECT id FROM shard.%s' % SHARD_ID_TABLE).fetchone()
+    if row is not None:
+        return row[0]
+    shard_id = uuid.uuid4().hex
+    connection.execute('INSERT INTO shard.%s (id) VALUES (?)' % SHARD_ID_TABLE, (shard_id,))
+    return shard_id
+
+
+def merge_shard(connection: sqlite3.Connection) -> int:
+    """copy the tables of the shard attached as `shard` into main
+
+    :return: number of data rows copied
+    """
+    main_tables = list_tables(connection)
+    rows = 0
+    for table, create_sql in list_tables(connection, 'shard').items():
+        if table == SHARD_ID_TABLE:
+            continue
+        if table not in main_tables:
+            connection.execute(create_sql)
+        columns = [row[1] for row in connection.execute('PRAGMA shard.table_info(%s)' % quote(table))]
+        if table in LOAD_TABLES:
+            # keyed bookkeeping, the shard's row for a key wins
+            names = ', '.join(quote(column) for column in columns)
+            connection.execute('INSERT OR REPLACE INTO main.%s (%s) SELECT %s FROM shard.%s' % (
+                quote(table), names, names, quote(table)))
+            continue
+        # ids restart in every shard, the catalog hands out new ones
+        names = ', '.join(quote(column) for column in columns if column != 'id')
+        cursor = connection.execute('INSERT INTO main.%s (%s) SELECT %s FROM shard.%s' % (
+            quote(table), names, names, quote(table)))
+        rows += cursor.rowcount
+
+    index_sql = connection.execute(
+        "SELECT sql FROM shard.sqlite_master WHERE type = 'index' AND sql IS NOT NULL").fetchall()
+    for (sql,) in index_sql:
+        connection.execute(sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+    return rows
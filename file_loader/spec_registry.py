@@ -0,0 +1,67 @@
+"""Registry of parsed spec files
+
+Every data file of a given type shares the same spec, so the compiled line parser and
+the backend table object built from it are cached and only rebuilt when the spec
+file's mtime changes.
+"""
+import os
+
+from file_loader.logger import logger
+
+
+class SpecRegistry:
+    """Cache of parser instances and backend tables per spec file"""
+
+    def __init__(self):
+        # spec file path -> {'mtime': ..., 'parsers': {parser_cls: parser}, 'tables': {key: table}}
+        self.specs = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_entry(self, spec_file: str) -> dict:
+        """cache entry for the spec; a changed mtime throws the old entry away
+
+        :param spec_file: path to the spec file
+        :return: dict holding the cached parsers and tables for the spec
+        """
+        mtime = os.stat(spec_file).st_mtime_ns
+        entry = self.specs.get(spec_file)
+        if entry is None or entry['mtime'] != mtime:
+            if entry is not None:
+                logger.info('Spec `%s` changed; reloading', spec_file)
+            entry = {'mtime': mtime, 'parsers': {}, 'tables': {}}
+            self.specs[spec_file] = entry
+        return entry
+
+    def get_parser(self, spec_file: str, parser_cls: object):
+        """
+
+        :param spec_file: path to the spec file
+        :param parser_cls: line parser class eg// FixedWidthParser
+        :return: a parser with the spec already compiled
+        """
+        parsers = self.get_entry(spec_file)['parsers']
+        parser = parsers.get(parser_cls)
+        if parser is None:
+            self.misses += 1
+            parser = parser_cls(spec_file)
+            parsers[parser_cls] = parser
+        else:
+            self.hits += 1
+        return parser
+
+    def get_table(self, spec_file: str, key: str):
+        """
+
+        :param spec_file: path to the spec file
+        :param key: identifies the backend target, eg// the connection string
+        :return: the cached backend table object or None
+        """
+        return self.get_entry(spec_file)['tables'].get(key)
+
+    def set_table(self, spec_file: str, key: str, table: object):
+        """remember the backend table object built for a spec"""
+        self.get_entry(spec_file)['tables'][key] = table
+
+    def log_stats(self):
+        logger.info('spec registry: %s hits, %s misses', self.hits, self.misses)
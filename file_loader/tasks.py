@@ -0,0 +1,53 @@
+"""Celery tasks for spreading files over a fleet of load workers
+
+    $ celery -A file_loader.tasks worker
+
+Every worker must see the same data dir. A worker claims a file by renaming it
+into the processing dir before loading it; the rename is atomic so when the same
+file is dispatched twice only one worker loads it and the other reports it as
+already claimed. The dispatching FileHandler moves each claimed file to the
+archive or failed dir from the result its task sends back.
+"""
+from celery import Celery
+from celery.signals import after_setup_logger, worker_process_init
+
+from config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND
+from file_loader.file_handler import FileHandler, claim_file, load_file
+from file_loader.logger import setup_logging
+
+app = Celery('file_loader', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+app.conf.update(
+    task_serializer='json',
+    result_serializer='json',
+    accept_content=['json'],
+    # a worker picks up one file at a time so files spread evenly over the fleet
+    worker_prefetch_multiplier=1,
+)
+
+
+@after_setup_logger.connect
+@worker_process_init.connect
+def init_logging(**kwargs):
+    """workers are started by celery rather than run.py; set up logging in the worker
+    and in each of its pool processes, not when the module is imported"""
+    setup_logging()
+
+
+@app.task(name='file_loader.load_file')
+def load_file_task(data_file_path: str, processing_dir: str, spec_file: str, file_type: str,
+                   backend: str, connection_string: str, parser_options: dict):
+    """claim a data file and load it
+
+    File types and backends are passed by their keys so the task arguments stay serializable
+
+    :return: the LoadResult as a dict, or None when another worker already claimed the file
+    """
+    claimed_path = claim_file(data_file_path, processing_dir)
+    if claimed_path is None:
+        return None
+    result = load_file(claimed_path, spec_file, FileHandler.FILE_TYPES[file_type],
+                       FileHandler.BACKENDS[backend], connection_string, parser_options)
+    if load_file_task.request.is_eager:
+        # ran in the dispatching process, its metrics are already recorded there
+        result = result._replace(metrics=None)
+    return result._asdict()
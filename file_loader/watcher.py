@@ -0,0 +1,209 @@
+"""Watch the data directory and hand over files once they are completely written
+
+Linux inotify is used when available (through ctypes, no extra dependency) with a
+polling fallback everywhere else. A file is considered complete when it is renamed
+into the directory, or when its size and mtime have not changed for `settle_seconds`.
+When inotify's event queue overflows the events in it are lost, so the directory is
+scanned again to find the files they were about.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+from file_loader.logger import logger
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_MODIFY = 0x00000002
+# the kernel dropped events because the queue was full; always reported, no name
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """Minimal ctypes wrapper around inotify for a single directory"""
+    MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+
+    def __init__(self, path: str):
+        """
+
+        :param path: directory to watch
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch failed for %s' % path)
+
+    @classmethod
+    def available(cls) -> bool:
+        """inotify only exists on linux"""
+        library = ctypes.util.find_library('c')
+        return library is not None and hasattr(ctypes.CDLL(library), 'inotify_init1')
+
+    def read_events(self, timeout: float) -> list:
+        """wait up to timeout seconds for events
+
+        :param timeout: seconds to wait
+        :return: list of (mask, file name)
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        events = []
+        try:
+            buffer = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return events
+        position = 0
+        while position < len(buffer):
+            _, mask, _, name_length = EVENT_HEADER.unpack_from(buffer, position)
+            position += EVENT_HEADER.size
+            name = buffer[position:position + name_length].rstrip(b'\0')
+            position += name_length
+            events.append((mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """Calls `handle_file(file_name)` once for every file that lands in the directory"""
+
+    def __init__(self, directory: str, handle_file, settle_seconds: float = 1.0,
+                 poll_seconds: float = 1.0, use_inotify: bool = None):
+        """
+
+        :param directory: directory to watch, only regular files directly inside it count
+        :param handle_file: callback receiving the name of every completed file
+        :param settle_seconds: how long size and mtime must stay unchanged
+        :param poll_seconds: scan interval when polling
+        :param use_inotify: force inotify on/off, defaults to using it when available
+        """
+        self.directory = directory
+        self.handle_file = handle_file
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        if use_inotify is None:
+            use_inotify = Inotify.available()
+        self.inotify = Inotify(directory) if use_inotify else None
+        # name -> (size, mtime_ns, time the size/mtime were first seen)
+        self.pending = {}
+        # name -> (size, mtime_ns) of files already handed over, so they are not picked up twice
+        self.seen = {}
+        self.running = False
+
+    def scan(self):
+        """add every regular file in the directory that hasn't been handled to pending"""
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name not in self.pending:
+                    self.track(entry.name)
+
+    def track(self, name: str):
+        """start (or restart) the settle timer for a file"""
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            self.pending.pop(name, None)
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        if self.seen.get(name) == signature:
+            return
+        current = self.pending.get(name)
+        if current is None or current[:2] != signature:
+            self.pending[name] = signature + (time.monotonic(),)
+
+    def ready_files(self) -> list:
+        """files whose size and mtime have been stable for settle_seconds
+
+        :return: list of file names in the order they were first seen
+        """
+        ready = []
+        now = time.monotonic()
+        for name in list(self.pending):
+            self.track(name)
+            if name in self.pending and now - self.pending[name][2] >= self.settle_seconds:
+                ready.append(name)
+        return ready
+
+    def dispatch(self, name: str):
+        """hand a completed file to the callback"""
+        signature = self.pending.pop(name, None)
+        if signature is not None:
+            self.seen[name] = signature[:2]
+        logger.info('watcher picked up `%s`', name)
+        self.handle_file(name)
+        # files that were moved away no longer need remembering
+        if not os.path.exists(os.path.join(self.directory, name)):
+            self.seen.pop(name, None)
+
+    def poll(self, timeout: float = None) -> list:
+        """one iteration of the watch loop
+
+        :param timeout: how long to wait for new events
+        :return: list of the file names that were dispatched
+        """
+        if timeout is None:
+            timeout = self.poll_seconds
+            if self.pending:
+                # wake up as soon as the oldest pending file could be ready
+                now = time.monotonic()
+                timeout = max(0.0, min(since + self.settle_seconds - now for _, _, since in self.pending.values()))
+
+        dispatched = []
+        if self.inotify is not None:
+            for mask, name in self.inotify.read_events(timeout):
+                if mask & IN_Q_OVERFLOW:
+                    logger.warning('inotify queue overflowed watching `%s`, rescanning it', self.directory)
+                    self.scan()
+                    continue
+                if not os.path.isfile(os.path.join(self.directory, name)):
+                    continue
+                if mask & IN_MOVED_TO:
+                    # renamed into place: the writer is done with it
+                    self.track(name)
+                    self.dispatch(name)
+                    dispatched.append(name)
+                else:
+                    self.track(name)
+        else:
+            time.sleep(timeout)
+            self.scan()
+
+        for name in self.ready_files():
+            self.dispatch(name)
+            dispatched.append(name)
+        return dispatched
+
+    def run(self):
+        """watch until stop() is called; existing files are picked up first"""
+        logger.info('watching `%s` using %s', self.directory, 'inotify' if self.inotify else 'polling')
+        self.running = True
+        self.scan()
+        try:
+            while self.running:
+                self.poll()
+        finally:
+            self.close()
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
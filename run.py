@@ -1,11 +1,25 @@
-import os
 import unittest
 import argparse
 
 from file_loader.file_handler import FileHandler
-from file_loader.logger import logger
+from file_loader.logger import logger, setup_logging
+from file_loader.metrics import metrics, JsonSummarySink, PrometheusTextfileSink
+from file_loader.scan_index import ScanIndex
+from file_loader.shards import ShardLayout, compact
 
-from config import SPECS_DIR, DATA_DIR, DATABASE_CONFIG, FAILED_DIR, ARCHIVE_DIR, FIXED_WIDTH
+from config import SPECS_DIR, DATA_DIR, DATABASE_CONFIG, FAILED_DIR, ARCHIVE_DIR, PROCESSING_DIR, REJECT_DIR, \
+    SCAN_INDEX_FILE, FIXED_WIDTH, SQLITE_LOAD_PRAGMAS, WATCH_SETTLE_SECONDS, WATCH_POLL_SECONDS
+
+
+def resolve_backend(name: str):
+    """a DATABASE_CONFIG entry is a connection string or a dict describing a shard layout
+
+    :return: (backend key, connection string, ShardLayout or None)
+    """
+    config = DATABASE_CONFIG[name]
+    if isinstance(config, dict):
+        return config['backend'], config['catalog'], ShardLayout.from_config(config)
+    return name, config, None
 
 
 def run_tests(verbosity=2):
@@ -14,37 +28,100 @@ def run_tests(verbosity=2):
 
 
 if __name__ == '__main__':
-    commands = ['test', 'load']
+    commands = ['test', 'load', 'compact']
     parser = argparse.ArgumentParser()
     parser.add_argument('command', help='action you want to perform',
-                        type=str, choices=['test', 'load'])
+                        type=str, choices=commands)
     parser.add_argument('-f', '--file', action='store', help='use this flag to parse/load a single file')
     parser.add_argument('-a', '--all', action='store_true', help='parse and load all files in the data/ dir')
     parser.add_argument('-w', '--watch', action='store_true', help='constantly watch the data/ dir for incoming files')
     parser.add_argument('-b', '--backend', action='store', choices=DATABASE_CONFIG.keys(), default='sqlite',
                         help='choose a backend from the available backends defined in the config file')
+    parser.add_argument('-t', '--file-type', action='store', choices=FileHandler.FILE_TYPES.keys(),
+                        default=FIXED_WIDTH, help='parser used for the data files')
+    parser.add_argument('--batch-size', action='store', type=int, default=None,
+                        help='stream each file to the backend in batches of this many rows')
+    parser.add_argument('--workers', action='store', type=int, default=1,
+                        help='load files in parallel across this many processes')
+    parser.add_argument('--max-per-table', action='store', type=int, default=None,
+                        help='with --workers, load at most this many files into the same table at once')
+    parser.add_argument('--drop-date-first', action='store_true',
+                        help='load older drop dates first; otherwise the biggest files go first')
+    parser.add_argument('--parse-workers', action='store', type=int, default=1,
+                        help='split each file into byte ranges and parse them across this many processes')
+    parser.add_argument('--bulk', action='store_true',
+                        help='apply the backend load time pragmas and rebuild indexes after the load')
+    parser.add_argument('--mmap', action='store_true',
+                        help='read data files as memory mapped bytes instead of decoded text')
+    parser.add_argument('--celery', action='store_true',
+                        help='send the files to celery workers (celery -A file_loader.tasks worker)')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='commit the byte offset with every batch and resume interrupted loads from it')
+    parser.add_argument('--manifest', action='store_true',
+                        help='record a content hash per loaded file and archive re-sent identical files unloaded')
+    parser.add_argument('--metrics-json', action='store', default=None,
+                        help='write counters, stage timings and per file rows/sec as json to this file')
+    parser.add_argument('--metrics-prom', action='store', default=None,
+                        help='write counters and stage timings to this .prom file for node_exporter')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='overlap reading, parsing and inserting each file with bounded queues')
+    parser.add_argument('--max-errors', action='store', type=int, default=None,
+                        help='write bad lines to a reject file and only fail a file with more than this many')
+    parser.add_argument('--max-error-rate', action='store', type=float, default=None,
+                        help='write bad lines to a reject file and only fail a file when more than this '
+                             'share of its lines are bad eg// 0.01')
 
     args = parser.parse_args()
+    setup_logging()
 
     if args.command == 'test':
         run_tests()
+    if args.command == 'compact':
+        _, _, shards = resolve_backend(args.backend)
+        if shards is None:
+            parser.error('backend `%s` is not sharded' % args.backend)
+        logger.info('merged %s rows from the shards into the catalog', compact(shards))
     if args.command == 'load':
+        files = []
+        scan_index = None
         if args.all:
-            # only check for files
-            files = [f for f in os.listdir(DATA_DIR) if os.path.isfile(os.path.join(DATA_DIR,f))]
+            # only the changes since the last run are stat'ed and parsed
+            scan_index = ScanIndex(DATA_DIR, SCAN_INDEX_FILE)
+            files = scan_index.scan()
 
         if args.file:
             files = [args.file]
 
-        connection_string = DATABASE_CONFIG.get(args.backend)
+        backend, connection_string, shards = resolve_backend(args.backend)
+
+        if args.metrics_json:
+            metrics.subscribe(JsonSummarySink(args.metrics_json))
+        if args.metrics_prom:
+            metrics.subscribe(PrometheusTextfileSink(args.metrics_prom))
 
         logger.info('sending `%s` files to the file handler', len(files))
         file_handler = FileHandler(
-            DATA_DIR, SPECS_DIR, FAILED_DIR, ARCHIVE_DIR, args.backend,
-            FIXED_WIDTH, connection_string, files
+            DATA_DIR, SPECS_DIR, FAILED_DIR, ARCHIVE_DIR, backend,
+            args.file_type, connection_string, files,
+            parser_options={'batch_size': args.batch_size, 'use_mmap': args.mmap,
+                            'parse_workers': args.parse_workers, 'bulk_load': args.bulk,
+                            'pipeline': args.pipeline,
+                            'checkpoint': args.checkpoint,
+                            'max_errors': args.max_errors, 'max_error_rate': args.max_error_rate,
+                            'reject_dir': REJECT_DIR,
+                            'load_pragmas': SQLITE_LOAD_PRAGMAS if args.bulk else None},
+            workers=args.workers,
+            processing_dir=PROCESSING_DIR,
+            distributed=args.celery,
+            manifest=args.manifest,
+            shards=shards,
+            max_per_table=args.max_per_table,
+            drop_date_first=args.drop_date_first,
+            scan_index=scan_index
         )
 
         file_handler.run()
 
         if args.watch:
-            print('TODO watchdog dir...')
+            # files already in the dir were loaded above (with -a), new ones are picked up as they land
+            file_handler.watch(WATCH_SETTLE_SECONDS, WATCH_POLL_SECONDS)
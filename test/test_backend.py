@@ -6,6 +6,7 @@ from sqlalchemy.sql.sqltypes import INTEGER, TEXT, BOOLEAN
 from sqlalchemy.exc import StatementError
 
 from file_loader.backends.sqlite import SqlLiteBackend
+from file_loader.backends.connections import registry
 
 
 class BackendTest(TestCase):
@@ -95,6 +96,8 @@ class BackendIntegrationTest(TestCase):
         self.init_success = self.backend.init_backend(self.table_name, self.fields)
 
     def tearDown(self):
+        # the registry caches connections and tables for the deleted db file
+        registry.dispose()
         # delete sqlite database file
         self.p.unlink()
         pass
@@ -132,3 +135,95 @@ class BackendIntegrationTest(TestCase):
         ]
 
         self.assertRaises(StatementError, self.backend.insert_rows, bad_rows, self.backend.table)
+
+    def test_insert_values(self):
+        values = [
+            ['Testing', 1, True],
+            ['Insert', 2, False],
+            ['Rows', 3, True],
+        ]
+
+        inserted = self.backend.insert_values(values, self.backend.table)
+        self.assertEqual(inserted, 3)
+
+        conn = registry.get_connection(self.backend.connection_string)
+        rows = conn.execute('SELECT Foo, Bar, Baz FROM test_table ORDER BY id').fetchall()
+        self.assertEqual([tuple(row) for row in rows], [('Testing', 1, 1), ('Insert', 2, 0), ('Rows', 3, 1)])
+
+        # a failing batch is rolled back as a whole
+        bad_values = [
+            ['Testing', 4, True],
+            ['Testing', 5],
+        ]
+        self.assertRaises(Exception, self.backend.insert_values, bad_values, self.backend.table)
+        self.assertEqual(conn.execute('SELECT count(*) FROM test_table').scalar(), 3)
+
+    def test_load_pragmas(self):
+        conn = registry.get_connection(self.backend.connection_string)
+        synchronous = conn.execute('PRAGMA synchronous').scalar()
+
+        self.backend.begin_load({'synchronous': 'OFF', 'cache_size': -1000})
+        self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), 0)
+        self.assertEqual(conn.execute('PRAGMA cache_size').scalar(), -1000)
+
+        # settings are put back once the load is over
+        self.backend.end_load()
+        self.assertEqual(conn.execute('PRAGMA synchronous').scalar(), synchronous)
+
+        # the journal mode belongs to the database file and stays, other workers may be using it
+        self.backend.begin_load({'journal_mode': 'WAL'})
+        self.backend.end_load()
+        self.assertEqual(conn.execute('PRAGMA journal_mode').scalar(), 'wal')
+
+    def test_indexes(self):
+        conn = registry.get_connection(self.backend.connection_string)
+
+        def index_names():
+            return {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'test_table'")}
+
+        self.backend.init_backend(self.table_name, self.fields, table=self.backend.table, indexes=['Bar'])
+        self.assertEqual(index_names(), {'ix_test_table_Bar'})
+
+        # dropped for the bulk load, rebuilt and analyzed afterwards
+        self.backend.begin_load({}, expected_rows=100)
+        self.assertEqual(index_names(), set())
+        self.backend.insert_values([['Testing', ix, True] for ix in range(100)], self.backend.table)
+        self.backend.end_load()
+        self.assertEqual(index_names(), {'ix_test_table_Bar'})
+        self.assertEqual(conn.execute("SELECT count(*) FROM sqlite_stat1 WHERE idx = 'ix_test_table_Bar'").scalar(), 1)
+
+        # a small load into a big table keeps them, and the statistics aren't worth refreshing
+        conn.execute('DELETE FROM sqlite_stat1')
+        self.backend.begin_load({}, expected_rows=10)
+        self.assertEqual(index_names(), {'ix_test_table_Bar'})
+        self.backend.insert_values([['Testing', ix, True] for ix in range(5)], self.backend.table)
+        self.backend.end_load()
+        self.assertEqual(conn.execute('SELECT count(*) FROM sqlite_stat1').scalar(), 0)
+
+        # unless it turns out to grow the table by more than the estimate said
+        self.backend.begin_load({}, expected_rows=10)
+        self.backend.insert_values([['Testing', ix, True] for ix in range(15)], self.backend.table)
+        self.backend.end_load()
+        self.assertEqual(conn.execute("SELECT count(*) FROM sqlite_stat1 WHERE idx = 'ix_test_table_Bar'").scalar(), 1)
+
+    def test_checkpoint(self):
+        self.backend.init_load_state()
+        self.assertIsNone(self.backend.get_checkpoint('testdata_2018-01-01.txt'))
+
+        checkpoint = {'file_name': 'testdata_2018-01-01.txt', 'file_size': 100,
+                      'byte_offset': 30, 'rows': 2, 'status': 'in_progress', 'signature': '100:1'}
+        self.backend.insert_values([['Testing', 1, True], ['Insert', 2, False]], self.backend.table, checkpoint)
+        self.assertEqual(self.backend.get_checkpoint('testdata_2018-01-01.txt'), checkpoint)
+
+        # the checkpoint is part of the insert's transaction; when it can't be saved
+        # the rows inserted just before it are rolled back
+        bad_checkpoint = {'file_name': 'testdata_2018-01-01.txt', 'byte_offset': 60}
+        self.assertRaises(KeyError, self.backend.insert_rows,
+                          [{'Foo': 'Rows', 'Bar': 3, 'Baz': True}], self.backend.table, bad_checkpoint)
+        self.assertRaises(KeyError, self.backend.insert_values,
+                          [['Rows', 3, True]], self.backend.table, bad_checkpoint)
+        self.assertEqual(self.backend.get_checkpoint('testdata_2018-01-01.txt'), checkpoint)
+
+        conn = registry.get_connection(self.backend.connection_string)
+        self.assertEqual(conn.execute('SELECT count(*) FROM test_table').scalar(), 2)
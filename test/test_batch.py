@@ -0,0 +1,47 @@
+import pickle
+from array import array
+from unittest import TestCase
+
+from file_loader.batch import RowBatch
+
+
+class RowBatchTest(TestCase):
+    def setUp(self):
+        self.batch = RowBatch(['name', 'valid', 'count'], ['TEXT', 'BOOLEAN', 'INTEGER'])
+        self.rows = [['Foonyor', True, 0], ['Barzane', False, -12], ['Quuxitude', True, 103]]
+
+    def test_extend(self):
+        self.batch.extend(self.rows)
+        self.assertEqual(len(self.batch), 3)
+        self.assertIsInstance(self.batch.column('count'), array)
+        self.assertIsInstance(self.batch.column('name'), list)
+
+        # rows come back as tuples in spec order, booleans as bools
+        self.assertEqual(list(self.batch), [tuple(row) for row in self.rows])
+        self.assertIs(self.batch[1][1], False)
+        self.assertEqual(list(self.batch.dicts())[2], {'name': 'Quuxitude', 'valid': True, 'count': 103})
+
+    def test_chunks(self):
+        self.batch.CHUNK_ROWS = 2
+        self.batch.extend(self.rows * 3)
+        self.batch.append(self.rows[0])
+        self.assertEqual(len(self.batch), 10)
+        self.assertEqual(list(self.batch)[-1], tuple(self.rows[0]))
+
+    def test_overflow(self):
+        self.batch.extend(self.rows)
+        # the column falls back to a list once a value doesn't fit in 64 bits
+        self.batch.extend([['Big', True, 2 ** 70], ['Small', False, 1]])
+        self.assertIsInstance(self.batch.column('count'), list)
+        self.assertEqual(self.batch.column('count'), [0, -12, 103, 2 ** 70, 1])
+        self.assertEqual(len(self.batch), 5)
+
+    def test_slice_and_pickle(self):
+        self.batch.extend(self.rows)
+        part = self.batch[1:]
+        self.assertEqual(len(part), 2)
+        self.assertEqual(list(part), [tuple(row) for row in self.rows[1:]])
+
+        copy = pickle.loads(pickle.dumps(self.batch))
+        self.assertEqual(list(copy), list(self.batch))
+        self.assertFalse(RowBatch(['a'], ['TEXT']))
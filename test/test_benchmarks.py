@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from benchmarks.datagen import compress_file, generate
+from benchmarks.suite import compare
+from file_loader.exceptions import MalformedLineError
+from file_loader.parsers.fixed_width_parser import FixedWidthParser
+
+
+class DatagenTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_generate(self):
+        spec_path, data_path, columns = generate(self.tmp_dir, 'bench', 12, 2000, malformed=0.05)
+        self.assertEqual(data_path, os.path.join(self.tmp_dir, 'data', 'bench_2018-01-01.txt'))
+        self.assertEqual(len(columns), 12)
+
+        # every line either parses against the generated spec or has the wrong width
+        parser = FixedWidthParser(spec_path)
+        errors = 0
+        with open(data_path) as data_file:
+            for line in data_file:
+                try:
+                    self.assertEqual(len(parser.parse(line)), 12)
+                except MalformedLineError:
+                    errors += 1
+        self.assertTrue(50 < errors < 150)
+
+    def test_compress_file(self):
+        import gzip
+
+        _, data_path, _ = generate(self.tmp_dir, 'bench', 4, 100)
+        compressed_path = compress_file(data_path, 'gzip')
+        self.assertEqual(compressed_path, data_path + '.gz')
+        with open(data_path, 'rb') as data_file, gzip.open(compressed_path) as compressed_file:
+            self.assertEqual(compressed_file.read(), data_file.read())
+
+
+class CompareTest(TestCase):
+    def test_compare(self):
+        baseline = {'parse': {'lines_per_sec': 1000, 'peak_rss_kb': 1000}}
+
+        # within the threshold
+        self.assertEqual(compare({'parse': {'lines_per_sec': 950, 'peak_rss_kb': 1050}}, baseline, 0.1), [])
+
+        # slower and bigger
+        regressions = compare({'parse': {'lines_per_sec': 800, 'peak_rss_kb': 1200}}, baseline, 0.1)
+        self.assertEqual(len(regressions), 2)
+
+        # stages missing from the baseline are not compared
+        self.assertEqual(compare({'insert_rows': {'lines_per_sec': 1, 'peak_rss_kb': 1}}, baseline, 0.1), [])
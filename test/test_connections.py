@@ -0,0 +1,49 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from file_loader.backends.connections import ConnectionRegistry
+
+
+class ConnectionRegistryTest(TestCase):
+    def setUp(self):
+        handle, self.db_file = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.connection_string = 'sqlite:///%s' % self.db_file
+        self.registry = ConnectionRegistry()
+
+    def tearDown(self):
+        self.registry.dispose()
+        os.unlink(self.db_file)
+
+    def test_get_engine(self):
+        engine = self.registry.get_engine(self.connection_string)
+        self.assertIs(self.registry.get_engine(self.connection_string), engine)
+        self.assertEqual(self.registry.stats()['engine'], {'hits': 1, 'misses': 1})
+
+    def test_get_connection(self):
+        connection = self.registry.get_connection(self.connection_string)
+        self.assertIs(self.registry.get_connection(self.connection_string), connection)
+
+        # a closed connection is replaced
+        connection.close()
+        self.assertIsNot(self.registry.get_connection(self.connection_string), connection)
+        self.assertEqual(self.registry.stats()['connection'], {'hits': 1, 'misses': 2})
+
+    def test_table_exists(self):
+        # missing tables are not cached
+        self.assertEqual(self.registry.table_exists(self.connection_string, 'foo'), False)
+        self.registry.get_connection(self.connection_string).execute('CREATE TABLE foo (id INTEGER)')
+        self.assertEqual(self.registry.table_exists(self.connection_string, 'foo'), True)
+        # the positive answer is cached
+        self.assertEqual(self.registry.table_exists(self.connection_string, 'foo'), True)
+        self.assertEqual(self.registry.stats()['table'], {'hits': 1, 'misses': 2})
+
+    def test_forked_process(self):
+        engine = self.registry.get_engine(self.connection_string)
+        self.registry.add_table(self.connection_string, 'foo')
+
+        # pretend this is a child process; nothing from the parent is reused
+        self.registry.pid = -1
+        self.assertIsNot(self.registry.get_engine(self.connection_string), engine)
+        self.assertEqual(self.registry.known_tables, set())
@@ -1,7 +1,15 @@
 import mock
+import os
+import shutil
+import sqlite3
+import tempfile
 from unittest import TestCase
 
 from file_loader.file_handler import FileHandler
+from file_loader.metrics import metrics
+from file_loader.readers import hash_file
+from file_loader.scan_index import ScanIndex
+from file_loader.shards import ShardLayout, open_catalog
 from file_loader.exceptions import MissingSpecificationFile, InvalidFileNameFormat,\
     UnsupportedBackend, UnsupportedFileType
 
@@ -24,18 +32,29 @@ class FixedWidthTest(TestCase):
         data_file_name = 'testfile_10-13-2016.txt'
         parsed, drop_date = self.file_handler.parse_file_name(data_file_name)
         self.assertEqual(parsed, 'testfile')
-        self.assertEqual(drop_date, '10-13-2016')
+        self.assertEqual(drop_date, '2016-10-13')
 
         # parsing file name with extra _ characters
         data_file_name = 'my_test_file_10-13-2016.txt'
         parsed, drop_date = self.file_handler.parse_file_name(data_file_name)
         self.assertEqual(parsed, 'my_test_file')
-        self.assertEqual(drop_date, '10-13-2016')
+        self.assertEqual(drop_date, '2016-10-13')
+
+        # compressed drops keep the spec name and drop date of the file inside
+        for data_file_name in ('testfile_10-13-2016.txt.gz', 'testfile_10-13-2016.xz'):
+            parsed, drop_date = self.file_handler.parse_file_name(data_file_name)
+            self.assertEqual(parsed, 'testfile')
+            self.assertEqual(drop_date, '2016-10-13')
 
         # testings file name that does not fit the convention
         data_file_name = 'testfilewithmissingdate.txt'
         self.assertRaises(InvalidFileNameFormat, self.file_handler.parse_file_name, data_file_name)
 
+        # the drop date comes back as YYYY-MM-dd whichever way round it was written
+        self.assertEqual(self.file_handler.parse_file_name('testfile_2016-10-13.txt'), ('testfile', '2016-10-13'))
+        for data_file_name in ('testfile_2016-13-10.txt', 'testfile_latest.txt', 'testfile_13-10-2016.txt'):
+            self.assertRaises(InvalidFileNameFormat, self.file_handler.parse_file_name, data_file_name)
+
 
     def test_get_spec_file(self):
         data_file_name = 'testfile_10-13-2016.txt'
@@ -71,6 +90,20 @@ class FixedWidthTest(TestCase):
             instance.run = mock.Mock()
             file_handler.run()
 
+    def test_load_watched_file(self):
+        self.file_handler.move_file = mock.Mock()
+
+        # files without a spec are left where they are
+        self.file_handler.load_file = mock.Mock(side_effect=MissingSpecificationFile)
+        self.file_handler.load_watched_file('file1.txt')
+        self.file_handler.move_file.assert_not_called()
+
+        # any other failure sends the file to the failed dir and the watcher carries on
+        self.file_handler.load_file = mock.Mock(side_effect=ValueError)
+        with mock.patch('file_loader.file_handler.os.path.exists', return_value=True):
+            self.file_handler.load_watched_file('file1.txt')
+        self.file_handler.move_file.assert_called_once_with('./data/file1.txt', False)
+
     def test_move_file(self):
         with mock.patch('file_loader.file_handler.os.rename') as mock_rename:
             # Test that file is moved to the target archive directory on success
@@ -119,3 +152,148 @@ class FixedWidthTest(TestCase):
             'sqlite////test.db',
             ['file1.txt', 'file2.txt']
         )
+
+
+class FileHandlerIntegrationTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for sub_dir in ('data', 'specs', 'data/loaded', 'data/failed'):
+            os.makedirs(os.path.join(self.tmp_dir, sub_dir), exist_ok=True)
+
+        with open(os.path.join(self.tmp_dir, 'specs', 'testformat.csv'), 'w') as spec_file:
+            spec_file.write('"column name",width,datatype\nname,10,TEXT\nvalid,1,BOOLEAN\ncount,3,INTEGER\n')
+
+        self.files = {
+            'testformat_2018-01-01.txt': 'Foonyor   1  0\nBarzane   0-12\n',
+            'testformat_2018-01-02.txt': 'Quuxitude 1103\n',
+            'testformat_2018-01-03.txt': 'Foonyor   1  0\nshort\n',
+        }
+        for name, data in self.files.items():
+            with open(os.path.join(self.tmp_dir, 'data', name), 'w') as data_file:
+                data_file.write(data)
+
+        self.db_file = os.path.join(self.tmp_dir, 'test.db')
+        self.connection_string = 'sqlite:///%s' % self.db_file
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def file_handler(self, **kwargs):
+        return FileHandler(
+            os.path.join(self.tmp_dir, 'data'),
+            os.path.join(self.tmp_dir, 'specs'),
+            os.path.join(self.tmp_dir, 'data/failed'),
+            os.path.join(self.tmp_dir, 'data/loaded'),
+            'sqlite',
+            'fixed_width',
+            self.connection_string,
+            sorted(self.files),
+            **kwargs
+        )
+
+    def test_run_sequential(self):
+        # the malformed file fails on its own, the run carries on and moves every file
+        results = self.file_handler().run()
+        self.assertEqual([result.success for result in results], [True, True, False])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir, 'data/loaded'))),
+                         ['testformat_2018-01-01.txt', 'testformat_2018-01-02.txt'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'data/failed')), ['testformat_2018-01-03.txt'])
+
+    def test_make_job(self):
+        file_handler = self.file_handler()
+        self.assertEqual(file_handler.make_job('testformat_2018-01-01.txt', 'arg'),
+                         ('testformat_2018-01-01.txt', 30, 'testformat', '2018-01-01', ('arg',)))
+
+        # files listed from a scan index are scheduled from it without another stat or parse
+        scan_index = ScanIndex(os.path.join(self.tmp_dir, 'data'), os.path.join(self.tmp_dir, 'scan_index.json'))
+        scan_index.scan()
+        file_handler = self.file_handler(scan_index=scan_index)
+        with mock.patch('file_loader.file_handler.os.path.getsize') as getsize, \
+                mock.patch.object(FileHandler, 'parse_file_name') as parse_file_name:
+            self.assertEqual(file_handler.make_job('testformat_2018-01-02.txt'),
+                             ('testformat_2018-01-02.txt', 15, 'testformat', '2018-01-02', ()))
+        getsize.assert_not_called()
+        parse_file_name.assert_not_called()
+
+    def test_run_parallel(self):
+        before = metrics.snapshot()
+        results = self.file_handler(workers=2).run()
+
+        # the counters of the pool workers are merged into this process
+        self.assertEqual(metrics.since(before)['counters']['rows_inserted'], 3)
+        self.assertEqual(metrics.since(before)['counters']['files_failed'], 1)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(sum(result.rows for result in results), 3)
+
+        # every file is moved according to its own result
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir, 'data/loaded'))),
+                         ['testformat_2018-01-01.txt', 'testformat_2018-01-02.txt'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'data/failed')),
+                         ['testformat_2018-01-03.txt'])
+
+        connection = sqlite3.connect(self.db_file)
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 3)
+        connection.close()
+
+    def test_manifest(self):
+        os.unlink(os.path.join(self.tmp_dir, 'data', 'testformat_2018-01-03.txt'))
+        del self.files['testformat_2018-01-03.txt']
+        # the same content re-sent under a new date
+        duplicate = 'testformat_2018-01-04.txt'
+        with open(os.path.join(self.tmp_dir, 'data', duplicate), 'w') as data_file:
+            data_file.write(self.files['testformat_2018-01-01.txt'])
+        self.files[duplicate] = ''
+
+        with mock.patch('file_loader.file_handler.hash_file', wraps=hash_file) as mock_hash_file:
+            results = self.file_handler(manifest=True).run()
+        results = {os.path.basename(result.data_file_path): result for result in results}
+
+        # the copy is archived without being loaded
+        self.assertEqual(results[duplicate].success, True)
+        self.assertEqual(results[duplicate].rows, 0)
+        self.assertEqual(results[duplicate].content_hash, results['testformat_2018-01-01.txt'].content_hash)
+        self.assertIn(duplicate, os.listdir(os.path.join(self.tmp_dir, 'data/loaded')))
+
+        # files are hashed while loading; only the size matched copy is hashed on its own
+        self.assertEqual(mock_hash_file.call_count, 1)
+
+        connection = sqlite3.connect(self.db_file)
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 3)
+        self.assertEqual(connection.execute('SELECT file_name, rows FROM _load_manifest ORDER BY file_name').fetchall(),
+                         [('testformat_2018-01-01.txt', 2), ('testformat_2018-01-02.txt', 1)])
+        connection.close()
+
+    def test_manifest_copies_in_one_run(self):
+        os.unlink(os.path.join(self.tmp_dir, 'data', 'testformat_2018-01-03.txt'))
+        # two identical drops land together; loaded side by side neither is in the manifest yet
+        copy = 'testformat_2018-01-04.txt'
+        shutil.copy(os.path.join(self.tmp_dir, 'data', 'testformat_2018-01-01.txt'),
+                    os.path.join(self.tmp_dir, 'data', copy))
+        self.files = {name: '' for name in ('testformat_2018-01-01.txt', 'testformat_2018-01-02.txt', copy)}
+
+        results = self.file_handler(workers=2, manifest=True).run()
+        results = {os.path.basename(result.data_file_path): result for result in results}
+        self.assertEqual(results[copy].success, True)
+        self.assertEqual(results[copy].rows, 0)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmp_dir, 'data/loaded'))), sorted(self.files))
+
+        connection = sqlite3.connect(self.db_file)
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 3)
+        connection.close()
+
+    def test_run_parallel_sharded(self):
+        shards = ShardLayout(self.connection_string, os.path.join(self.tmp_dir, 'shards'),
+                             shard_by=['file_type', 'drop_date'])
+        results = self.file_handler(workers=2, shards=shards, manifest=True).run()
+        self.assertEqual(sum(result.rows for result in results), 3)
+
+        # every drop date got its own database, the manifest stays in the catalog
+        self.assertEqual(os.listdir(shards.shard_dir).count('testformat__2018-01-01.db'), 1)
+        connection = sqlite3.connect(os.path.join(shards.shard_dir, 'testformat__2018-01-01.db'))
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 2)
+        connection.close()
+        connection = open_catalog(shards)
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 3)
+        self.assertEqual(connection.execute('SELECT count(*) FROM _load_manifest').fetchone()[0], 2)
+        connection.close()
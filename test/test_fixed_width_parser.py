@@ -31,11 +31,26 @@ count,3,INTEGER\n
             self.assertEqual(column[1], columns[ix][1])
             ix += 1
 
+    def test_indexed_columns(self):
+        self.assertEqual(self.parser.indexed_columns, [])
+
+        test_schema = '"column name",width,datatype,index\nname,10,TEXT,yes\nvalid,1,BOOLEAN,\ncount,3,INTEGER,1\n'
+        with mock.patch('file_loader.parsers.fixed_width_parser.open') as mock_open:
+            mock_open.return_value = StringIO(test_schema)
+            parser = FixedWidthParser('test/formatname.csv')
+        self.assertEqual(parser.indexed_columns, ['name', 'count'])
+
     def test_widths(self):
         widths = [10, 1, 3]
         for ix in range(len(self.parser.widths)):
             self.assertEqual(widths[ix], self.parser.widths[ix])
 
+    def test_compile_schema(self):
+        # the total width and the slice offsets are computed once from the spec
+        self.assertEqual(self.parser.line_width, 14)
+        offsets = [(field[0], field[1]) for field in self.parser.fields]
+        self.assertEqual(offsets, [(0, 10), (10, 11), (11, 14)])
+
     def test_parse(self):
         # Test 2 successful parses
         line_1 = 'Foonyor   1  0'
@@ -61,6 +76,31 @@ count,3,INTEGER\n
         bad_line_3 = 'supercalifragilisticexpialidocioussupercalifragilisticexpialidocious'
         self.assertRaises(MalformedLineError, self.parser.parse, bad_line_3)
 
+    def test_parse_bytes(self):
+        parsed = self.parser.parse_bytes(b'Foonyor   1  0\n')
+        self.assertEqual(parsed, ['Foonyor', True, 0])
+
+        parsed = self.parser.parse_bytes(b'Barzane   0-12')
+        self.assertEqual(parsed, ['Barzane', False, -12])
+
+        self.assertRaises(ValueError, self.parser.parse_bytes, b'Foonyor   a  b')
+        self.assertRaises(MalformedLineError, self.parser.parse_bytes, b'Foonyor  ')
+
+    def test_interned_text(self):
+        # repeated values come back as the same object, whatever the padding
+        first = self.parser.parse('Foonyor   1  0')[0]
+        self.assertIs(self.parser.parse('Foonyor   0  1')[0], first)
+        self.assertIs(self.parser.convert_type(0, '   Foonyor'), first)
+
+        # a column with too many distinct values goes back to plain str.strip
+        with mock.patch('file_loader.parsers.fixed_width_parser.MAX_INTERNED_VALUES', 3):
+            self.parser.compile_schema()
+        for ix in range(4):
+            self.assertEqual(self.parser.parse('name%s     1  0' % ix)[0], 'name%s' % ix)
+        self.assertIs(self.parser.fields[0][2], str.strip)
+        self.assertIs(self.parser.converters[0], str.strip)
+        self.assertEqual(self.parser.parse('Foonyor   1  0')[0], 'Foonyor')
+
     def test_convert_type(self):
         self.assertEqual(self.parser.convert_type(0, 'foo'), 'foo')
         self.assertEqual(self.parser.convert_type(1, '0'), False)
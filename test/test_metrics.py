@@ -0,0 +1,100 @@
+import json
+import mock
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from file_loader.metrics import Metrics, MetricsSink, JsonSummarySink, PrometheusTextfileSink
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_counters_and_timers(self):
+        self.metrics.increment('rows_inserted', 10)
+        self.metrics.increment('rows_inserted', 5)
+        with self.metrics.timer('parse'):
+            sum(range(10000))
+        with self.metrics.timer('parse'):
+            pass
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'rows_inserted': 15})
+        self.assertEqual(snapshot['stages']['parse']['calls'], 2)
+        self.assertGreater(snapshot['stages']['parse']['wall_seconds'], 0)
+
+        # a failing stage is still timed
+        with self.assertRaises(ValueError):
+            with self.metrics.timer('insert'):
+                raise ValueError
+        self.assertEqual(self.metrics.snapshot()['stages']['insert']['calls'], 1)
+
+    def test_since_and_merge(self):
+        self.metrics.increment('rows_inserted', 10)
+        before = self.metrics.snapshot()
+        self.metrics.increment('rows_inserted', 3)
+        self.metrics.observe('insert', 1.0, 0.5)
+        self.metrics.add_file('data/file_2018-01-01.txt', True, 3, 1.5)
+
+        delta = self.metrics.since(before)
+        self.assertEqual(delta['counters'], {'rows_inserted': 3})
+        self.assertEqual(delta['stages'], {'insert': {'calls': 1, 'wall_seconds': 1.0, 'cpu_seconds': 0.5}})
+        self.assertEqual(len(delta['files']), 1)
+
+        # a worker's delta folds into the parent's totals
+        parent = Metrics()
+        parent.merge(delta)
+        parent.merge(delta)
+        self.assertEqual(parent.snapshot()['counters'], {'rows_inserted': 6})
+        self.assertEqual(parent.snapshot()['stages']['insert']['wall_seconds'], 2.0)
+
+    def test_sinks(self):
+        sink = MetricsSink()
+        sink.emit = mock.Mock()
+        sink.flush = mock.Mock()
+        json_path = os.path.join(self.tmp_dir, 'metrics.json')
+        prom_path = os.path.join(self.tmp_dir, 'file_loader.prom')
+        for subscriber in (sink, JsonSummarySink(json_path), PrometheusTextfileSink(prom_path)):
+            self.metrics.subscribe(subscriber)
+
+        self.metrics.increment('lines_parsed', 3)
+        self.metrics.observe('parse', 0.25, 0.125)
+        self.metrics.add_file('data/file_2018-01-01.txt', True, 3, 0.5)
+        sink.emit.assert_any_call('counter', 'lines_parsed', 3)
+        self.assertEqual(sink.emit.call_count, 3)
+
+        self.metrics.flush()
+        sink.flush.assert_called_once()
+
+        with open(json_path) as summary:
+            self.assertEqual(json.load(summary)['files'][0]['rows_per_sec'], 6.0)
+
+        with open(prom_path) as textfile:
+            lines = textfile.read().splitlines()
+        self.assertIn('file_loader_lines_parsed_total 3', lines)
+        self.assertIn('file_loader_stage_wall_seconds_total{stage="parse"} 0.25', lines)
+        # the temp file used for the atomic write is gone
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ['file_loader.prom', 'metrics.json'])
+
+    def test_flush_drops_files(self):
+        # a watch flushes after every file; only the counters keep adding up
+        before = self.metrics.snapshot()
+        for day in range(1, 4):
+            self.metrics.increment('rows_inserted', 3)
+            self.metrics.add_file('data/file_2018-01-0%s.txt' % day, True, 3, 0.5)
+            self.metrics.flush()
+            self.assertEqual(len(self.metrics.snapshot()['files']), 0)
+        self.metrics.add_file('data/file_2018-01-04.txt', True, 3, 0.5)
+
+        snapshot = self.metrics.snapshot()
+        self.assertEqual([result['file'] for result in snapshot['files']], ['data/file_2018-01-04.txt'])
+        self.assertEqual(snapshot['counters'], {'rows_inserted': 9})
+        # a delta across flushes only has the files that weren't flushed before it was taken
+        self.assertEqual(len(self.metrics.since(before)['files']), 1)
+        self.assertEqual(self.metrics.since(snapshot)['files'], [])
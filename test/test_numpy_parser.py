@@ -0,0 +1,68 @@
+import mock
+from io import BytesIO, StringIO
+from unittest import TestCase, skipIf
+
+from file_loader.parsers import numpy_parser
+from file_loader.parsers.numpy_parser import NumpyFixedWidthParser
+from file_loader.exceptions import MalformedLineError
+
+
+@skipIf(numpy_parser.numpy is None, 'numpy is not installed')
+class NumpyFixedWidthTest(TestCase):
+    def setUp(self):
+        test_schema = '''"column name",width,datatype\n
+name,10,TEXT\n
+valid,1,BOOLEAN\n
+count,3,INTEGER\n
+'''
+        with mock.patch('file_loader.parsers.fixed_width_parser.open') as mock_open:
+            mock_open.return_value = StringIO(test_schema)
+            self.parser = NumpyFixedWidthParser('test/formatname.csv')
+
+    def test_iter_column_batches(self):
+        # the last record has no trailing newline
+        data = BytesIO(b'Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103')
+        batches = list(self.parser.iter_column_batches(data, 2))
+
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(batches[0], {
+            'name': ['Foonyor', 'Barzane'],
+            'valid': [True, False],
+            'count': [0, -12],
+        })
+        self.assertEqual(batches[1], {'name': ['Quuxitude'], 'valid': [True], 'count': [103]})
+
+    def test_crlf_records(self):
+        data = BytesIO(b'Foonyor   1  0\r\nBarzane   0-12\r\n')
+        batches = list(self.parser.iter_column_batches(data, 10))
+        self.assertEqual(batches[0]['count'], [0, -12])
+
+    def test_malformed_records(self):
+        # second record is one byte short which shifts every record after it
+        data = BytesIO(b'Foonyor   1  0\nBarzane  0-12\nQuuxitude 1103\n')
+        self.assertRaises(MalformedLineError, list, self.parser.iter_column_batches(data, 10))
+
+        # values that cannot be type casted
+        data = BytesIO(b'Foonyor   a  b\n')
+        self.assertRaises(ValueError, list, self.parser.iter_column_batches(data, 10))
+
+    def test_parser_run_columns(self):
+        from file_loader.parser import Parser
+        from file_loader.backends.sqlite import SqlLiteBackend
+
+        test_schema = '"column name",width,datatype\nname,10,TEXT\nvalid,1,BOOLEAN\ncount,3,INTEGER\n'
+        with mock.patch('file_loader.parsers.fixed_width_parser.open') as schema_open:
+            schema_open.return_value = StringIO(test_schema)
+            with mock.patch('file_loader.backends.sqlite.SqlLiteBackend.init_backend'):
+                parser = Parser('testdata_10-31-2017.txt', 'testdata.csv', NumpyFixedWidthParser,
+                                SqlLiteBackend, 'fakeconnection', batch_size=2)
+
+        parser.backend.insert_columns = mock.MagicMock(
+            side_effect=lambda columns, table: len(columns['name']))
+        with mock.patch('file_loader.parser.open') as data_open:
+            data_open.return_value = BytesIO(b'Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103\n')
+            self.assertEqual(parser.run(), True)
+
+        # column batches go straight to the backend, one call per chunk
+        self.assertEqual(parser.backend.insert_columns.call_count, 2)
+        self.assertEqual(parser.rows_inserted, 3)
@@ -1,10 +1,19 @@
+import csv
 import mock
+import os
+import shutil
+import sqlite3
+import tempfile
 from io import StringIO
-from unittest import TestCase
+from unittest import TestCase, skipIf
 
+from file_loader.batch import RowBatch
 from file_loader.parser import Parser
+from file_loader.parsers import numpy_parser
 from file_loader.parsers.fixed_width_parser import FixedWidthParser
+from file_loader.parsers.numpy_parser import NumpyFixedWidthParser
 from file_loader.backends.sqlite import SqlLiteBackend
+from file_loader.backends.connections import registry
 
 
 class ParserTest(TestCase):
@@ -16,6 +25,11 @@ name,10,TEXT\n
 valid,1,BOOLEAN\n
 count,3,INTEGER'''
 
+        # range workers read the spec from disk
+        handle, self.schema_file = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as schema:
+            schema.write(test_schema)
+
         with mock.patch('file_loader.parsers.fixed_width_parser.open') as schema_open:
             schema_open.return_value = StringIO(test_schema)
 
@@ -26,6 +40,9 @@ count,3,INTEGER'''
                 mock_backend.return_value(True)
                 self.parser = Parser(data_file, schema_file, FixedWidthParser, SqlLiteBackend, mock_connection)
 
+    def tearDown(self):
+        os.unlink(self.schema_file)
+
     def test_parse_file(self):
         expected_rows = [
             {'name': 'Foonyor', 'valid': True, 'count': 0},
@@ -45,14 +62,280 @@ count,3,INTEGER'''
                 self.assertEqual(rows[ix].get('count'), expected_rows[ix].get('count'))
 
     def test_run(self):
-        rows = [
+        self.parser.backend.insert_values = mock.MagicMock(side_effect=lambda values, table: len(values))
+
+        with mock.patch('file_loader.parser.open') as data_open:
+            data_open.return_value = StringIO(self.test_data)
+            self.assertEqual(self.parser.run(), True)
+
+        # the whole file goes to the backend as one RowBatch, not a dict per row
+        values, table = self.parser.backend.insert_values.call_args[0]
+        self.assertIsInstance(values, RowBatch)
+        self.assertEqual(list(values)[0], ('Foonyor', True, 0))
+        self.assertIs(table, self.parser.backend.table)
+
+    def test_run_batches(self):
+        self.parser.batch_size = 2
+        self.parser.backend.insert_values = mock.MagicMock(side_effect=lambda values, table: len(values))
+
+        with mock.patch('file_loader.parser.open') as data_open:
+            data_open.return_value = StringIO(self.test_data)
+            self.assertEqual(self.parser.run(), True)
+
+        # one insert per batch
+        self.assertEqual(self.parser.backend.insert_values.call_count, 2)
+        self.assertEqual(self.parser.rows_inserted, 3)
+
+        # a short insert in any batch fails the load
+        self.parser.rows_inserted = 0
+        self.parser.backend.insert_values = mock.MagicMock(return_value=1)
+        with mock.patch('file_loader.parser.open') as data_open:
+            data_open.return_value = StringIO(self.test_data)
+            self.assertEqual(self.parser.run(), False)
+
+    def test_parse_file_mmap(self):
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as data_file:
+            data_file.write(self.test_data)
+
+        self.parser.use_mmap = True
+        try:
+            rows = self.parser.parse_file(path)
+        finally:
+            os.unlink(path)
+
+        self.assertEqual(rows, [
             {'name': 'Foonyor', 'valid': True, 'count': 0},
-        ]
+            {'name': 'Barzane', 'valid': False, 'count': -12},
+            {'name': 'Quuxitude', 'valid': True, 'count': 103}
+        ])
+
+    def test_run_ranges(self):
+        handle, path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as data_file:
+            data_file.write(self.test_data * 20)
+
+        self.parser.data_file = path
+        self.parser.schema_file = self.schema_file
+        self.parser.parse_workers = 2
+        # force lots of small ranges
+        self.parser.RANGE_BYTES = 100
+        inserted = []
+        self.parser.backend.insert_values = mock.MagicMock(
+            side_effect=lambda values, table: inserted.extend(values) or len(values))
+
+        try:
+            self.assertEqual(self.parser.run(), True)
+
+            # rows come back in file order
+            self.assertEqual(len(inserted), 60)
+            self.assertEqual([row[0] for row in inserted[:4]],
+                             ['Foonyor', 'Barzane', 'Quuxitude', 'Foonyor'])
+
+            # errors are reported with their line number in the whole file
+            with open(path, 'a') as data_file:
+                data_file.write('Foonyor   1  0\nshort\n')
+            with mock.patch('file_loader.parser.logger') as mock_logger:
+                self.assertEqual(self.parser.run(), False)
+                self.assertEqual(mock_logger.error.call_args[0][1], 62)
+        finally:
+            os.unlink(path)
+
+
+class CheckpointTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.schema_file = os.path.join(self.tmp_dir, 'testformat.csv')
+        with open(self.schema_file, 'w') as schema:
+            schema.write('"column name",width,datatype\nname,10,TEXT\nvalid,1,BOOLEAN\ncount,3,INTEGER\n')
+
+        self.data_file = os.path.join(self.tmp_dir, 'testformat_2018-01-01.txt')
+        with open(self.data_file, 'w') as data_file:
+            data_file.write('Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103\n' * 3)
+
+        self.db_file = os.path.join(self.tmp_dir, 'test.db')
+
+    def tearDown(self):
+        registry.dispose()
+        shutil.rmtree(self.tmp_dir)
+
+    def parser(self, parser_cls=FixedWidthParser):
+        return Parser(self.data_file, self.schema_file, parser_cls, SqlLiteBackend,
+                      'sqlite:///%s' % self.db_file, batch_size=2, checkpoint=True)
+
+    def count_rows(self):
+        connection = sqlite3.connect(self.db_file)
+        count = connection.execute('SELECT count(*) FROM testformat').fetchone()[0]
+        connection.close()
+        return count
+
+    def test_resume(self):
+        # the load dies while inserting the third batch
+        parser = self.parser()
+        insert_checkpointed = parser.insert_checkpointed
+        calls = []
+
+        def failing_insert(values, checkpoint):
+            calls.append(checkpoint)
+            if len(calls) == 3:
+                raise RuntimeError('connection lost')
+            return insert_checkpointed(values, checkpoint)
+
+        parser.insert_checkpointed = failing_insert
+        self.assertRaises(RuntimeError, parser.run)
+        self.assertEqual(self.count_rows(), 4)
+        self.assertEqual(parser.backend.get_checkpoint('testformat_2018-01-01.txt')['byte_offset'], 60)
+
+        # the rerun starts after the last committed batch so no rows are duplicated
+        parser = self.parser()
+        self.assertEqual(parser.run(), True)
+        self.assertEqual(parser.rows_inserted, 5)
+        self.assertEqual(self.count_rows(), 9)
+        self.assertEqual(parser.backend.get_checkpoint('testformat_2018-01-01.txt')['status'], 'complete')
+
+        # a completed file is not loaded again
+        parser = self.parser()
+        self.assertEqual(parser.run(), True)
+        self.assertEqual(self.count_rows(), 9)
+
+    @skipIf(numpy_parser.numpy is None, 'numpy is not installed')
+    def test_chunked_parser(self):
+        # chunked parsers take the line by line path so the load is still checkpointed
+        self.assertEqual(self.parser(NumpyFixedWidthParser).run(), True)
+        self.assertEqual(self.parser(NumpyFixedWidthParser).run(), True)
+        self.assertEqual(self.count_rows(), 9)
+
+    def test_different_file(self):
+        self.assertEqual(self.parser().run(), True)
+        self.assertEqual(self.count_rows(), 9)
+
+        # re-sent under the same name with the same size: refused rather than skipped
+        with open(self.data_file, 'w') as data_file:
+            data_file.write('Quuxitude 1103\nFoonyor   1  0\nBarzane   0-12\n' * 3)
+        stat = os.stat(self.data_file)
+        os.utime(self.data_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(self.parser().run(), False)
+        self.assertEqual(self.count_rows(), 9)
+
+        # a different size doesn't start over on top of the rows already loaded
+        with open(self.data_file, 'a') as data_file:
+            data_file.write('Foonyor   1  0\n')
+        self.assertEqual(self.parser().run(), False)
+        self.assertEqual(self.count_rows(), 9)
+
+    def test_legacy_state(self):
+        # load state saved before the signature column was added
+        connection = sqlite3.connect(self.db_file)
+        connection.execute('CREATE TABLE _load_state (file_name TEXT PRIMARY KEY, file_size INTEGER, '
+                           'byte_offset INTEGER, rows INTEGER, status TEXT)')
+        connection.execute('INSERT INTO _load_state VALUES (?, ?, ?, ?, ?)',
+                           ('testformat_2018-01-01.txt', os.path.getsize(self.data_file), 0, 9, 'complete'))
+        connection.commit()
+        connection.close()
+
+        parser = self.parser()
+        self.assertEqual(parser.run(), True)
+        self.assertEqual(parser.rows_inserted, 0)
+        self.assertEqual(parser.backend.get_checkpoint('testformat_2018-01-01.txt')['signature'], None)
+
+
+class RejectTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.schema_file = os.path.join(self.tmp_dir, 'testformat.csv')
+        with open(self.schema_file, 'w') as schema:
+            schema.write('"column name",width,datatype\nname,10,TEXT\nvalid,1,BOOLEAN\ncount,3,INTEGER\n')
+
+        # line 4 is too short and line 6 has a count that isn't a number
+        self.data_file = os.path.join(self.tmp_dir, 'testformat_2018-01-01.txt')
+        with open(self.data_file, 'w') as data_file:
+            data_file.write('Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103\n'
+                            'short\nFoonyor   1  0\nBarzane   0abc\n')
+
+        self.reject_dir = os.path.join(self.tmp_dir, 'rejected')
+        self.reject_file = os.path.join(self.reject_dir, 'testformat_2018-01-01.txt.rejects.csv')
+
+    def tearDown(self):
+        registry.dispose()
+        shutil.rmtree(self.tmp_dir)
+
+    def parser(self, db_name='test.db', **options):
+        return Parser(self.data_file, self.schema_file, FixedWidthParser, SqlLiteBackend,
+                      'sqlite:///%s' % os.path.join(self.tmp_dir, db_name), reject_dir=self.reject_dir,
+                      **options)
+
+    def read_rejects(self):
+        with open(self.reject_file) as reject_file:
+            return list(csv.reader(reject_file))
+
+    def test_rejects(self):
+        all_options = ({}, {'batch_size': 2}, {'use_mmap': True, 'checkpoint': True},
+                       {'pipeline': True, 'batch_size': 2}, {'parse_workers': 2})
+        for ix, options in enumerate(all_options):
+            # a database per load strategy, every one should insert the same rows
+            parser = self.parser('test%s.db' % ix, max_errors=2, **options)
+            self.assertEqual(parser.run(), True, options)
+            self.assertEqual(parser.rows_inserted, 4, options)
+
+            rejects = self.read_rejects()
+            self.assertEqual(rejects[0], ['line', 'reason', 'record'])
+            self.assertEqual([row[0] for row in rejects[1:]], ['4', '6'], options)
+            self.assertEqual(rejects[1][2], 'short')
+            self.assertIn('column `count`', rejects[2][1])
+
+    def test_threshold(self):
+        from file_loader.exceptions import ErrorThresholdExceeded
+
+        self.assertRaises(ErrorThresholdExceeded, self.parser(max_errors=1).run)
+        # the rate is checked against the whole file once it has been read
+        self.assertRaises(ErrorThresholdExceeded, self.parser(max_error_rate=0.25).run)
+        self.assertEqual(self.parser(max_error_rate=0.5).run(), True)
+
+    def test_threshold_discards_rows(self):
+        from file_loader.exceptions import ErrorThresholdExceeded
+
+        all_options = ({}, {'bulk_load': True}, {'batch_size': 2}, {'batch_size': 2, 'bulk_load': True},
+                       {'use_mmap': True, 'checkpoint': True, 'batch_size': 2},
+                       {'pipeline': True, 'batch_size': 2}, {'parse_workers': 2})
+        for ix, options in enumerate(all_options):
+            db_name = 'threshold%s.db' % ix
+            parser = self.parser(db_name, max_error_rate=0.25, **options)
+            self.assertRaises(ErrorThresholdExceeded, parser.run)
+            # a failed file leaves no rows behind, fixing and re-sending it doesn't duplicate them
+            self.assertEqual(parser.rows_inserted, 0, options)
+            connection = sqlite3.connect(os.path.join(self.tmp_dir, db_name))
+            self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 0, options)
+            connection.close()
+
+    def test_strict(self):
+        # without a threshold the first bad line still fails the load
+        from file_loader.exceptions import MalformedLineError
 
-        self.parser.parse_file = mock.MagicMock(return_value=rows)
-        self.parser.backend.insert_rows = mock.MagicMock(return_value=True)
+        for options in ({}, {'use_mmap': True, 'batch_size': 2}, {'parse_workers': 2}):
+            with self.assertLogs('Parser App', level='ERROR') as logs:
+                try:
+                    self.assertEqual(self.parser(**options).run(), False)
+                except MalformedLineError:
+                    pass
+            # the error says which line stopped the load and what it held
+            self.assertIn('Malformed Line 4 of `%s`: line is 5 characters, the spec is 14 <short>' % self.data_file,
+                          '\n'.join(logs.output), options)
+        self.assertFalse(os.path.exists(self.reject_file))
 
-        self.parser.run()
+    def test_strict_discards_rows(self):
+        from file_loader.exceptions import MalformedLineError
 
-        self.parser.parse_file.assert_called_once_with(self.parser.data_file)
-        self.parser.backend.insert_rows.assert_called_once_with(rows, self.parser.backend.table)
+        all_options = ({'batch_size': 1}, {'batch_size': 1, 'bulk_load': True},
+                       {'pipeline': True, 'batch_size': 1}, {'parse_workers': 2, 'batch_size': 1})
+        for ix, options in enumerate(all_options):
+            db_name = 'strict%s.db' % ix
+            parser = self.parser(db_name, **options)
+            try:
+                self.assertEqual(parser.run(), False, options)
+            except MalformedLineError:
+                pass
+            # the batches committed before the bad line are taken back with the failed file
+            self.assertEqual(parser.rows_inserted, 0, options)
+            connection = sqlite3.connect(os.path.join(self.tmp_dir, db_name))
+            self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 0, options)
+            connection.close()
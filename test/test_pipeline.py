@@ -0,0 +1,128 @@
+import asyncio
+import mock
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import TestCase
+
+from file_loader.exceptions import MalformedLineError
+from file_loader.parser import Parser
+from file_loader.parsers.fixed_width_parser import FixedWidthParser
+from file_loader.backends.connections import registry
+from file_loader.backends.sqlite import SqlLiteBackend
+from file_loader.pipeline import AsyncPipeline
+
+
+class AsyncPipelineTest(TestCase):
+    def setUp(self):
+        test_data = '''Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103\n'''
+        test_schema = '''"column name",width,datatype\n
+name,10,TEXT\n
+valid,1,BOOLEAN\n
+count,3,INTEGER'''
+
+        handle, self.data_file = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as data_file:
+            data_file.write(test_data * 10)
+
+        with mock.patch('file_loader.parsers.fixed_width_parser.open') as schema_open:
+            schema_open.return_value = StringIO(test_schema)
+            with mock.patch('file_loader.backends.sqlite.SqlLiteBackend.init_backend'):
+                self.parser = Parser(self.data_file, 'testdata.csv', FixedWidthParser, SqlLiteBackend,
+                                     'fakeconnection', batch_size=4, pipeline=True, queue_size=1)
+        self.inserted = []
+        self.parser.backend.insert_values = mock.MagicMock(
+            side_effect=lambda values, table: self.inserted.extend(values) or len(values))
+
+    def tearDown(self):
+        os.unlink(self.data_file)
+
+    def test_run(self):
+        self.assertEqual(self.parser.run(), True)
+
+        # every row arrives, in file order
+        self.assertEqual(len(self.inserted), 30)
+        self.assertEqual(self.parser.rows_inserted, 30)
+        self.assertEqual([row[0] for row in self.inserted[:4]],
+                         ['Foonyor', 'Barzane', 'Quuxitude', 'Foonyor'])
+
+        # 30 rows in batches of 4 pass through every stage
+        metrics = self.parser.pipeline_metrics
+        self.assertEqual(metrics['stages']['insert']['batches'], 8)
+        self.assertEqual(metrics['stages']['parse']['batches'], 8)
+        # queues never hold more than queue_size batches
+        self.assertLessEqual(metrics['queues']['raw']['max_depth'], 1)
+        self.assertLessEqual(metrics['queues']['parsed']['max_depth'], 1)
+
+    def test_run_mmap(self):
+        self.parser.use_mmap = True
+        self.assertEqual(self.parser.run(), True)
+        self.assertEqual(self.inserted[2], ('Quuxitude', True, 103))
+
+    def test_short_insert(self):
+        self.parser.backend.insert_values = mock.MagicMock(return_value=1)
+        self.assertEqual(self.parser.run(), False)
+        # the load stops at the first short batch, and what it inserted is taken back
+        self.assertEqual(self.parser.backend.insert_values.call_count, 1)
+        self.assertEqual(self.parser.rows_inserted, 0)
+
+    def test_parse_error(self):
+        with open(self.data_file, 'a') as data_file:
+            data_file.write('short\n')
+
+        with self.assertRaises(MalformedLineError):
+            self.parser.run()
+
+    def test_backpressure(self):
+        # a slow insert stage fills the queues in front of it
+        pipeline = AsyncPipeline(self.parser, batch_size=1, queue_size=2)
+        self.parser.backend.insert_values = mock.MagicMock(
+            side_effect=lambda values, table: time.sleep(0.01) or len(values))
+        self.assertEqual(asyncio.run(pipeline.run()), True)
+
+        metrics = pipeline.metrics()
+        self.assertEqual(metrics['queues']['parsed']['max_depth'], 2)
+        self.assertGreater(metrics['queues']['parsed']['full'], 0)
+
+
+class PipelineBulkLoadTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.schema_file = os.path.join(self.tmp_dir, 'testformat.csv')
+        with open(self.schema_file, 'w') as schema_file:
+            schema_file.write('"column name",width,datatype\nname,10,TEXT\nvalid,1,BOOLEAN\ncount,3,INTEGER\n')
+        self.data_files = []
+        for day in (1, 2):
+            data_file = os.path.join(self.tmp_dir, 'testformat_2018-01-0%s.txt' % day)
+            with open(data_file, 'w') as data:
+                data.write('Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103\n' * 10)
+            self.data_files.append(data_file)
+        self.connection_string = 'sqlite:///%s' % os.path.join(self.tmp_dir, 'test.db')
+
+    def tearDown(self):
+        registry.dispose()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_insert_thread(self):
+        synchronous = []
+        connections = []
+        for data_file in self.data_files:
+            parser = Parser(data_file, self.schema_file, FixedWidthParser, SqlLiteBackend, self.connection_string,
+                            batch_size=4, pipeline=True, bulk_load=True, load_pragmas={'synchronous': 'OFF'})
+            insert_values = parser.backend.insert_values
+
+            def recording_insert(*args, **kwargs):
+                conn = registry.get_connection(self.connection_string)
+                synchronous.append(conn.execute('PRAGMA synchronous').scalar())
+                return insert_values(*args, **kwargs)
+
+            parser.backend.insert_values = recording_insert
+            self.assertEqual(parser.run(), True)
+            connections.append(len(registry.connections))
+
+        # the bulk load settings reach the connection the inserts are made on
+        self.assertEqual(set(synchronous), {0})
+        # and the second file inserts through the same connection instead of opening another
+        self.assertEqual(connections[0], connections[1])
@@ -0,0 +1,48 @@
+import mock
+import subprocess
+import sys
+from unittest import TestCase
+
+from file_loader.plugins import PluginRegistry
+
+
+class PluginRegistryTest(TestCase):
+    def setUp(self):
+        self.registry = PluginRegistry('file_loader.test_plugins', {
+            'fixed_width': 'file_loader.parsers.fixed_width_parser:FixedWidthParser',
+        })
+
+    def test_get(self):
+        from file_loader.parsers.fixed_width_parser import FixedWidthParser
+
+        self.assertIs(self.registry.get('fixed_width'), FixedWidthParser)
+        self.assertIs(self.registry['fixed_width'], FixedWidthParser)
+        self.assertIsNone(self.registry.get('csv'))
+        self.assertRaises(KeyError, self.registry.__getitem__, 'csv')
+
+    def test_register(self):
+        self.registry.register('ordered', 'collections:OrderedDict')
+        self.registry.register('counter', mock.MagicMock)
+        from collections import OrderedDict
+
+        self.assertIs(self.registry.get('ordered'), OrderedDict)
+        self.assertIs(self.registry.get('counter'), mock.MagicMock)
+        self.assertEqual(self.registry.keys(), ['fixed_width', 'ordered', 'counter'])
+
+    def test_entry_points(self):
+        entry_point = mock.MagicMock(value='collections:Counter')
+        entry_point.name = 'counter'
+        with mock.patch('file_loader.plugins.entry_points', return_value=[entry_point]) as mock_entry_points:
+            self.assertIn('counter', self.registry)
+            self.assertEqual(self.registry.get('counter').__name__, 'Counter')
+            # installed packages are only looked up once
+            self.registry.keys()
+            self.assertEqual(mock_entry_points.call_count, 1)
+
+    def test_lazy_import(self):
+        # a fresh interpreter so modules imported by other tests don't count
+        code = ('import sys; from file_loader.file_handler import FileHandler; '
+                'FileHandler.FILE_TYPES.get("fixed_width"); '
+                'print(" ".join(m for m in ("sqlalchemy", "numpy") if m in sys.modules))')
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True)
+        self.assertEqual(output.stdout.strip(), b'')
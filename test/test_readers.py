@@ -0,0 +1,169 @@
+import bz2
+import gzip
+import hashlib
+import lzma
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from file_loader.readers import MmapRecordReader, StreamRecordReader, DecompressingReader, detect_compression, \
+    hash_file, open_compressed, open_hashed, split_ranges
+
+
+class MmapRecordReaderTest(TestCase):
+    def setUp(self):
+        self.data = b'Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103'
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as data_file:
+            data_file.write(self.data)
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_iter(self):
+        reader = MmapRecordReader(self.path)
+        records = list(reader)
+
+        # newlines stay on the records, the last record has no trailing newline
+        self.assertEqual(records, [b'Foonyor   1  0\n', b'Barzane   0-12\n', b'Quuxitude 1103'])
+        self.assertEqual(reader.offset, len(self.data))
+
+    def test_hasher(self):
+        hasher = hashlib.sha256()
+        list(MmapRecordReader(self.path, hasher=hasher))
+        self.assertEqual(hasher.hexdigest(), hashlib.sha256(self.data).hexdigest())
+
+    def test_byte_range(self):
+        # reading starts and stops at the requested byte offsets
+        reader = MmapRecordReader(self.path, start=15, end=30)
+        self.assertEqual(list(reader), [b'Barzane   0-12\n'])
+        self.assertEqual(reader.offset, 30)
+
+    def test_empty_file(self):
+        with open(self.path, 'wb'):
+            pass
+        self.assertEqual(list(MmapRecordReader(self.path)), [])
+
+
+class SplitRangesTest(TestCase):
+    def setUp(self):
+        self.records = [b'%09d\n' % ix for ix in range(100)]
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as data_file:
+            data_file.write(b''.join(self.records))
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_split_ranges(self):
+        ranges = split_ranges(self.path, 7)
+
+        # ranges are contiguous and cover the whole file
+        self.assertEqual(ranges[0][0], 0)
+        self.assertEqual(ranges[-1][1], os.path.getsize(self.path))
+        for (_, end), (start, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(end, start)
+
+        # every range starts on a record boundary so the records come back intact
+        records = []
+        for start, end in ranges:
+            self.assertEqual(start % 10, 0)
+            records.extend(MmapRecordReader(self.path, start, end))
+        self.assertEqual(records, self.records)
+
+    def test_more_parts_than_records(self):
+        with open(self.path, 'wb') as data_file:
+            data_file.write(b'a\nb\n')
+        self.assertEqual(split_ranges(self.path, 10), [(0, 2), (2, 4)])
+
+
+class HashingReaderTest(TestCase):
+    def setUp(self):
+        self.data = b'Foonyor   1  0\r\nBarzane   0-12\r\n' * 1000
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'wb') as data_file:
+            data_file.write(self.data)
+        self.expected = hashlib.sha256(self.data).hexdigest()
+
+    def tearDown(self):
+        os.unlink(self.path)
+
+    def test_text(self):
+        # the hash is of the bytes on disk, not of the decoded and newline translated text
+        hasher = hashlib.sha256()
+        with open_hashed(self.path, hasher) as data:
+            lines = list(data)
+        self.assertEqual(lines[0], 'Foonyor   1  0\n')
+        self.assertEqual(hasher.hexdigest(), self.expected)
+
+    def test_seek_back(self):
+        # re-reading bytes after seeking back doesn't hash them twice
+        hasher = hashlib.sha256()
+        with open_hashed(self.path, hasher, binary=True) as data:
+            data.readline()
+            data.seek(0)
+            data.read()
+        self.assertEqual(hasher.hexdigest(), self.expected)
+
+    def test_hash_file(self):
+        self.assertEqual(hash_file(self.path, 'sha256'), self.expected)
+
+
+class DecompressionTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data = b'Foonyor   1  0\nBarzane   0-12\nQuuxitude 1103\n' * 1000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name: str, module: object) -> str:
+        path = os.path.join(self.tmp_dir, name)
+        with module.open(path, 'wb') as data_file:
+            data_file.write(self.data)
+        return path
+
+    def test_open_compressed(self):
+        for name, module in (('a.txt.gz', gzip), ('a.txt.bz2', bz2), ('a.txt.xz', lzma)):
+            path = self.write(name, module)
+            hasher = hashlib.sha256()
+            # small chunks so the thread has to wait on the queue
+            reader = DecompressingReader(path, detect_compression(path), hasher, chunk_bytes=100, queue_chunks=2)
+            with io.BufferedReader(reader) as data:
+                self.assertEqual(data.read(), self.data)
+            # the hash is of the compressed file, the same as hash_file gives
+            self.assertEqual(hasher.hexdigest(), hash_file(path, 'sha256'))
+
+    def test_detect_compression(self):
+        path = self.write('a_2018-01-01.txt', gzip)
+        self.assertEqual(detect_compression(path), 'gzip')
+        self.assertEqual(detect_compression(os.path.join(self.tmp_dir, 'b.XZ')), 'xz')
+        self.assertIsNone(detect_compression(os.path.join(self.tmp_dir, 'missing.txt')))
+
+        # bz2 is told apart from text records that happen to start with `BZh`
+        self.assertEqual(detect_compression(self.write('c_2018-01-01.txt', bz2)), 'bz2')
+        with bz2.open(os.path.join(self.tmp_dir, 'd_2018-01-01.txt'), 'wb'):
+            pass
+        self.assertEqual(detect_compression(os.path.join(self.tmp_dir, 'd_2018-01-01.txt')), 'bz2')
+        path = os.path.join(self.tmp_dir, 'e_2018-01-01.txt')
+        with open(path, 'w') as data_file:
+            data_file.write('BZhang    1  0\nBZh9      1  0\n')
+        self.assertIsNone(detect_compression(path))
+
+    def test_close_early(self):
+        path = self.write('a.gz', gzip)
+        reader = DecompressingReader(path, 'gzip', chunk_bytes=10, queue_chunks=1)
+        reader.read(10)
+        # the thread is blocked on a full queue and has to notice the close
+        reader.close()
+        self.assertFalse(reader.thread.is_alive())
+
+    def test_stream_record_reader(self):
+        path = self.write('a.gz', gzip)
+        reader = StreamRecordReader(open_compressed(path, 'gzip', binary=True), start=30)
+        records = list(reader)
+        self.assertEqual(records[0], b'Quuxitude 1103\n')
+        self.assertEqual(len(records), 2998)
+        self.assertEqual(reader.offset, len(self.data))
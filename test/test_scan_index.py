@@ -0,0 +1,79 @@
+import mock
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from file_loader.scan_index import ScanIndex
+
+
+class ScanIndexTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, 'data')
+        os.makedirs(os.path.join(self.data_dir, 'loaded'))
+        self.index_file = os.path.join(self.tmp_dir, 'scan_index.json')
+        for name in ('testformat_2018-01-01.txt', 'testformat_2018-01-02.txt.gz', 'other_2018-01-01.txt',
+                     'nodate.txt'):
+            self.write(name, 'Foo\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, name: str, data: str):
+        with open(os.path.join(self.data_dir, name), 'w') as data_file:
+            data_file.write(data)
+
+    def age_dir(self):
+        """push the dir's mtime back past the slack so the unchanged shortcut applies"""
+        past = time.time() - 60
+        os.utime(self.data_dir, (past, past))
+
+    def test_scan(self):
+        self.age_dir()
+        index = ScanIndex(self.data_dir, self.index_file)
+        # subdirs are left out
+        self.assertEqual(index.scan(), ['nodate.txt', 'other_2018-01-01.txt', 'testformat_2018-01-01.txt',
+                                        'testformat_2018-01-02.txt.gz'])
+        self.assertEqual(index.groups(), {
+            ('other', '2018-01-01'): ['other_2018-01-01.txt'],
+            ('testformat', '2018-01-01'): ['testformat_2018-01-01.txt'],
+            ('testformat', '2018-01-02'): ['testformat_2018-01-02.txt.gz'],
+        })
+
+        # an unchanged dir isn't read again, by this index or one loaded from the file
+        with mock.patch('file_loader.scan_index.os.scandir') as mock_scandir:
+            self.assertEqual(len(index.scan()), 4)
+            self.assertEqual(len(ScanIndex(self.data_dir, self.index_file).scan()), 4)
+        self.assertEqual(mock_scandir.call_count, 0)
+
+    def test_incremental_scan(self):
+        parse_file_name = mock.Mock(side_effect=lambda name: (name.split('_')[0], name.split('_')[-1][:10]))
+        ScanIndex(self.data_dir, self.index_file, parse_file_name).scan()
+        self.assertEqual(parse_file_name.call_count, 4)
+
+        os.rename(os.path.join(self.data_dir, 'other_2018-01-01.txt'),
+                  os.path.join(self.data_dir, 'loaded', 'other_2018-01-01.txt'))
+        self.write('testformat_2018-01-01.txt', 'Foo\nBar\n')
+        self.write('testformat_2018-01-03.txt', 'Foo\n')
+
+        parse_file_name.reset_mock()
+        index = ScanIndex(self.data_dir, self.index_file, parse_file_name)
+        self.assertEqual(index.scan(), ['nodate.txt', 'testformat_2018-01-01.txt', 'testformat_2018-01-02.txt.gz',
+                                        'testformat_2018-01-03.txt'])
+        # only the new and the rewritten file are parsed again
+        self.assertEqual(sorted(call[0][0] for call in parse_file_name.call_args_list),
+                         ['testformat_2018-01-01.txt', 'testformat_2018-01-03.txt'])
+        self.assertEqual(index.entries['testformat_2018-01-01.txt'][0], 8)
+
+    def test_foreign_index(self):
+        ScanIndex(self.data_dir, self.index_file).scan()
+        # an index of another dir is ignored rather than trusted
+        other_dir = os.path.join(self.tmp_dir, 'other')
+        os.makedirs(other_dir)
+        self.assertEqual(ScanIndex(other_dir, self.index_file).scan(), [])
+
+        with open(self.index_file, 'w') as index_file:
+            index_file.write('{not json')
+        self.assertEqual(len(ScanIndex(self.data_dir, self.index_file).scan()), 4)
@@ -0,0 +1,70 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+
+from file_loader.scheduler import Job, LoadScheduler, SequentialExecutor
+
+
+class LoadSchedulerTest(TestCase):
+    def setUp(self):
+        self.jobs = [
+            Job('a_2018-01-02.txt', 10, 'a', '2018-01-02', ('a2',)),
+            Job('a_2018-01-01.txt', 30, 'a', '2018-01-01', ('a1',)),
+            Job('b_2018-01-02.txt', 50, 'b', '2018-01-02', ('b2',)),
+            Job('bad.txt', 20, None, None, ('bad',)),
+        ]
+
+    def test_order(self):
+        self.assertEqual([job.name for job in LoadScheduler(workers=2).order(self.jobs)],
+                         ['b_2018-01-02.txt', 'a_2018-01-01.txt', 'bad.txt', 'a_2018-01-02.txt'])
+        self.assertEqual([job.name for job in LoadScheduler(workers=2, drop_date_first=True).order(self.jobs)],
+                         ['bad.txt', 'a_2018-01-01.txt', 'b_2018-01-02.txt', 'a_2018-01-02.txt'])
+        # a single worker keeps the listing order, within a drop date when those go first
+        self.assertEqual(LoadScheduler().order(self.jobs), self.jobs)
+        self.assertEqual([job.name for job in LoadScheduler(drop_date_first=True).order(self.jobs)],
+                         ['bad.txt', 'a_2018-01-01.txt', 'a_2018-01-02.txt', 'b_2018-01-02.txt'])
+        self.assertRaises(ValueError, LoadScheduler, max_per_table=0)
+
+    def test_sequential(self):
+        finished = []
+        scheduler = LoadScheduler()
+        results = scheduler.run(SequentialExecutor(), str.upper, self.jobs,
+                                lambda job, result: finished.append(job.name))
+        self.assertEqual(results, ['A2', 'A1', 'B2', 'BAD'])
+        self.assertEqual(finished, ['a_2018-01-02.txt', 'a_2018-01-01.txt', 'b_2018-01-02.txt', 'bad.txt'])
+
+        # everything ran on the calling thread
+        self.assertEqual(len(scheduler.utilization), 1)
+        self.assertEqual(list(scheduler.utilization.values())[0][0], 4)
+
+        # a failing job fails the run like it would without the scheduler
+        self.assertRaises(ValueError, scheduler.run, SequentialExecutor(), int, self.jobs)
+
+    def test_max_per_table(self):
+        lock = threading.Lock()
+        loading = {'a': 0, 'b': 0, None: 0}
+        most = dict(loading)
+        tables = {job.args[0]: job.table for job in self.jobs}
+        tables.update({'a3': 'a'})
+
+        def load(name):
+            with lock:
+                loading[tables[name]] += 1
+                most[tables[name]] = max(most[tables[name]], loading[tables[name]])
+            time.sleep(0.02)
+            with lock:
+                loading[tables[name]] -= 1
+            return name
+
+        jobs = self.jobs + [Job('a_2018-01-03.txt', 40, 'a', '2018-01-03', ('a3',))]
+        scheduler = LoadScheduler(workers=4, max_per_table=1)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = scheduler.run(executor, load, jobs)
+        self.assertEqual(sorted(results), ['a1', 'a2', 'a3', 'b2', 'bad'])
+        self.assertEqual(most['a'], 1)
+
+        # busy time is reported per worker thread
+        self.assertEqual(sum(files for files, _ in scheduler.utilization.values()), 5)
+        for _, busy in scheduler.utilization.values():
+            self.assertLessEqual(busy, scheduler.seconds)
@@ -0,0 +1,119 @@
+import mock
+import os
+import shutil
+import sqlite3
+import tempfile
+from unittest import TestCase
+
+from file_loader.exceptions import TooManyShards
+from file_loader.shards import ShardLayout, compact, lock_stripe, open_catalog
+
+
+class ShardsTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.catalog_file = os.path.join(self.tmp_dir, 'catalog.db')
+        self.layout = ShardLayout('sqlite:///%s' % self.catalog_file, os.path.join(self.tmp_dir, 'shards'),
+                                  shard_by=['file_type', 'drop_date'])
+        os.makedirs(self.layout.shard_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def make_shard(self, file_type: str, drop_date: str, names: list):
+        """a shard as the sqlite backend leaves it"""
+        path = self.layout.connection_string(file_type, drop_date).split(':///', 1)[1]
+        connection = sqlite3.connect(path)
+        connection.execute('CREATE TABLE testformat (id INTEGER PRIMARY KEY, name TEXT)')
+        connection.execute('CREATE INDEX ix_testformat_name ON testformat (name)')
+        connection.executemany('INSERT INTO testformat (name) VALUES (?)', [(name,) for name in names])
+        connection.execute('CREATE TABLE _load_state (file_name TEXT PRIMARY KEY, byte_offset INTEGER)')
+        connection.execute('INSERT INTO _load_state VALUES (?, ?)', ('testformat_%s.txt' % drop_date, 10))
+        connection.commit()
+        connection.close()
+        return path
+
+    def test_connection_string(self):
+        self.assertEqual(self.layout.shard_name('my_type', '2018-01-01'), 'my_type__2018-01-01')
+        self.assertEqual(ShardLayout('', '', shard_by=['file_type']).shard_name('my/type', '2018-01-01'), 'my_type')
+        self.assertTrue(self.layout.connection_string('a', 'b').endswith(os.path.join('shards', 'a__b.db')))
+        self.assertRaises(ValueError, ShardLayout, '', '', shard_by=['hour'])
+
+        # the same database always maps to the same lock
+        self.assertEqual(lock_stripe('sqlite:///a.db', 8), lock_stripe('sqlite:///a.db', 8))
+        self.assertLess(lock_stripe('sqlite:///a.db', 8), 8)
+
+    def test_open_catalog(self):
+        self.make_shard('testformat', '2018-01-01', ['Foo', 'Bar'])
+        self.make_shard('testformat', '2018-01-02', ['Baz'])
+        catalog = sqlite3.connect(self.catalog_file)
+        catalog.execute('CREATE TABLE testformat (id INTEGER PRIMARY KEY, name TEXT)')
+        catalog.execute("INSERT INTO testformat (name) VALUES ('Quux')")
+        catalog.commit()
+        catalog.close()
+
+        connection = open_catalog(self.layout)
+        self.assertEqual(sorted(connection.execute('SELECT name FROM testformat').fetchall()),
+                         [('Bar',), ('Baz',), ('Foo',), ('Quux',)])
+        connection.close()
+
+        # the views only live as long as the connection
+        catalog = sqlite3.connect(self.catalog_file)
+        self.assertEqual(catalog.execute('SELECT count(*) FROM testformat').fetchone()[0], 1)
+        catalog.close()
+
+    def test_too_many_shards(self):
+        limit = sqlite3.connect(':memory:').getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        for day in range(limit + 1):
+            self.make_shard('testformat', str(day), ['Foo'])
+        self.assertRaises(TooManyShards, open_catalog, self.layout)
+
+        # compacting brings it back under the limit
+        self.assertEqual(compact(self.layout), limit + 1)
+        connection = open_catalog(self.layout)
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], limit + 1)
+        connection.close()
+
+    def test_compact(self):
+        self.make_shard('testformat', '2018-01-01', ['Foo', 'Bar'])
+        self.make_shard('testformat', '2018-01-02', ['Baz'])
+
+        self.assertEqual(compact(self.layout), 3)
+        self.assertEqual(self.layout.shard_paths(), [])
+
+        catalog = sqlite3.connect(self.catalog_file)
+        # ids are handed out again by the catalog
+        self.assertEqual(catalog.execute('SELECT id, name FROM testformat ORDER BY id').fetchall(),
+                         [(1, 'Foo'), (2, 'Bar'), (3, 'Baz')])
+        self.assertEqual(catalog.execute('SELECT count(*) FROM _load_state').fetchone()[0], 2)
+        self.assertEqual(catalog.execute("SELECT count(*) FROM sqlite_master WHERE name = 'ix_testformat_name'")
+                         .fetchone()[0], 1)
+        catalog.close()
+
+    def test_compact_rerun(self):
+        # a shard that was merged but not deleted before a crash is only deleted
+        path = self.make_shard('testformat', '2018-01-01', ['Foo'])
+        with mock.patch('file_loader.shards.os.unlink', side_effect=OSError):
+            self.assertRaises(OSError, compact, self.layout)
+        self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(compact(self.layout), 0)
+        self.assertFalse(os.path.exists(path))
+        catalog = sqlite3.connect(self.catalog_file)
+        self.assertEqual(catalog.execute('SELECT count(*) FROM testformat').fetchone()[0], 1)
+        catalog.close()
+
+    def test_compact_recreated_shard(self):
+        # the next load recreates a shard under the same name; it is merged like any other
+        self.make_shard('testformat', '2018-01-01', ['Foo', 'Bar', 'Baz'])
+        self.assertEqual(compact(self.layout), 3)
+        path = self.make_shard('testformat', '2018-01-01', ['Quux'] * 5)
+        self.assertEqual(compact(self.layout), 5)
+        self.assertFalse(os.path.exists(path))
+
+        catalog = sqlite3.connect(self.catalog_file)
+        self.assertEqual(catalog.execute('SELECT count(*) FROM testformat').fetchone()[0], 8)
+        # the shard ids stay out of the catalog
+        self.assertEqual(catalog.execute("SELECT count(*) FROM sqlite_master WHERE name = '_shard_id'")
+                         .fetchone()[0], 0)
+        catalog.close()
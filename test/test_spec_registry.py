@@ -0,0 +1,46 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from file_loader.parsers.fixed_width_parser import FixedWidthParser
+from file_loader.spec_registry import SpecRegistry
+
+
+class SpecRegistryTest(TestCase):
+    def setUp(self):
+        handle, self.spec_file = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as spec:
+            spec.write('"column name",width,datatype\nname,10,TEXT\ncount,3,INTEGER\n')
+        self.registry = SpecRegistry()
+
+    def tearDown(self):
+        os.unlink(self.spec_file)
+
+    def test_get_parser(self):
+        parser = self.registry.get_parser(self.spec_file, FixedWidthParser)
+        self.assertEqual(parser.field_names, ['name', 'count'])
+
+        # the spec is only parsed once
+        self.assertIs(self.registry.get_parser(self.spec_file, FixedWidthParser), parser)
+        self.assertEqual((self.registry.hits, self.registry.misses), (1, 1))
+
+    def test_table_cache(self):
+        self.assertIsNone(self.registry.get_table(self.spec_file, 'sqlite:///test.db'))
+        table = object()
+        self.registry.set_table(self.spec_file, 'sqlite:///test.db', table)
+        self.assertIs(self.registry.get_table(self.spec_file, 'sqlite:///test.db'), table)
+
+    def test_reload_on_mtime_change(self):
+        parser = self.registry.get_parser(self.spec_file, FixedWidthParser)
+        self.registry.set_table(self.spec_file, 'sqlite:///test.db', object())
+
+        with open(self.spec_file, 'a') as spec:
+            spec.write('valid,1,BOOLEAN\n')
+        stat = os.stat(self.spec_file)
+        os.utime(self.spec_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        # both the parser and the table built from the old spec are dropped
+        reloaded = self.registry.get_parser(self.spec_file, FixedWidthParser)
+        self.assertIsNot(reloaded, parser)
+        self.assertEqual(reloaded.field_names, ['name', 'count', 'valid'])
+        self.assertIsNone(self.registry.get_table(self.spec_file, 'sqlite:///test.db'))
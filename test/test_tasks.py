@@ -0,0 +1,108 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, skipIf
+
+from file_loader.file_handler import FileHandler, claim_file
+
+try:
+    from file_loader.tasks import app, load_file_task
+except ImportError:  # celery is only needed for distributed loads
+    app = None
+
+
+class ClaimFileTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp_dir, 'processing'))
+        self.data_file_path = os.path.join(self.tmp_dir, 'testformat_2018-01-01.txt')
+        open(self.data_file_path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_claim_file(self):
+        processing_dir = os.path.join(self.tmp_dir, 'processing')
+        claimed_path = claim_file(self.data_file_path, processing_dir)
+        self.assertEqual(claimed_path, os.path.join(processing_dir, 'testformat_2018-01-01.txt'))
+        self.assertTrue(os.path.exists(claimed_path))
+
+        # the second claim of the same file loses
+        self.assertIsNone(claim_file(self.data_file_path, processing_dir))
+
+
+@skipIf(app is None, 'celery is not installed')
+class LoadFileTaskTest(TestCase):
+    def setUp(self):
+        # run tasks in process against the in memory broker, no external service needed
+        app.conf.update(broker_url='memory://', result_backend='cache+memory://',
+                        task_always_eager=True, task_store_eager_result=True)
+
+        self.tmp_dir = tempfile.mkdtemp()
+        for sub_dir in ('data', 'specs', 'data/loaded', 'data/failed'):
+            os.makedirs(os.path.join(self.tmp_dir, sub_dir), exist_ok=True)
+
+        with open(os.path.join(self.tmp_dir, 'specs', 'testformat.csv'), 'w') as spec_file:
+            spec_file.write('"column name",width,datatype\nname,10,TEXT\nvalid,1,BOOLEAN\ncount,3,INTEGER\n')
+
+        self.files = {
+            'testformat_2018-01-01.txt': 'Foonyor   1  0\nBarzane   0-12\n',
+            'testformat_2018-01-02.txt': 'Foonyor   1  0\nshort\n',
+        }
+        for name, data in self.files.items():
+            with open(os.path.join(self.tmp_dir, 'data', name), 'w') as data_file:
+                data_file.write(data)
+
+        self.db_file = os.path.join(self.tmp_dir, 'test.db')
+        self.file_handler = FileHandler(
+            os.path.join(self.tmp_dir, 'data'),
+            os.path.join(self.tmp_dir, 'specs'),
+            os.path.join(self.tmp_dir, 'data/failed'),
+            os.path.join(self.tmp_dir, 'data/loaded'),
+            'sqlite',
+            'fixed_width',
+            'sqlite:///%s' % self.db_file,
+            sorted(self.files),
+            distributed=True
+        )
+
+    def tearDown(self):
+        app.conf.update(task_always_eager=False)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_run_distributed(self):
+        results = self.file_handler.run()
+
+        self.assertEqual([result.success for result in results], [True, False])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'data/loaded')), ['testformat_2018-01-01.txt'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'data/failed')), ['testformat_2018-01-02.txt'])
+        self.assertEqual(os.listdir(os.path.join(self.tmp_dir, 'data/processing')), [])
+
+        connection = sqlite3.connect(self.db_file)
+        self.assertEqual(connection.execute('SELECT count(*) FROM testformat').fetchone()[0], 2)
+        connection.close()
+
+    def test_load_file_task_claims_once(self):
+        os.makedirs(self.file_handler.processing_dir)
+        args = (os.path.join(self.tmp_dir, 'data', 'testformat_2018-01-01.txt'), self.file_handler.processing_dir,
+                os.path.join(self.tmp_dir, 'specs', 'testformat.csv'), 'fixed_width', 'sqlite',
+                'sqlite:///%s' % self.db_file, {})
+
+        result = load_file_task.delay(*args).get()
+        self.assertEqual(result['rows'], 2)
+        self.assertEqual(result['data_file_path'],
+                         os.path.join(self.file_handler.processing_dir, 'testformat_2018-01-01.txt'))
+
+        # the same drop dispatched again is not loaded a second time
+        self.assertIsNone(load_file_task.delay(*args).get())
+
+    def test_import_has_no_side_effects(self):
+        # logging is set up by the worker signals, importing the tasks doesn't create a log file
+        code = 'import file_loader.tasks; from file_loader.logger import get_log_file; print(get_log_file())'
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True, cwd=self.tmp_dir,
+                                env=dict(os.environ, PYTHONPATH=os.getcwd()))
+        self.assertEqual(output.stdout.strip(), b'None')
+        self.assertFalse(os.path.exists(os.path.join(self.tmp_dir, 'logs')))
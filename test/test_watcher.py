@@ -0,0 +1,91 @@
+import mock
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+
+from file_loader.watcher import DirectoryWatcher, Inotify, IN_Q_OVERFLOW
+
+
+class DirectoryWatcherTest(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.tmp_dir, 'data')
+        os.mkdir(self.data_dir)
+        self.handled = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def handle_file(self, name):
+        self.handled.append(name)
+        # loaded files get moved out of the data dir
+        os.rename(os.path.join(self.data_dir, name), os.path.join(self.tmp_dir, name))
+
+    def write(self, name, data):
+        with open(os.path.join(self.data_dir, name), 'a') as data_file:
+            data_file.write(data)
+
+    def test_polling(self):
+        watcher = DirectoryWatcher(self.data_dir, self.handle_file, settle_seconds=0.2,
+                                   poll_seconds=0.01, use_inotify=False)
+        self.write('testfile_2018-01-01.txt', 'Foonyor   1  0\n')
+        # sub directories are ignored
+        os.mkdir(os.path.join(self.data_dir, 'loaded'))
+
+        # the file is not handed over until it has been stable for settle_seconds
+        self.assertEqual(watcher.poll(0.01), [])
+        self.write('testfile_2018-01-01.txt', 'Barzane   0-12\n')
+        self.assertEqual(watcher.poll(0.01), [])
+
+        self.assertEqual(watcher.poll(0.25), ['testfile_2018-01-01.txt'])
+        self.assertEqual(self.handled, ['testfile_2018-01-01.txt'])
+        self.assertEqual(watcher.poll(0.25), [])
+
+    def test_file_left_in_place(self):
+        watcher = DirectoryWatcher(self.data_dir, self.handled.append, settle_seconds=0,
+                                   use_inotify=False)
+        self.write('nospec.txt', 'data\n')
+
+        # a file the handler leaves behind is only picked up again if it changes
+        self.assertEqual(watcher.poll(0), ['nospec.txt'])
+        self.assertEqual(watcher.poll(0), [])
+        self.write('nospec.txt', 'more data\n')
+        self.assertEqual(watcher.poll(0), ['nospec.txt'])
+
+    @skipUnless(Inotify.available(), 'inotify is not available')
+    def test_inotify_rename(self):
+        watcher = DirectoryWatcher(self.data_dir, self.handle_file, settle_seconds=60, use_inotify=True)
+        try:
+            # files renamed into place are loaded without waiting to settle
+            staging = os.path.join(self.tmp_dir, 'staging.txt')
+            with open(staging, 'w') as data_file:
+                data_file.write('Foonyor   1  0\n')
+            os.rename(staging, os.path.join(self.data_dir, 'testfile_2018-01-01.txt'))
+
+            self.assertEqual(watcher.poll(1), ['testfile_2018-01-01.txt'])
+        finally:
+            watcher.close()
+
+    @skipUnless(Inotify.available(), 'inotify is not available')
+    def test_inotify_write(self):
+        watcher = DirectoryWatcher(self.data_dir, self.handle_file, settle_seconds=0.1, use_inotify=True)
+        try:
+            self.write('testfile_2018-01-01.txt', 'Foonyor   1  0\n')
+            # the write is noticed right away but the file is held back until it settles
+            self.assertEqual(watcher.poll(1), [])
+            self.assertIn('testfile_2018-01-01.txt', watcher.pending)
+            self.assertEqual(watcher.poll(), ['testfile_2018-01-01.txt'])
+        finally:
+            watcher.close()
+
+    @skipUnless(Inotify.available(), 'inotify is not available')
+    def test_inotify_overflow(self):
+        watcher = DirectoryWatcher(self.data_dir, self.handle_file, settle_seconds=0, use_inotify=True)
+        try:
+            self.write('testfile_2018-01-01.txt', 'Foonyor   1  0\n')
+            # the events about the file were dropped, only the overflow is reported
+            with mock.patch.object(watcher.inotify, 'read_events', return_value=[(IN_Q_OVERFLOW, '')]):
+                self.assertEqual(watcher.poll(0), ['testfile_2018-01-01.txt'])
+        finally:
+            watcher.close()